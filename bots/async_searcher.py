@@ -0,0 +1,366 @@
+import asyncio
+import pandas
+from typing import Dict, List, Optional
+
+from app_logger.logger import Logger
+from db.mongo_db_interface import MongoInterface
+from db.redis_interface import RedisInterface
+from enums.enums import SearchTypes, QueueType
+from bots.searcher import Searcher, WETH_ADDRESS
+from bots.health_factor_engine import PERCENTAGE_FACTOR
+from sol.block_clock import DEFAULT_POLL_INTERVAL
+from sol.lending_pool_contract_interface import LendingPoolContractInterface
+from sol.async_lending_pool_contract_interface import AsyncLendingPoolContractInterface
+from sol.async_ui_pool_data_contract_interface import AsyncUIPoolDataContractInterface
+from sol.async_oracle_contract_interface import AsyncOracleContractInterface
+
+
+class AsyncSearcher(Searcher):
+    """
+    AsyncSearcher runs the Searcher pipeline on an asyncio event loop. Account, reserve and oracle reads are coroutines
+    sharing one async provider connection, so a single loop can scan every protocol at once.
+    """
+
+    def __init__(
+            self,
+            lending_pool_interfaces: Dict[str, LendingPoolContractInterface],
+            async_lending_pool_interfaces: Dict[str, AsyncLendingPoolContractInterface],
+            async_ui_pool_data_interfaces: Dict[str, AsyncUIPoolDataContractInterface],
+            async_oracle_interface: AsyncOracleContractInterface,
+            mongo_interface: MongoInterface,
+            redis_interface: RedisInterface
+    ):
+        """
+        Initialize the AsyncSearcher class
+
+        :param lending_pool_interfaces: A dictionary of lending pool interfaces, used for borrower discovery
+        :param async_lending_pool_interfaces: A dictionary of async lending pool interfaces
+        :param async_ui_pool_data_interfaces: A dictionary of async UI pool data interfaces
+        :param async_oracle_interface: An async oracle interface
+        :param mongo_interface: A mongo interface
+        :param redis_interface: A redis interface used to push to the DataManager and Liquidator queues
+        """
+        super().__init__(
+            lending_pool_interfaces=lending_pool_interfaces,
+            ui_pool_data_interfaces={},
+            oracle_interface=None,
+            mongo_interface=mongo_interface,
+            redis_interface=redis_interface
+        )
+        self.async_lending_pool_interfaces = async_lending_pool_interfaces
+        self.async_ui_pool_data_interfaces = async_ui_pool_data_interfaces
+        self.async_oracle_interface = async_oracle_interface
+
+        # Prices fetched for the liquidation params currently being built
+        self.asset_prices_usd: Dict[str, float] = {}
+        # Gas price fetched for the liquidation params currently being built
+        self.gas_price: Optional[int] = None
+
+        logger_section_name = f"{__class__}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    async def get_block_number(self, protocol_name: str) -> int:
+        """
+        Get the current block number from the shared async provider
+
+        :param protocol_name:
+        :return:
+        """
+        return await self.async_lending_pool_interfaces[protocol_name].provider.w3.eth.block_number
+
+    async def wait_for_new_block(self, protocol_name: str, last_block_number: Optional[int] = None) -> int:
+        """
+        Poll the shared async provider until a block after last_block_number is mined
+
+        :param protocol_name:
+        :param last_block_number: Last block scanned, None to return the current block at once
+        :return: New block number
+        """
+        while True:
+            block_number = await self.get_block_number(protocol_name)
+            if last_block_number is None or block_number > last_block_number:
+                return block_number
+
+            await asyncio.sleep(DEFAULT_POLL_INTERVAL)
+
+    async def get_user_account_data_from_protocol_async(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            block_identifier="latest"
+    ) -> pandas.DataFrame:
+        """
+        Get user account data from a lending protocol
+
+        :param protocol_name:
+        :param search_type:
+        :param block_identifier: Block to pin the account reads to
+        :return:
+        """
+        self.logger.info(f"Getting user account data from protocol: {protocol_name} from {search_type.name}")
+        # Borrower discovery and record reads are blocking, keep them off the event loop
+        account_addresses = await asyncio.to_thread(
+            self.get_accounts_to_search, protocol_name, search_type, True
+        )
+
+        self.logger.info(f"Found {len(account_addresses)} accounts to search")
+
+        account_data_list = await asyncio.gather(*[
+            self.async_lending_pool_interfaces[protocol_name].get_user_account_data(
+                account_address,
+                block_identifier=block_identifier
+            )
+            for account_address in account_addresses
+        ])
+
+        df = self.to_user_account_data_df(
+            protocol_name,
+            search_type,
+            account_addresses,
+            account_data_list,
+            block_number=block_identifier if isinstance(block_identifier, int) else None
+        )
+
+        # Push the account data to the data manager
+        self.logger.info(f"Pushing {len(df)} user account data to the data manager")
+        await asyncio.to_thread(self.redis_interface.push_item, QueueType.DATA_MANAGER_QUEUE, df)
+        self.logger.info(f"Pushed {len(df)} user account data to the data manager")
+
+        return df
+
+    async def get_user_reserve_data_from_protocol_async(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            account_addresses: List[str],
+            block_identifier="latest"
+    ) -> pandas.DataFrame:
+        """
+        Get user reserve data from a lending protocol
+
+        :param protocol_name:
+        :param search_type:
+        :param account_addresses: Accounts to fetch reserves for
+        :param block_identifier: Block to pin the reserve reads to
+        :return:
+        """
+        self.logger.info(f"Getting user reserve data from protocol: {protocol_name} from {search_type.name}")
+        reserve_data_list = await asyncio.gather(*[
+            self.async_ui_pool_data_interfaces[protocol_name].get_user_reserves_data(
+                account_address,
+                block_identifier=block_identifier
+            )
+            for account_address in account_addresses
+        ])
+
+        return self.to_user_reserve_data_df(
+            protocol_name,
+            search_type,
+            account_addresses,
+            reserve_data_list,
+            block_number=block_identifier if isinstance(block_identifier, int) else None
+        )
+
+    async def check_for_liquidations_async(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes = SearchTypes.RECENT_BORROWS,
+            hf_threshold: float = 1.00,
+            block_number: Optional[int] = None
+    ) -> pandas.DataFrame:
+        """
+        Check for liquidations
+
+        :param protocol_name: Protocol name to check for liquidations
+        :param search_type: Type of search to perform
+        :param hf_threshold: Health factor threshold to check for liquidations
+        :param block_number: Block to run the check at, defaults to the current block
+        :return: Dataframe of positions available for liquidation
+        """
+        self.logger.info(f"Checking for liquidations for protocol: {protocol_name} from {search_type.name}")
+        if block_number is None:
+            block_number = await self.get_block_number(protocol_name)
+
+        df_user_accounts = await self.get_user_account_data_from_protocol_async(
+            protocol_name,
+            search_type,
+            block_identifier=block_number
+        )
+
+        # Only fetch reserves for accounts that passed the health factor filter
+        df_user_accounts = df_user_accounts[(df_user_accounts['health_factor'] < hf_threshold)]
+        df_user_reserves = await self.get_user_reserve_data_from_protocol_async(
+            protocol_name,
+            search_type,
+            account_addresses=df_user_accounts['account_address'].to_list(),
+            block_identifier=block_number
+        )
+
+        liquidation_avail_positions = df_user_accounts.merge(
+            df_user_reserves,
+            on=['account_address', 'protocol_name', 'block_number'],
+            how='inner'
+        )
+
+        if liquidation_avail_positions.empty:
+            self.logger.info("No positions available for liquidation")
+        else:
+            self.logger.info(f"Positions available for liquidation: {liquidation_avail_positions}")
+
+        return liquidation_avail_positions
+
+    def prefill_asset_prices(self, positions: pandas.DataFrame):
+        """
+        Prices are fetched on the event loop by create_liquidation_params_async, nothing to prefill here
+
+        :param positions:
+        """
+
+    def get_asset_price_usd(self, asset_address: str) -> float:
+        """
+        Get asset price in USD from the prices fetched for the current liquidation params
+
+        :param asset_address:
+        :return: Asset price in USD
+        """
+        return self.asset_prices_usd.get(asset_address, 0)
+
+    def get_liquidation_bonuses(self, protocol_name: str) -> Dict[str, float]:
+        """
+        Get the liquidation bonus of every reserve of a protocol, as loaded on the event loop by
+        load_liquidation_bonuses_async
+
+        :param protocol_name:
+        :return: Bonus as a fraction of the covered debt (ex. 0.05), keyed by asset address
+        """
+        return self.liquidation_bonuses.get(protocol_name, {})
+
+    def get_liquidation_gas_cost_usd(self) -> float:
+        """
+        Get the gas cost of a liquidation in USD at the gas price fetched for the current liquidation params
+        :return: Gas cost, 0 if it cannot be priced
+        """
+        if self.gas_price is None:
+            return 0.0
+
+        return self.liquidation_gas * self.gas_price / 10 ** 18 * self.get_asset_price_usd(WETH_ADDRESS)
+
+    async def load_liquidation_bonuses_async(self, protocol_name: str):
+        """
+        Read the liquidation bonus of every reserve of a protocol once from the async UI pool data provider
+
+        :param protocol_name:
+        """
+        if protocol_name in self.liquidation_bonuses:
+            return
+
+        try:
+            reserves_data = await self.async_ui_pool_data_interfaces[protocol_name].get_reserves_data()
+        except Exception as e:
+            self.logger.error(f"Failed to get liquidation bonuses for {protocol_name}: {e}")
+            return
+
+        self.liquidation_bonuses[protocol_name] = {
+            reserve['underlyingAsset']: max(reserve['reserveLiquidationBonus'] / PERCENTAGE_FACTOR - 1, 0)
+            for reserve in reserves_data
+        }
+
+    async def create_liquidation_params_async(
+            self,
+            positions: pandas.DataFrame,
+            block_number: Optional[int] = None
+    ) -> pandas.DataFrame:
+        """
+        Fetch every reserve price with one getAssetsPrices call, along with the gas price and the liquidation bonuses
+        of the protocols, then create the liquidation params
+
+        :param positions: Dataframe of user positions to create the liquidation params from
+        :param block_number: Block the positions were read at, prices are read at the same block. Defaults to the
+            latest block
+        :return: Dataframe of containing liquidation params
+        """
+        asset_addresses = {
+            reserve['underlying_asset'] for reserves in positions.get('reserves', []) for reserve in reserves
+        }
+        if asset_addresses:
+            block_identifier = block_number if block_number is not None else "latest"
+            asset_prices_usd, gas_price, _ = await asyncio.gather(
+                self.async_oracle_interface.get_assets_prices_usd(
+                    list(asset_addresses | {WETH_ADDRESS}),
+                    block_identifier=block_identifier
+                ),
+                self.get_gas_price_async(),
+                asyncio.gather(*[
+                    self.load_liquidation_bonuses_async(protocol_name)
+                    for protocol_name in positions['protocol_name'].unique()
+                ])
+            )
+            # Protocols scanned on the same loop share this map, so merge rather than replace
+            self.asset_prices_usd.update(asset_prices_usd)
+            if gas_price is not None:
+                self.gas_price = gas_price
+
+        return await asyncio.to_thread(self.create_liquidation_params, positions)
+
+    async def get_gas_price_async(self) -> Optional[int]:
+        """
+        Get the current gas price from the shared async provider
+        :return: Gas price in wei, None if it cannot be read
+        """
+        try:
+            return await self.async_oracle_interface.provider.w3.eth.gas_price
+        except Exception as e:
+            self.logger.error(f"Failed to get gas price: {e}")
+            return None
+
+    async def live_search_async(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            run_indefinitely: bool = True
+    ):
+        """
+        Live search for liquidations return parameters for liquidations
+
+        :param protocol_name: Name of the protocol to search for liquidations on
+        :param search_type: Type of search to perform
+        :param run_indefinitely: Run the search indefinitely
+        """
+        last_block_number = None
+        run = True
+        while run:
+            if not run_indefinitely:
+                run = False
+
+            # One scan per new block, so the shared provider is not hammered between blocks
+            block_number = await self.wait_for_new_block(protocol_name, last_block_number)
+            if last_block_number is not None and block_number > last_block_number + 1:
+                self.logger.info(f"Skipped {block_number - last_block_number - 1} blocks while scanning")
+            last_block_number = block_number
+
+            self.logger.info(f"Searching for liquidations on {protocol_name} from {search_type.name}")
+
+            liquidation_avail_positions_df = await self.check_for_liquidations_async(
+                protocol_name,
+                search_type,
+                block_number=block_number
+            )
+            await self.create_liquidation_params_async(liquidation_avail_positions_df, block_number=block_number)
+
+    async def live_search_protocols(
+            self,
+            protocol_names: List[str],
+            search_type: SearchTypes,
+            run_indefinitely: bool = True
+    ):
+        """
+        Live search every protocol concurrently on the running event loop
+
+        :param protocol_names: Names of the protocols to search for liquidations on
+        :param search_type: Type of search to perform
+        :param run_indefinitely: Run the search indefinitely
+        """
+        await asyncio.gather(*[
+            self.live_search_async(protocol_name, search_type, run_indefinitely=run_indefinitely)
+            for protocol_name in protocol_names
+        ])
@@ -1,9 +1,29 @@
+import math
 import pandas as pd
 
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
 from app_logger.logger import Logger
 from enums.enums import QueueType
-from db.mongo_db_interface import MongoInterface
-from db.redis_interface import RedisInterface
+from db.mongo_db_interface import MongoInterface, DEFAULT_BULK_WRITE_CHUNK_SIZE
+from db.redis_interface import RedisInterface, DEFAULT_POP_TIMEOUT
+from db.position_history_store import PositionHistoryStore
+from bots.shard_coordinator import DEFAULT_NUM_SHARDS, get_account_shard
+
+ACCOUNT_POSITIONS_COLLECTION = 'user_account_positions'
+# Fields identifying an account record
+ACCOUNT_RECORD_KEY_FIELDS = ['protocol_name', 'account_address']
+# Index the Searcher's FROM_RECORDS scan walks, riskiest accounts first
+ACCOUNT_HEALTH_FACTOR_INDEX = [('protocol_name', 1), ('health_factor', 1)]
+# Field holding the shard of the account out of DEFAULT_NUM_SHARDS, so sharded searchers only read their own accounts
+ACCOUNT_RECORD_SHARD_FIELD = 'shard'
+# Index the FROM_RECORDS scan of a sharded searcher walks
+ACCOUNT_SHARD_HEALTH_FACTOR_INDEX = [('protocol_name', 1), (ACCOUNT_RECORD_SHARD_FIELD, 1), ('health_factor', 1)]
+# Fields that change on every scan. They are written along with a change but are not one on their own
+ACCOUNT_RECORD_VOLATILE_FIELDS = ['block_number']
+# Number of account records whose last persisted state is remembered
+DEFAULT_RECORD_CACHE_SIZE = 200000
 
 
 class DataManager:
@@ -12,41 +32,151 @@ class DataManager:
 
     :param db_interface: The database interface that is used to interact with the database.
     :param data_manager_queue: The queue that is used to communicate with the data manager.
+    :param bulk_write_chunk_size: Number of account records upserted per bulk write.
+    :param record_cache_size: Number of account records whose last persisted state is remembered, 0 to write every
+        record. Unchanged records are skipped and changed records only write the fields that differ, which assumes
+        this DataManager is the only writer of the records it sees. Set it to 0 when several DataManagers share the
+        queue.
+    :param position_history_store: Optional position history store. If set, a sample of every changed record is added
+        to the account's history.
     """
-    def __init__(self, db_interface: MongoInterface, redis_interface: RedisInterface):
+    def __init__(
+            self,
+            db_interface: MongoInterface,
+            redis_interface: RedisInterface,
+            bulk_write_chunk_size: int = DEFAULT_BULK_WRITE_CHUNK_SIZE,
+            record_cache_size: int = DEFAULT_RECORD_CACHE_SIZE,
+            position_history_store: PositionHistoryStore = None
+    ):
         self.db_interface: MongoInterface = db_interface
         self.redis_interface: RedisInterface = redis_interface
+        self.bulk_write_chunk_size = bulk_write_chunk_size
+        self.record_cache_size = record_cache_size
+        self.position_history_store = position_history_store
+
+        # (protocol name, account address) -> {field: hash of its last persisted value}, least recently seen first
+        self.record_cache: OrderedDict[Tuple[str, str], Dict[str, int]] = OrderedDict()
 
         logger_section_name = f"{__class__}"
         self.logger = Logger(section_name=logger_section_name)
 
+        # Upserts match on the key fields, the unique index keeps them from scanning the collection
+        self.db_interface.create_index(
+            collection=ACCOUNT_POSITIONS_COLLECTION,
+            keys=[(field, 1) for field in ACCOUNT_RECORD_KEY_FIELDS],
+            unique=True
+        )
+        self.db_interface.create_index(collection=ACCOUNT_POSITIONS_COLLECTION, keys=ACCOUNT_HEALTH_FACTOR_INDEX)
+        self.db_interface.create_index(collection=ACCOUNT_POSITIONS_COLLECTION, keys=ACCOUNT_SHARD_HEALTH_FACTOR_INDEX)
+
     def insert_or_update_account_record(self, account_records: pd.DataFrame):
         """
-        Insert or update account records in the database. Will search the DB for existing record, and update if found.
-        Otherwise, will insert a new record.
+        Insert or update account records in the database. Records are upserted on (protocol_name, account_address) in
+        unordered bulk writes of bulk_write_chunk_size records. A record never replaces one read at a later block, so
+        redelivered or reordered queue items cannot roll a position back. Records unchanged since they were last
+        persisted are skipped, and changed records only set the fields that differ.
 
         :param account_records: The account records to insert or update.
         """
-        self.logger.info("Inserting or updating account records")
+        self.logger.info(f"Inserting or updating {len(account_records)} account records")
 
+        documents = []
+        changed_records = []
+        field_hashes = []
         for account_record in account_records.to_dict('records'):
-            result = self.db_interface.update(
-                collection='user_account_positions',
-                query={
-                    'protocol_name': account_record['protocol_name'],
-                    'account_address': account_record['account_address'],
-                },
-                document={"$set": account_record},
-                upsert=True
+            key = tuple(account_record[field] for field in ACCOUNT_RECORD_KEY_FIELDS)
+            record_hashes = {field: self.__hash_value(value) for field, value in account_record.items()}
+            changed_fields = self.__get_changed_fields(key, record_hashes)
+            if not changed_fields:
+                continue
+
+            document = {
+                field: value for field, value in account_record.items()
+                if field in changed_fields or field in ACCOUNT_RECORD_KEY_FIELDS
+                or field in ACCOUNT_RECORD_VOLATILE_FIELDS
+            }
+            # Always set, so records stored before the field existed get it on their next write
+            document[ACCOUNT_RECORD_SHARD_FIELD] = get_account_shard(
+                account_record['account_address'],
+                DEFAULT_NUM_SHARDS
             )
+            documents.append(document)
+            changed_records.append(account_record)
+            field_hashes.append((key, record_hashes))
+
+        skipped_count = len(account_records) - len(documents)
+        if not documents:
+            self.logger.info(f"Skipped {skipped_count} unchanged account records")
+            return
+
+        counts = self.db_interface.bulk_update(
+            collection=ACCOUNT_POSITIONS_COLLECTION,
+            updates=[(self.__get_update_query(document), {'$set': document}) for document in documents],
+            upsert=True,
+            chunk_size=self.bulk_write_chunk_size,
+            ignore_duplicate_keys=True
+        )
+        if self.position_history_store is not None:
+            self.position_history_store.add_samples(changed_records)
+
+        # Only remembered once written, so a failed batch is written in full when it is retried
+        stale_indexes = set(counts['duplicate_keys'])
+        for index, (key, record_hashes) in enumerate(field_hashes):
+            if index in stale_indexes:
+                # The stored record is newer than this one and unknown to the cache
+                self.record_cache.pop(key, None)
+            else:
+                self.__remember_record(key, record_hashes)
 
-            if result.matched_count == 0:
-                self.logger.info(f"Inserted new account record: {account_record}")
-            elif result.modified_count == 1:
-                self.logger.info(f"Updated account record: {account_record}")
+        self.logger.info(
+            f"Inserted {counts['upserted']} and updated {counts['modified']} account records, "
+            f"skipped {skipped_count} unchanged and {len(stale_indexes)} older than the stored record"
+        )
 
         return
 
+    @staticmethod
+    def __get_update_query(document: dict) -> dict:
+        query = {field: document[field] for field in ACCOUNT_RECORD_KEY_FIELDS}
+
+        block_number = document.get('block_number')
+        if block_number is not None and not (isinstance(block_number, float) and math.isnan(block_number)):
+            # A stored record from a later block does not match, and its upsert fails on the unique index
+            query['$or'] = [{'block_number': {'$lte': int(block_number)}}, {'block_number': None}]
+
+        return query
+
+    def __get_changed_fields(self, key: Tuple[str, str], record_hashes: Dict[str, int]) -> List[str]:
+        persisted_hashes = self.record_cache.get(key)
+        if persisted_hashes is None:
+            return list(record_hashes.keys())
+
+        self.record_cache.move_to_end(key)
+        return [
+            field for field, value_hash in record_hashes.items()
+            if field not in ACCOUNT_RECORD_VOLATILE_FIELDS and persisted_hashes.get(field) != value_hash
+        ]
+
+    def __remember_record(self, key: Tuple[str, str], record_hashes: Dict[str, int]):
+        if self.record_cache_size <= 0:
+            return
+
+        self.record_cache[key] = record_hashes
+        self.record_cache.move_to_end(key)
+        while len(self.record_cache) > self.record_cache_size:
+            self.record_cache.popitem(last=False)
+
+    @staticmethod
+    def __hash_value(value) -> int:
+        # NaN hashes by identity, every NaN would look like a change
+        if isinstance(value, float) and math.isnan(value):
+            return hash(None)
+
+        try:
+            return hash(value)
+        except TypeError:
+            return hash(repr(value))
+
     def monitor_queue(self, run_indefinitely: bool = True):
         """
         Monitor the data manager queue for new data to process.
@@ -55,23 +185,40 @@ class DataManager:
         """
         run = True
         while run:
+            entry_id = None
             account_records = None
-            
+
             if not run_indefinitely:
                 run = False
 
             # Block until data is received
-            self.logger.info("Waiting for data..")
             try:
-                account_records: pd.DataFrame = self.redis_interface.pop_item(queue_type=QueueType.DATA_MANAGER_QUEUE)
+                if self.redis_interface.is_stream_queue(QueueType.DATA_MANAGER_QUEUE):
+                    item = self.redis_interface.read_item(
+                        queue_type=QueueType.DATA_MANAGER_QUEUE,
+                        timeout=DEFAULT_POP_TIMEOUT
+                    )
+                    if item is not None:
+                        entry_id, account_records = item
+                else:
+                    account_records: pd.DataFrame = self.redis_interface.pop_item(
+                        queue_type=QueueType.DATA_MANAGER_QUEUE,
+                        timeout=DEFAULT_POP_TIMEOUT
+                    )
             except Exception as e:
                 self.logger.error(f"Error getting data from queue: {e}")
 
-            if account_records is not None and not account_records.empty:
-                self.logger.info("Received data..")
-                self.insert_or_update_account_record(account_records=account_records)
-            else:
-                self.logger.info("No data received..")
-
-            #self.data_manager_queue.task_done()
+            if account_records is None:
+                continue
 
+            if not account_records.empty:
+                self.logger.info("Received data..")
+                try:
+                    self.insert_or_update_account_record(account_records=account_records)
+                except Exception as e:
+                    # Left pending in the stream, so it is retried once reclaimed
+                    self.logger.error(f"Failed to store account records: {e}")
+                    continue
+
+            if entry_id is not None:
+                self.redis_interface.ack_item(QueueType.DATA_MANAGER_QUEUE, entry_id)
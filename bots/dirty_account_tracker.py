@@ -0,0 +1,81 @@
+from typing import Dict, List, Optional
+
+from app_logger.logger import Logger
+from sol.lending_pool_contract_interface import LendingPoolContractInterface
+
+
+class DirtyAccountTracker:
+    """
+    Follows every position changing event of a lending pool (supply, withdraw, borrow, repay, liquidation and
+    collateral toggles) and marks the affected accounts dirty, so only accounts that actually changed are fetched again.
+    """
+
+    def __init__(self, lending_pool_interface: LendingPoolContractInterface, start_block: Optional[int] = None):
+        """
+        Initialize the DirtyAccountTracker class
+
+        :param lending_pool_interface: Lending pool whose events are followed
+        :param start_block: First block to read events from, defaults to the chain head at the first poll
+        """
+        self.lending_pool_interface = lending_pool_interface
+        self.protocol_name = lending_pool_interface.protocol_name
+        self.last_processed_block = start_block - 1 if start_block is not None else None
+
+        # Dirty account -> last block it changed at
+        self.dirty_accounts: Dict[str, int] = {}
+
+        logger_section_name = f"{__class__}.{self.protocol_name}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def poll(self, to_block: Optional[int] = None) -> List[str]:
+        """
+        Read the position changing events up to a block and mark the affected accounts dirty
+
+        :param to_block: Last block to read, defaults to the chain head
+        :return: Accounts that changed in the blocks read
+        """
+        if to_block is None:
+            to_block = self.lending_pool_interface.provider.w3.eth.get_block_number()
+
+        if self.last_processed_block is None:
+            self.last_processed_block = to_block - 1
+
+        from_block = self.last_processed_block + 1
+        if from_block > to_block:
+            return []
+
+        position_changes = self.lending_pool_interface.get_position_changes(from_block, to_block)
+        self.last_processed_block = to_block
+
+        changed_accounts = {}
+        for event_name, account_address in position_changes:
+            changed_accounts.setdefault(account_address, []).append(event_name)
+        self.mark_dirty(list(changed_accounts.keys()), to_block)
+
+        if changed_accounts:
+            self.logger.info(
+                f"{len(changed_accounts)} accounts changed between blocks {from_block} and {to_block}: "
+                f"{changed_accounts}"
+            )
+
+        return list(changed_accounts.keys())
+
+    def mark_dirty(self, account_addresses: List[str], block_number: Optional[int] = None):
+        """
+        Mark accounts for re-fetch
+
+        :param account_addresses:
+        :param block_number: Block the accounts changed at
+        """
+        for account_address in account_addresses:
+            self.dirty_accounts[account_address] = block_number
+
+    def pop_dirty_accounts(self) -> List[str]:
+        """
+        Get and clear the dirty accounts
+        :return: Account addresses, in the order they were first marked
+        """
+        dirty_accounts = list(self.dirty_accounts.keys())
+        self.dirty_accounts = {}
+
+        return dirty_accounts
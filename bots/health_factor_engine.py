@@ -0,0 +1,182 @@
+import numpy
+import pandas
+from typing import Dict, List, Optional
+
+from app_logger.logger import Logger
+from bots.utils.utils import explode_reserves
+
+RAY = 10 ** 27
+WAD = 10 ** 18
+PERCENTAGE_FACTOR = 10 ** 4
+
+# Accounts whose off-chain health factor is below 1 + margin are confirmed on-chain
+DEFAULT_HF_MARGIN = 0.05
+
+
+class HealthFactorEngine:
+    """
+    Computes health factors off-chain from cached user reserve balances and reserve state (oracle prices, liquidation
+    thresholds and liquidity indexes). Every tracked account is evaluated at once with vectorized NumPy math.
+    """
+
+    def __init__(self, protocol_name: str):
+        """
+        Initialize the HealthFactorEngine class
+
+        :param protocol_name: Name of the protocol the cached positions belong to
+        """
+        self.protocol_name = protocol_name
+
+        # One row per (account, reserve) with non-zero balances
+        self.positions = pandas.DataFrame(
+            columns=['account_address', 'underlying_asset', 'scaled_a_token_balance', 'usage_as_collateral_enabled',
+                     'scaled_variable_debt', 'principal_stable_debt']
+        )
+        # Reserve state indexed by underlying asset
+        self.reserves = pandas.DataFrame()
+        self.health_factors = pandas.Series(dtype=float)
+
+        logger_section_name = f"{__class__}.{protocol_name}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def get_tracked_accounts(self) -> List[str]:
+        """
+        Get the addresses of every account with cached reserves
+        :return:
+        """
+        return self.positions['account_address'].unique().tolist()
+
+    def update_positions(self, user_reserves: pandas.DataFrame):
+        """
+        Replace the cached reserves of the given accounts
+
+        :param user_reserves: Dataframe of account_address and reserves, as returned by
+            Searcher.get_user_reserve_data_from_protocol
+        """
+        if user_reserves.empty:
+            return
+
+        positions = explode_reserves(user_reserves[['account_address', 'reserves']])
+        positions = positions[
+            (positions['scaled_a_token_balance'] > 0)
+            | (positions['scaled_variable_debt'] > 0)
+            | (positions['principal_stable_debt'] > 0)
+        ]
+
+        self.drop_accounts(user_reserves['account_address'].to_list())
+        self.positions = pandas.concat(
+            [self.positions, positions[self.positions.columns]],
+            ignore_index=True
+        )
+        self.logger.info(f"Tracking {len(self.get_tracked_accounts())} accounts")
+
+    def drop_accounts(self, account_addresses: List[str]):
+        """
+        Stop tracking the given accounts
+
+        :param account_addresses:
+        """
+        self.positions = self.positions[~self.positions['account_address'].isin(account_addresses)]
+        self.health_factors = self.health_factors.drop(account_addresses, errors='ignore')
+
+    def update_reserves(self, reserves_data: List[Dict]):
+        """
+        Replace the cached reserve state
+
+        :param reserves_data: Reserve dicts as returned by UIPoolDataContractInterface.get_reserves_data
+        """
+        reserves = pandas.DataFrame.from_records(reserves_data)
+        reserves = reserves.rename(columns={
+            'underlyingAsset': 'underlying_asset',
+            'reserveLiquidationThreshold': 'liquidation_threshold',
+            'liquidityIndex': 'liquidity_index',
+            'variableBorrowIndex': 'variable_borrow_index',
+            'priceInMarketReferenceCurrency': 'price',
+        })
+        reserves = reserves[
+            ['underlying_asset', 'decimals', 'liquidation_threshold', 'liquidity_index', 'variable_borrow_index',
+             'price']
+        ].set_index('underlying_asset')
+
+        # uint128/uint256 values do not fit in int64
+        self.reserves = reserves.astype(float)
+
+    def compute_position_values(self, prices: Optional[Dict[str, float]] = None) -> pandas.DataFrame:
+        """
+        Compute the weighted collateral and debt value of every tracked position
+
+        :param prices: Optional asset price overrides, in the same unit as the cached reserve prices
+        :return: Dataframe of account_address, underlying_asset, weighted_collateral and debt, one row per position.
+            Values are in the reserve price unit
+        """
+        if self.positions.empty or self.reserves.empty:
+            return pandas.DataFrame(columns=['account_address', 'underlying_asset', 'weighted_collateral', 'debt'])
+
+        reserves = self.reserves
+        if prices:
+            reserves = reserves.copy()
+            price_overrides = pandas.Series(prices, dtype=float)
+            price_overrides = price_overrides[price_overrides.index.isin(reserves.index)]
+            reserves.loc[price_overrides.index, 'price'] = price_overrides
+
+        reserve_rows = reserves.index.get_indexer(self.positions['underlying_asset'])
+        known_reserve = reserve_rows >= 0
+        reserve_rows = numpy.where(known_reserve, reserve_rows, 0)
+
+        decimals = reserves['decimals'].to_numpy()[reserve_rows]
+        liquidation_threshold = reserves['liquidation_threshold'].to_numpy()[reserve_rows]
+        liquidity_index = reserves['liquidity_index'].to_numpy()[reserve_rows]
+        variable_borrow_index = reserves['variable_borrow_index'].to_numpy()[reserve_rows]
+        price = numpy.where(known_reserve, reserves['price'].to_numpy()[reserve_rows], 0.0)
+
+        # Cached balances are already divided by 1e18 (see ReserveDataViewSchema)
+        unit = WAD / numpy.power(10.0, decimals)
+        scaled_a_token_balance = self.positions['scaled_a_token_balance'].to_numpy(dtype=float)
+        scaled_variable_debt = self.positions['scaled_variable_debt'].to_numpy(dtype=float)
+        principal_stable_debt = self.positions['principal_stable_debt'].to_numpy(dtype=float)
+        collateral_enabled = self.positions['usage_as_collateral_enabled'].to_numpy(dtype=bool)
+
+        collateral = scaled_a_token_balance * liquidity_index / RAY * unit * price
+        weighted_collateral = numpy.where(collateral_enabled, collateral * liquidation_threshold / PERCENTAGE_FACTOR, 0)
+        debt = (scaled_variable_debt * variable_borrow_index / RAY + principal_stable_debt) * unit * price
+
+        return pandas.DataFrame({
+            'account_address': self.positions['account_address'].to_numpy(),
+            'underlying_asset': self.positions['underlying_asset'].to_numpy(),
+            'weighted_collateral': weighted_collateral,
+            'debt': debt,
+        })
+
+    def compute_health_factors(self, prices: Optional[Dict[str, float]] = None) -> pandas.Series:
+        """
+        Compute the health factor of every tracked account
+
+        :param prices: Optional asset price overrides, in the same unit as the cached reserve prices
+        :return: Series of health factors indexed by account address. Accounts without debt have an infinite HF
+        """
+        position_values = self.compute_position_values(prices)
+        if position_values.empty:
+            self.health_factors = pandas.Series(dtype=float)
+            return self.health_factors
+
+        account_codes, account_addresses = pandas.factorize(position_values['account_address'])
+        total_weighted_collateral = numpy.bincount(
+            account_codes, weights=position_values['weighted_collateral'], minlength=len(account_addresses)
+        )
+        total_debt = numpy.bincount(account_codes, weights=position_values['debt'], minlength=len(account_addresses))
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            health_factors = numpy.where(total_debt > 0, total_weighted_collateral / total_debt, numpy.inf)
+
+        self.health_factors = pandas.Series(health_factors, index=account_addresses, name='health_factor')
+        return self.health_factors
+
+    def get_candidates(self, hf_margin: float = DEFAULT_HF_MARGIN) -> List[str]:
+        """
+        Get the accounts whose last computed health factor is below or near 1.0
+
+        :param hf_margin: Accounts with HF < 1 + hf_margin are returned
+        :return: Account addresses, lowest health factor first
+        """
+        candidates = self.health_factors[self.health_factors < 1 + hf_margin].sort_values()
+        return candidates.index.to_list()
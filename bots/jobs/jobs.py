@@ -1,19 +1,36 @@
 import json
+import asyncio
+from typing import List
 from dotenv import dotenv_values, find_dotenv
 
 from app_logger.logger import Logger
 from db.mongo_db_interface import MongoInterface
+from db.position_history_store import PositionHistoryStore
+from db.borrower_index import BorrowerIndex
 from db.redis_interface import RedisInterface
-from enums.enums import LendingProtocol, SearchTypes, LendingPoolAddresses, LendingPoolUIDataContract
+from enums.enums import LendingProtocol, SearchTypes, LendingPoolAddresses, LendingPoolUIDataContract, QueueMode, \
+    QueueType
 from bots.searcher import Searcher
-from bots.data_manager import DataManager
+from bots.async_searcher import AsyncSearcher
+from bots.health_factor_engine import HealthFactorEngine
+from bots.scan_scheduler import ScanScheduler
+from bots.liquidation_price_index import LiquidationPriceIndex
+from bots.dirty_account_tracker import DirtyAccountTracker
+from bots.shard_coordinator import ShardCoordinator
+from bots.data_manager import DataManager, DEFAULT_RECORD_CACHE_SIZE
 from bots.liquidator import Liquidator
 
 from sol.flash_liquidate_contract_interface import FlashLiquidateContractInterface
 from sol.lending_pool_contract_interface import LendingPoolContractInterface
+from sol.multicall_contract_interface import MulticallContractInterface
+from sol.block_clock import BlockClock
 from sol.oracle_contract_interface import OracleContractInterface
 from sol.provider.provider import Provider
+from sol.provider.async_provider import AsyncProvider, DEFAULT_MAX_CONCURRENT_REQUESTS
 from sol.ui_pool_data_contract_interface import UIPoolDataContractInterface
+from sol.async_lending_pool_contract_interface import AsyncLendingPoolContractInterface
+from sol.async_ui_pool_data_contract_interface import AsyncUIPoolDataContractInterface
+from sol.async_oracle_contract_interface import AsyncOracleContractInterface
 
 logger = Logger(section_name=__name__)
 
@@ -23,7 +40,8 @@ config = dotenv_values(dotenv_path=find_dotenv())
 def searcher_job(
         protocol: str,
         search_type: SearchTypes,
-        run_indefinitely: bool = False):
+        run_indefinitely: bool = False,
+        num_shards: int = None):
     """
     Searcher job
 
@@ -31,6 +49,8 @@ def searcher_job(
     :param protocol: Name of the protocol (ex. AAVE_ARBITRUM)
     :param search_type: Type of search (ex. SearchTypes.RECENT_BORROWS)
     :param run_indefinitely: Determines if the job should run indefinitely
+    :param num_shards: If set, the protocol's accounts are split into num_shards shards shared with the other searcher
+        jobs of the protocol and search type, and only the shards this job owns are searched
     """
     logger.info(f"Starting searcher job for {protocol} from {search_type}")
 
@@ -55,6 +75,8 @@ def searcher_job(
     redis_interface = RedisInterface(
         host=config["REDIS_HOST"],
         port=config["REDIS_PORT"],
+        queue_mode=QueueMode.PRIORITY,
+        queue_modes={QueueType.DATA_MANAGER_QUEUE: QueueMode.STREAM},
     )
 
     # Existing contract interfaces ################################################
@@ -62,17 +84,20 @@ def searcher_job(
         LendingPoolAddresses.AAVE_ARBITRUM.name: LendingPoolContractInterface(
             address=LendingPoolAddresses.AAVE_ARBITRUM.value,
             provider=provider,
-            protocol_name=LendingProtocol.AAVE_ARBITRUM.name
+            protocol_name=LendingProtocol.AAVE_ARBITRUM.name,
+            borrower_index=BorrowerIndex(db_interface, LendingProtocol.AAVE_ARBITRUM.name)
         ),
         LendingPoolAddresses.RADIANT_ARBITRUM.name: LendingPoolContractInterface(
             address=LendingPoolAddresses.RADIANT_ARBITRUM.value,
             provider=provider,
-            protocol_name=LendingProtocol.RADIANT_ARBITRUM.name
+            protocol_name=LendingProtocol.RADIANT_ARBITRUM.name,
+            borrower_index=BorrowerIndex(db_interface, LendingProtocol.RADIANT_ARBITRUM.name)
         ),
         LendingPoolAddresses.SILO_ARBITRUM.name: LendingPoolContractInterface(
             address=LendingPoolAddresses.SILO_ARBITRUM.value,
             provider=provider,
-            protocol_name=LendingProtocol.SILO_ARBITRUM.name
+            protocol_name=LendingProtocol.SILO_ARBITRUM.name,
+            borrower_index=BorrowerIndex(db_interface, LendingProtocol.SILO_ARBITRUM.name)
         )
     }
 
@@ -94,25 +119,167 @@ def searcher_job(
         provider=provider,
         protocol_name=LendingProtocol.AAVE_ARBITRUM.name
     )
+
+    multicall_interface = MulticallContractInterface(provider=provider)
     #############################################################################
 
+    shard_coordinators = {}
+    if num_shards is not None:
+        shard_coordinators[protocol] = ShardCoordinator(
+            redis_interface=redis_interface,
+            group=f"{protocol}_{search_type.name}",
+            num_shards=num_shards
+        )
+        shard_coordinators[protocol].start()
+
     searcher = Searcher(
         lending_pool_interfaces=lending_pool_interfaces,
         ui_pool_data_interfaces=ui_pool_data_interfaces,
         oracle_interface=oracle_contract_interface,
         mongo_interface=db_interface,
-        redis_interface=redis_interface
+        redis_interface=redis_interface,
+        multicall_interface=multicall_interface,
+        health_factor_engines={
+            protocol_name: HealthFactorEngine(protocol_name=protocol_name) for protocol_name in ui_pool_data_interfaces
+        },
+        block_clock=BlockClock(provider=provider),
+        scan_schedulers={
+            protocol_name: ScanScheduler(protocol_name=protocol_name) for protocol_name in lending_pool_interfaces
+        },
+        liquidation_price_indexes={
+            protocol_name: LiquidationPriceIndex(protocol_name=protocol_name)
+            for protocol_name in ui_pool_data_interfaces
+        },
+        dirty_account_trackers={
+            protocol_name: DirtyAccountTracker(lending_pool_interface=lending_pool_interfaces[protocol_name])
+            for protocol_name in ui_pool_data_interfaces
+        },
+        shard_coordinators=shard_coordinators
     )
-    searcher.live_search(protocol_name=protocol, search_type=search_type, run_indefinitely=run_indefinitely)
+    try:
+        searcher.live_search(protocol_name=protocol, search_type=search_type, run_indefinitely=run_indefinitely)
+    finally:
+        searcher.block_clock.stop()
+        # Released shards are taken over by the other searchers right away instead of after the lease TTL
+        for shard_coordinator in shard_coordinators.values():
+            shard_coordinator.stop()
 
     logger.info(f"Searcher job for {protocol} from {search_type} finished")
 
 
-def data_manager_job(run_indefinitely: bool = False):
+def async_searcher_job(
+        protocols: List[str] = None,
+        search_type: SearchTypes = SearchTypes.RECENT_BORROWS,
+        run_indefinitely: bool = False,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS):
+    """
+    Async searcher job. Scans every protocol on a single event loop over one shared async provider connection.
+
+    :param protocols: Names of the protocols (ex. [AAVE_ARBITRUM, RADIANT_ARBITRUM])
+    :param search_type: Type of search (ex. SearchTypes.RECENT_BORROWS)
+    :param run_indefinitely: Determines if the job should run indefinitely
+    :param max_concurrent_requests: Maximum number of RPC requests in flight at once
+    """
+    if protocols is None:
+        protocols = [LendingProtocol.AAVE_ARBITRUM.name, LendingProtocol.RADIANT_ARBITRUM.name]
+
+    logger.info(f"Starting async searcher job for {protocols} from {search_type}")
+
+    try:
+        provider = Provider(
+            wallet_address=config["WALLET_ADDRESS"],
+            wallet_private_key=config["WALLET_PRIVATE_KEY"],
+            https_url=None,
+            ws_url=config["ALCHEMY_WSS_RPC_URL_ARBITRUM"]
+        )
+        logger.info("Provider initialized")
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        logger.critical("Failed to initialize provider")
+        raise
+
+    db_interface = MongoInterface(
+        db_name=config["MONGO_DB_NAME"],
+        connection_url=config["MONGO_CONNECTION_URL"]
+    )
+
+    redis_interface = RedisInterface(
+        host=config["REDIS_HOST"],
+        port=config["REDIS_PORT"],
+        queue_mode=QueueMode.PRIORITY,
+        queue_modes={QueueType.DATA_MANAGER_QUEUE: QueueMode.STREAM},
+    )
+
+    # Borrower discovery stays on the sync interfaces
+    lending_pool_interfaces = {
+        protocol: LendingPoolContractInterface(
+            address=LendingPoolAddresses[protocol].value,
+            provider=provider,
+            protocol_name=protocol,
+            borrower_index=BorrowerIndex(db_interface, protocol)
+        )
+        for protocol in protocols
+    }
+
+    async def run():
+        async_provider = AsyncProvider(
+            wallet_address=config["WALLET_ADDRESS"],
+            wallet_private_key=config["WALLET_PRIVATE_KEY"],
+            https_url=None,
+            ws_url=config["ALCHEMY_WSS_RPC_URL_ARBITRUM"],
+            max_concurrent_requests=max_concurrent_requests
+        )
+        await async_provider.connect()
+        logger.info("Async provider initialized")
+
+        async_searcher = AsyncSearcher(
+            lending_pool_interfaces=lending_pool_interfaces,
+            async_lending_pool_interfaces={
+                protocol: AsyncLendingPoolContractInterface(
+                    address=LendingPoolAddresses[protocol].value,
+                    provider=async_provider,
+                    protocol_name=protocol
+                )
+                for protocol in protocols
+            },
+            async_ui_pool_data_interfaces={
+                protocol: AsyncUIPoolDataContractInterface(
+                    address=LendingPoolUIDataContract[protocol].value,
+                    provider=async_provider,
+                    protocol_name=protocol
+                )
+                for protocol in protocols
+            },
+            async_oracle_interface=AsyncOracleContractInterface(
+                address=config['AAVE_ARBITRUM_ORACLE_CONTRACT_ADDRESS'],
+                provider=async_provider,
+                protocol_name=LendingProtocol.AAVE_ARBITRUM.name
+            ),
+            mongo_interface=db_interface,
+            redis_interface=redis_interface
+        )
+
+        try:
+            await async_searcher.live_search_protocols(
+                protocol_names=protocols,
+                search_type=search_type,
+                run_indefinitely=run_indefinitely
+            )
+        finally:
+            await async_provider.disconnect()
+
+    asyncio.run(run())
+
+    logger.info(f"Async searcher job for {protocols} from {search_type} finished")
+
+
+def data_manager_job(run_indefinitely: bool = False, record_cache_size: int = DEFAULT_RECORD_CACHE_SIZE):
     """
     Data manager job
 
     :param run_indefinitely: Determines if the job should run indefinitely
+    :param record_cache_size: Number of account records whose last persisted state is remembered to skip unchanged
+        writes, must be 0 when several data manager jobs share the queue
     """
     logger.info("Starting data manager job")
     db_interface = MongoInterface(
@@ -123,9 +290,15 @@ def data_manager_job(run_indefinitely: bool = False):
     redis_interface = RedisInterface(
         host=config["REDIS_HOST"],
         port=config["REDIS_PORT"],
+        queue_mode=QueueMode.STREAM,
     )
 
-    data_manager = DataManager(db_interface=db_interface, redis_interface=redis_interface)
+    data_manager = DataManager(
+        db_interface=db_interface,
+        redis_interface=redis_interface,
+        record_cache_size=record_cache_size,
+        position_history_store=PositionHistoryStore(mongo_interface=db_interface)
+    )
     data_manager.monitor_queue(run_indefinitely=run_indefinitely)
 
     logger.info("Data manager job finished")
@@ -165,6 +338,7 @@ def liquidator_job(run_indefinitely: bool = False):
     redis_interface = RedisInterface(
         host=config["REDIS_HOST"],
         port=config["REDIS_PORT"],
+        queue_mode=QueueMode.PRIORITY,
     )
 
     liquidator = Liquidator(
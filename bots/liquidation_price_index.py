@@ -0,0 +1,205 @@
+import bisect
+import numpy
+import pandas
+from typing import Dict, List, Tuple
+
+from app_logger.logger import Logger
+
+# Above this many accounts, bulk updates rebuild the sorted lists instead of inserting or deleting one by one
+BULK_UPDATE_SIZE = 64
+
+# Trigger directions: the position is liquidatable once the asset price falls below or rises above its trigger
+TRIGGER_BELOW = 'below'
+TRIGGER_ABOVE = 'above'
+
+
+class LiquidationPriceIndex:
+    """
+    Index of the prices at which tracked positions become liquidatable. For every account and every asset it holds, the
+    index stores the asset price at which the account's health factor crosses 1.0, all other prices held constant.
+    Triggers are kept in sorted lists per asset, so a price move is answered with a range query instead of a scan of
+    every position. A trigger is only valid while the account's other prices hold, so the accounts exposed to a moved
+    asset must be reindexed at the new prices (see get_exposed_accounts).
+    """
+
+    def __init__(self, protocol_name: str):
+        """
+        Initialize the LiquidationPriceIndex class
+
+        :param protocol_name: Name of the protocol the indexed positions belong to
+        """
+        self.protocol_name = protocol_name
+
+        # {asset: {direction: ([sorted trigger prices], [accounts in the same order])}}
+        self.triggers: Dict[str, Dict[str, Tuple[List[float], List[str]]]] = {}
+        # {account: [(asset, direction, trigger price)]} used to remove an account's triggers
+        self.account_triggers: Dict[str, List[Tuple[str, str, float]]] = {}
+        # Accounts already below 1.0 when they were indexed
+        self.liquidatable_accounts = set()
+
+        logger_section_name = f"{__class__}.{protocol_name}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def __len__(self):
+        return len(self.account_triggers)
+
+    def update_positions(self, position_values: pandas.DataFrame, prices: Dict[str, float]):
+        """
+        Recompute the triggers of the given accounts
+
+        :param position_values: Dataframe of account_address, underlying_asset, weighted_collateral and debt, as
+            returned by HealthFactorEngine.compute_position_values. Every position of an account must be included
+        :param prices: Current asset prices, in the unit the index is queried with
+        """
+        if position_values.empty:
+            return
+
+        self.drop_accounts(position_values['account_address'].unique().tolist())
+
+        totals = position_values.groupby('account_address')[['weighted_collateral', 'debt']].transform('sum')
+        known_price = position_values['underlying_asset'].isin(prices.keys())
+        position_values = position_values[known_price]
+        totals = totals[known_price]
+
+        # With r the ratio of the new to the current price of one asset:
+        #   HF(r) = (other collateral + weighted_collateral * r) / (other debt + debt * r)
+        # HF(r) = 1 at r = -base / net_exposure. A net collateral asset triggers below it, a net debt asset above it
+        net_exposure = (position_values['weighted_collateral'] - position_values['debt']).to_numpy(dtype=float)
+        base = (
+            (totals['weighted_collateral'] - position_values['weighted_collateral'])
+            - (totals['debt'] - position_values['debt'])
+        ).to_numpy(dtype=float)
+        current_prices = position_values['underlying_asset'].map(prices).to_numpy(dtype=float)
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            trigger_prices = current_prices * -base / net_exposure
+
+        accounts = position_values['account_address'].to_numpy()
+        assets = position_values['underlying_asset'].to_numpy()
+        has_debt = totals['debt'].to_numpy(dtype=float) > 0
+        health_factors = numpy.where(
+            has_debt, totals['weighted_collateral'].to_numpy(dtype=float) / numpy.where(has_debt, totals['debt'], 1), 0
+        )
+
+        new_triggers: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}
+        for account, asset, exposure, trigger_price, account_has_debt, health_factor in zip(
+                accounts, assets, net_exposure, trigger_prices, has_debt, health_factors
+        ):
+            if not account_has_debt or exposure == 0 or not numpy.isfinite(trigger_price):
+                continue
+
+            if health_factor < 1:
+                self.liquidatable_accounts.add(account)
+                continue
+
+            direction = TRIGGER_BELOW if exposure > 0 else TRIGGER_ABOVE
+            # A collateral asset would have to go negative to liquidate the account
+            if direction == TRIGGER_BELOW and trigger_price <= 0:
+                continue
+
+            new_triggers.setdefault((asset, direction), []).append((float(trigger_price), account))
+            self.account_triggers.setdefault(account, []).append((asset, direction, float(trigger_price)))
+
+        for (asset, direction), asset_new_triggers in new_triggers.items():
+            trigger_prices, trigger_accounts = self.triggers.setdefault(asset, {}).setdefault(direction, ([], []))
+            if len(asset_new_triggers) > BULK_UPDATE_SIZE:
+                merged = sorted(list(zip(trigger_prices, trigger_accounts)) + asset_new_triggers)
+                trigger_prices[:] = [trigger_price for trigger_price, _ in merged]
+                trigger_accounts[:] = [account for _, account in merged]
+                continue
+
+            for trigger_price, account in asset_new_triggers:
+                position = bisect.bisect_right(trigger_prices, trigger_price)
+                trigger_prices.insert(position, trigger_price)
+                trigger_accounts.insert(position, account)
+
+    def drop_accounts(self, account_addresses: List[str]):
+        """
+        Remove every trigger of the given accounts
+
+        :param account_addresses:
+        """
+        account_addresses = [account for account in account_addresses if account in self.account_triggers
+                             or account in self.liquidatable_accounts]
+        if len(account_addresses) > BULK_UPDATE_SIZE:
+            dropped_accounts = set(account_addresses)
+            self.liquidatable_accounts -= dropped_accounts
+            for account in account_addresses:
+                self.account_triggers.pop(account, None)
+            for asset_triggers in self.triggers.values():
+                for trigger_prices, trigger_accounts in asset_triggers.values():
+                    kept = [
+                        (trigger_price, account) for trigger_price, account in zip(trigger_prices, trigger_accounts)
+                        if account not in dropped_accounts
+                    ]
+                    trigger_prices[:] = [trigger_price for trigger_price, _ in kept]
+                    trigger_accounts[:] = [account for _, account in kept]
+            return
+
+        for account in account_addresses:
+            self.liquidatable_accounts.discard(account)
+            for asset, direction, trigger_price in self.account_triggers.pop(account, []):
+                trigger_prices, trigger_accounts = self.triggers[asset][direction]
+                position = bisect.bisect_left(trigger_prices, trigger_price)
+                while position < len(trigger_prices) and trigger_prices[position] == trigger_price:
+                    if trigger_accounts[position] == account:
+                        del trigger_prices[position]
+                        del trigger_accounts[position]
+                        break
+                    position += 1
+
+    def get_exposed_accounts(self, asset_addresses: List[str]) -> List[str]:
+        """
+        Get the accounts with a trigger on any of the given assets. Their triggers on every other asset assumed the
+        old prices of these assets
+
+        :param asset_addresses:
+        :return: Account addresses, without duplicates
+        """
+        exposed_accounts = set()
+        for asset_address in asset_addresses:
+            for _, trigger_accounts in self.triggers.get(asset_address, {}).values():
+                exposed_accounts.update(trigger_accounts)
+
+        return list(exposed_accounts)
+
+    def get_crossed_accounts(self, asset_address: str, price: float) -> List[str]:
+        """
+        Get the accounts whose trigger on an asset is crossed at the given price
+
+        :param asset_address:
+        :param price: New asset price
+        :return: Account addresses
+        """
+        asset_triggers = self.triggers.get(asset_address)
+        if not asset_triggers:
+            return []
+
+        crossed_accounts = []
+        if TRIGGER_BELOW in asset_triggers:
+            # Collateral triggers above the new price
+            trigger_prices, trigger_accounts = asset_triggers[TRIGGER_BELOW]
+            crossed_accounts.extend(trigger_accounts[bisect.bisect_right(trigger_prices, price):])
+        if TRIGGER_ABOVE in asset_triggers:
+            # Debt triggers below the new price
+            trigger_prices, trigger_accounts = asset_triggers[TRIGGER_ABOVE]
+            crossed_accounts.extend(trigger_accounts[:bisect.bisect_left(trigger_prices, price)])
+
+        return crossed_accounts
+
+    def on_price_update(self, prices: Dict[str, float]) -> List[str]:
+        """
+        Get the accounts that crossed a trigger after a price update, plus the accounts already liquidatable when they
+        were indexed
+
+        :param prices: New prices of the assets that moved
+        :return: Account addresses, without duplicates
+        """
+        crossed_accounts = set(self.liquidatable_accounts)
+        for asset_address, price in prices.items():
+            crossed_accounts.update(self.get_crossed_accounts(asset_address, price))
+
+        if crossed_accounts:
+            self.logger.info(f"{len(crossed_accounts)} accounts crossed their liquidation price")
+
+        return list(crossed_accounts)
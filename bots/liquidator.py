@@ -1,16 +1,21 @@
 import pandas
-from typing import Dict
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Dict, Optional, Set, Tuple
 from dotenv import dotenv_values, find_dotenv
 from web3 import Web3
 
 from app_logger.logger import Logger
 from enums.enums import LendingProtocol, QueueType
-from db.redis_interface import RedisInterface
+from db.redis_interface import RedisInterface, DEFAULT_POP_TIMEOUT, DEFAULT_MAX_ITEM_AGE_BLOCKS
 from bots.utils.utils import encode_path
 from sol.flash_liquidate_contract_interface import FlashLiquidateContractInterface
+from sol.receipt_tracker import ReceiptTracker
 
 config = dotenv_values(dotenv_path=find_dotenv())
 
+# Liquidations sent and not yet mined at once
+DEFAULT_MAX_IN_FLIGHT = 4
+
 
 class Liquidator:
     """
@@ -19,58 +24,189 @@ class Liquidator:
     def __init__(
             self,
             flash_liquidate_contract_interface: FlashLiquidateContractInterface,
-            redis_interface: RedisInterface
+            redis_interface: RedisInterface,
+            receipt_tracker: ReceiptTracker = None,
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+            max_item_age_blocks: int = DEFAULT_MAX_ITEM_AGE_BLOCKS
     ):
         """
         Initialize Liquidator bot
         :param flash_liquidate_contract_interface: Contract interface for flash liquidate contract
         :param redis_interface: Interface for Redis to access the queue
+        :param receipt_tracker: Tracker settling sent liquidations, defaults to one on the contract interface's provider
+        :param max_in_flight: Maximum number of liquidations sent and not yet mined
+        :param max_item_age_blocks: Liquidations found more than this many blocks ago are dropped, the position may
+            already be repaid or liquidated
         """
         self.flash_liquidate_contract_interface = flash_liquidate_contract_interface
         self.redis_interface = redis_interface
+        self.receipt_tracker = receipt_tracker if receipt_tracker is not None else ReceiptTracker(
+            provider=flash_liquidate_contract_interface.provider
+        )
+        self.max_in_flight = max_in_flight
+        self.max_item_age_blocks = max_item_age_blocks
+
+        # Receipt future -> liquidation data, for every liquidation sent and not yet mined
+        self.in_flight: Dict[Future, Dict] = {}
+        # Positions with a liquidation in flight. The searcher queues a position again every block until it is
+        # liquidated, and a second transaction for it would only revert
+        self.in_flight_positions: Set[Tuple[str, str, str]] = set()
 
         logger_section_name = f"{__class__}"
         self.logger = Logger(section_name=logger_section_name)
 
+    @staticmethod
+    def get_position_key(liquidation_data: Dict) -> Tuple[str, str, str]:
+        """
+        Get the key of the position a liquidation targets
+
+        :param liquidation_data: Liquidation params as created by Searcher.create_liquidation_params
+        :return: (protocol name, user address, debt asset)
+        """
+        return (
+            liquidation_data['protocol_name'],
+            liquidation_data['user'].lower(),
+            liquidation_data['debt_asset'].lower()
+        )
+
+    def is_stale(self, liquidation_data: Dict) -> bool:
+        """
+        Check if a liquidation was found too many blocks ago to be sent
+
+        :param liquidation_data: Liquidation params as created by Searcher.create_liquidation_params
+        :return: True or False, False if the liquidation has no block number
+        """
+        block_number = liquidation_data.get('block_number')
+        if block_number is None:
+            return False
+
+        current_block_number = self.flash_liquidate_contract_interface.provider.w3.eth.get_block_number()
+        return current_block_number - block_number > self.max_item_age_blocks
+
+    def settle_liquidations(self, timeout: Optional[float] = 0):
+        """
+        Log the outcome of the liquidations mined since the last call
+
+        :param timeout: Seconds to wait for at least one liquidation to be mined, None to wait indefinitely
+        """
+        if not self.in_flight:
+            return
+
+        done, _ = wait(list(self.in_flight.keys()), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            liquidation_data = self.in_flight.pop(future)
+            self.in_flight_positions.discard(self.get_position_key(liquidation_data))
+            try:
+                txn_receipt = future.result()
+            except Exception as e:
+                self.logger.error(f"Liquidation of {liquidation_data['user']} was not mined: {e}")
+                continue
+
+            if txn_receipt["status"] == 1:
+                self.logger.info(f"Liquidation of {liquidation_data['user']} succeeded: {txn_receipt}")
+            else:
+                self.logger.error(f"Liquidation of {liquidation_data['user']} reverted: {txn_receipt}")
+
+    def send_liquidation(self, liquidation_data: Dict) -> bool:
+        """
+        Send a flash loan liquidation without waiting for it to be mined. Skipped while a liquidation of the same
+        position is in flight
+
+        :param liquidation_data: Liquidation params as created by Searcher.create_liquidation_params
+        :return: True if the transaction was sent
+        """
+        position_key = self.get_position_key(liquidation_data)
+        if position_key in self.in_flight_positions:
+            self.logger.info(
+                f"Skipping liquidation of {liquidation_data['user']}, a liquidation of the position is in flight"
+            )
+            return False
+
+        collateral_asset = liquidation_data['collateral_asset']
+        debt_asset = liquidation_data['debt_asset']
+        user_address = liquidation_data['user']
+        debt_to_cover = Web3.to_wei(liquidation_data['debt_to_cover'], 'ether')
+        receive_a_token = liquidation_data['receive_a_token']
+
+        if liquidation_data['protocol_name'] == LendingProtocol.AAVE_ARBITRUM.name:
+            protocol = LendingProtocol.AAVE_ARBITRUM.value
+        elif liquidation_data['protocol_name'] == LendingProtocol.RADIANT_ARBITRUM.name:
+            protocol = LendingProtocol.RADIANT_ARBITRUM.value
+        else:
+            self.logger.error("Unknown protocol name")
+            raise Exception("Unknown protocol name")
+
+        path = [collateral_asset, debt_asset, user_address, debt_to_cover, receive_a_token, protocol]
+        path_types = ["address", "address", "address", "uint256", "bool", "uint8"]
+        liquidation_encoded_params = encode_path(path=path, path_types=path_types)
+
+        try:
+            txn_hash = self.flash_liquidate_contract_interface.flash_loan_liquidate(
+                token0=debt_asset,
+                loan_amount=debt_to_cover,
+                liquidate_params=liquidation_encoded_params,
+                wait_for_receipt=False
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to send liquidation of {user_address}: {e}")
+            return False
+
+        self.in_flight[self.receipt_tracker.track(txn_hash)] = liquidation_data
+        self.in_flight_positions.add(position_key)
+        self.logger.info(f"Liquidation sent: {Web3.to_hex(txn_hash)}, {len(self.in_flight)} in flight")
+        return True
+
     def liquidate(self, run_indefinitely: bool = False):
         run = True
         while run:
             if not run_indefinitely:
                 run = False
 
+            # Settle mined liquidations, and wait for one when every slot is taken
+            self.settle_liquidations()
+            if len(self.in_flight) >= self.max_in_flight:
+                self.settle_liquidations(timeout=None)
+
+            entry_id = None
             liquidation_data = None
             try:
-                liquidation_data: Dict = self.redis_interface.pop_item(queue_type=QueueType.LIQUIDATOR_QUEUE)
-                self.logger.info("Received liquidation data..")
-            except Exception as e:
-                self.logger.info(f"Error: {e}")
-                self.logger.info("No liquidation data received..")
-
-            if liquidation_data:
-                collateral_asset = liquidation_data['collateral_asset']
-                debt_asset = liquidation_data['debt_asset']
-                user_address = liquidation_data['user']
-                debt_to_cover = Web3.to_wei(liquidation_data['debt_to_cover'], 'ether')
-                receive_a_token = liquidation_data['receive_a_token']
-
-                if liquidation_data['protocol_name'] == LendingProtocol.AAVE_ARBITRUM.name:
-                    protocol = LendingProtocol.AAVE_ARBITRUM.value
-                elif liquidation_data['protocol_name'] == LendingProtocol.RADIANT_ARBITRUM.name:
-                    protocol = LendingProtocol.RADIANT_ARBITRUM.value
+                # Block on the queue rather than spinning while it is empty
+                if self.redis_interface.is_stream_queue(QueueType.LIQUIDATOR_QUEUE):
+                    item = self.redis_interface.read_item(
+                        queue_type=QueueType.LIQUIDATOR_QUEUE,
+                        timeout=DEFAULT_POP_TIMEOUT
+                    )
+                    if item is not None:
+                        entry_id, liquidation_data = item
                 else:
-                    self.logger.error("Unknown protocol name")
-                    raise Exception("Unknown protocol name")
+                    liquidation_data: Dict = self.redis_interface.pop_item(
+                        queue_type=QueueType.LIQUIDATOR_QUEUE,
+                        timeout=DEFAULT_POP_TIMEOUT
+                    )
+            except Exception as e:
+                self.logger.error(f"Error getting liquidation data from queue: {e}")
 
-                path = [collateral_asset, debt_asset, user_address, debt_to_cover, receive_a_token, protocol]
-                path_types = ["address", "address", "address", "uint256", "bool", "uint8"]
-                liquidation_encoded_params = encode_path(path=path, path_types=path_types)
+            if not liquidation_data:
+                continue
 
-                liquidation_result = self.flash_liquidate_contract_interface.flash_loan_liquidate(
-                    token0=debt_asset,
-                    loan_amount=debt_to_cover,
-                    liquidate_params=liquidation_encoded_params
+            self.logger.info("Received liquidation data..")
+            try:
+                stale = self.is_stale(liquidation_data)
+            except Exception as e:
+                self.logger.error(f"Failed to get the current block, sending the liquidation anyway: {e}")
+                stale = False
+
+            if stale:
+                self.logger.info(
+                    f"Dropping liquidation of {liquidation_data['user']} found at an old block "
+                    f"{liquidation_data['block_number']}"
                 )
-                if liquidation_result:
-                    self.logger.info(f"Liquidation result: {liquidation_result}")
             else:
-                self.logger.info("No liquidation data received..")
+                self.send_liquidation(liquidation_data)
+            # Stream entries are acknowledged once handled, only a liquidator dying mid-item leaves one pending
+            if entry_id is not None:
+                self.redis_interface.ack_item(QueueType.LIQUIDATOR_QUEUE, entry_id)
+
+        # Settle every liquidation still in flight before returning
+        while self.in_flight:
+            self.settle_liquidations(timeout=None)
@@ -0,0 +1,267 @@
+import numpy
+import pandas
+from typing import Dict, List, Optional, Tuple
+
+from app_logger.logger import Logger
+
+# (health factor upper bound, blocks between rechecks). Accounts near liquidation are rechecked every block
+DEFAULT_HF_TIERS: List[Tuple[float, int]] = [
+    (1.05, 1),
+    (1.10, 2),
+    (1.25, 5),
+    (1.50, 20),
+    (2.00, 50),
+    (numpy.inf, 200),
+]
+
+# Accounts whose collateral or debt moves more than this per block on average are moved one tier closer
+DEFAULT_HIGH_VOLATILITY = 0.001
+# A price move of this size halves the remaining wait of every exposed account
+DEFAULT_PRICE_MOVE_THRESHOLD = 0.005
+# Smoothing factor of the per-asset volatility estimate
+DEFAULT_VOLATILITY_ALPHA = 0.1
+# Blocks after which the assets held by an account are read again
+DEFAULT_ASSET_SYNC_INTERVAL = 1000
+# Accounts whose assets are read on a single block at most, so a large schedule is synced over several blocks
+DEFAULT_MAX_ASSET_SYNCS = 1000
+
+
+class ScanScheduler:
+    """
+    Decides which accounts to recheck on each block. Accounts are placed in tiers by their health factor distance from
+    1.0 and by the volatility of the assets they hold. Healthy accounts wait longer between rechecks, and the wait of
+    accounts exposed to an asset shrinks when its price moves. The assets of every scheduled account are synced every
+    asset_sync_interval blocks, so healthy accounts are exposed to price moves too.
+    """
+
+    def __init__(
+            self,
+            protocol_name: str,
+            hf_tiers: List[Tuple[float, int]] = None,
+            high_volatility: float = DEFAULT_HIGH_VOLATILITY,
+            price_move_threshold: float = DEFAULT_PRICE_MOVE_THRESHOLD,
+            volatility_alpha: float = DEFAULT_VOLATILITY_ALPHA,
+            asset_sync_interval: int = DEFAULT_ASSET_SYNC_INTERVAL,
+            max_asset_syncs: int = DEFAULT_MAX_ASSET_SYNCS
+    ):
+        """
+        Initialize the ScanScheduler class
+
+        :param protocol_name: Name of the protocol the scheduled accounts belong to
+        :param hf_tiers: (health factor upper bound, blocks between rechecks) sorted by health factor
+        :param high_volatility: Average relative price move per block above which an account is moved one tier closer
+        :param price_move_threshold: Relative price move that halves the remaining wait of exposed accounts
+        :param volatility_alpha: Smoothing factor of the per-asset volatility estimate
+        :param asset_sync_interval: Blocks after which the assets held by an account are read again
+        :param max_asset_syncs: Accounts whose assets are read on a single block at most
+        """
+        self.protocol_name = protocol_name
+        self.hf_tiers = hf_tiers if hf_tiers is not None else DEFAULT_HF_TIERS
+        self.high_volatility = high_volatility
+        self.price_move_threshold = price_move_threshold
+        self.volatility_alpha = volatility_alpha
+        self.asset_sync_interval = asset_sync_interval
+        self.max_asset_syncs = max_asset_syncs
+
+        self.hf_bounds = numpy.array([hf_bound for hf_bound, _ in self.hf_tiers], dtype=float)
+        self.tier_intervals = numpy.array([interval for _, interval in self.hf_tiers], dtype=int)
+
+        # Schedule indexed by account address
+        self.schedule = pandas.DataFrame(
+            columns=['health_factor', 'tier', 'last_scanned_block', 'next_scan_block', 'assets_synced_block']
+        ).astype({
+            'health_factor': float,
+            'tier': int,
+            'last_scanned_block': int,
+            'next_scan_block': int,
+            'assets_synced_block': int,
+        })
+        # One row per (account, asset) the account holds
+        self.account_assets = pandas.DataFrame(columns=['account_address', 'underlying_asset'])
+
+        self.asset_prices: Dict[str, float] = {}
+        self.asset_volatility: Dict[str, float] = {}
+
+        logger_section_name = f"{__class__}.{protocol_name}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def get_tracked_assets(self) -> List[str]:
+        """
+        Get the addresses of every asset held by a scheduled account
+        :return:
+        """
+        return self.account_assets['underlying_asset'].unique().tolist()
+
+    def add_accounts(self, account_addresses: List[str], block_number: int):
+        """
+        Schedule new accounts for a scan on the given block. Accounts already scheduled are left as is
+
+        :param account_addresses:
+        :param block_number: Block the new accounts are due at
+        """
+        new_addresses = pandas.Index(account_addresses).unique().difference(self.schedule.index)
+        if new_addresses.empty:
+            return
+
+        new_accounts = pandas.DataFrame({
+            'health_factor': numpy.nan,
+            'tier': 0,
+            'last_scanned_block': -1,
+            'next_scan_block': block_number,
+            'assets_synced_block': -1,
+        }, index=new_addresses)
+        self.schedule = pandas.concat([self.schedule, new_accounts])
+        self.logger.info(f"Scheduled {len(new_addresses)} new accounts, tracking {len(self.schedule)}")
+
+    def drop_accounts(self, account_addresses: List[str]):
+        """
+        Stop scheduling the given accounts
+
+        :param account_addresses:
+        """
+        self.schedule = self.schedule.drop(account_addresses, errors='ignore')
+        self.account_assets = self.account_assets[~self.account_assets['account_address'].isin(account_addresses)]
+
+    def get_accounts_to_sync_assets(self, block_number: int) -> List[str]:
+        """
+        Get the scheduled accounts whose assets were never read, or not in the last asset_sync_interval blocks
+
+        :param block_number:
+        :return: Account addresses, never synced and least recently synced first, at most max_asset_syncs of them
+        """
+        assets_synced_blocks = self.schedule['assets_synced_block']
+        stale = assets_synced_blocks[
+            (assets_synced_blocks < 0) | (assets_synced_blocks <= block_number - self.asset_sync_interval)
+        ]
+
+        return stale.sort_values(kind='stable').index[:self.max_asset_syncs].to_list()
+
+    def update_account_assets(self, user_reserves: pandas.DataFrame, block_number: Optional[int] = None):
+        """
+        Replace the assets held by the given accounts
+
+        :param user_reserves: Dataframe of account_address and reserves, as returned by
+            Searcher.get_user_reserve_data_from_protocol
+        :param block_number: Block the reserves were read at. If set, the accounts are not synced again before
+            asset_sync_interval blocks have passed
+        """
+        if user_reserves.empty:
+            return
+
+        if block_number is not None:
+            synced_addresses = self.schedule.index.intersection(pandas.Index(user_reserves['account_address']))
+            self.schedule.loc[synced_addresses, 'assets_synced_block'] = block_number
+
+        account_assets = pandas.DataFrame.from_records(
+            [
+                (account_address, reserve['underlying_asset'])
+                for account_address, reserves in zip(user_reserves['account_address'], user_reserves['reserves'])
+                for reserve in reserves
+                if reserve['scaled_a_token_balance'] > 0
+                or reserve['scaled_variable_debt'] > 0
+                or reserve['principal_stable_debt'] > 0
+            ],
+            columns=['account_address', 'underlying_asset']
+        )
+
+        self.account_assets = pandas.concat(
+            [
+                self.account_assets[~self.account_assets['account_address'].isin(user_reserves['account_address'])],
+                account_assets
+            ],
+            ignore_index=True
+        )
+
+    def get_account_volatility(self, account_addresses: pandas.Index) -> numpy.ndarray:
+        """
+        Get the volatility of the most volatile asset each account holds. Accounts with unknown assets get the
+        highest volatility of every tracked asset
+
+        :param account_addresses:
+        :return: Volatility in the same order as account_addresses
+        """
+        market_volatility = max(self.asset_volatility.values(), default=0.0)
+        if self.account_assets.empty:
+            return numpy.full(len(account_addresses), market_volatility)
+
+        asset_volatility = self.account_assets['underlying_asset'].map(self.asset_volatility).fillna(0.0)
+        account_volatility = asset_volatility.groupby(self.account_assets['account_address']).max()
+
+        return account_volatility.reindex(account_addresses).fillna(market_volatility).to_numpy(dtype=float)
+
+    def update_accounts(self, user_accounts: pandas.DataFrame, block_number: int):
+        """
+        Record fresh health factors and schedule each account's next scan from its tier
+
+        :param user_accounts: Dataframe of account_address and health_factor
+        :param block_number: Block the health factors were read at
+        """
+        if user_accounts.empty:
+            return
+
+        user_accounts = user_accounts.drop_duplicates(subset='account_address', keep='last')
+        account_addresses = pandas.Index(user_accounts['account_address'])
+        health_factors = user_accounts['health_factor'].to_numpy(dtype=float)
+
+        tiers = numpy.searchsorted(self.hf_bounds, health_factors, side='left')
+        tiers = numpy.minimum(tiers, len(self.tier_intervals) - 1)
+        high_volatility = self.get_account_volatility(account_addresses) > self.high_volatility
+        tiers = numpy.where(high_volatility, numpy.maximum(tiers - 1, 0), tiers)
+
+        self.add_accounts(account_addresses.to_list(), block_number)
+        self.schedule.loc[account_addresses, 'health_factor'] = health_factors
+        self.schedule.loc[account_addresses, 'tier'] = tiers
+        self.schedule.loc[account_addresses, 'last_scanned_block'] = block_number
+        self.schedule.loc[account_addresses, 'next_scan_block'] = block_number + self.tier_intervals[tiers]
+
+    def update_prices(self, asset_prices: Dict[str, float], block_number: int):
+        """
+        Update the per-asset volatility from new prices, and bring forward the next scan of accounts exposed to
+        assets that moved
+
+        :param asset_prices: Prices keyed by asset address
+        :param block_number: Block the prices were read at
+        """
+        price_moves = {}
+        for asset_address, price in asset_prices.items():
+            last_price = self.asset_prices.get(asset_address)
+            self.asset_prices[asset_address] = price
+            if not last_price:
+                continue
+
+            price_move = abs(price - last_price) / last_price
+            self.asset_volatility[asset_address] = (
+                self.volatility_alpha * price_move
+                + (1 - self.volatility_alpha) * self.asset_volatility.get(asset_address, 0.0)
+            )
+            if price_move > 0:
+                price_moves[asset_address] = price_move
+
+        if not price_moves or self.schedule.empty:
+            return
+
+        # Exposure of every account to the largest move among the assets it holds
+        asset_moves = self.account_assets['underlying_asset'].map(price_moves).fillna(0.0)
+        account_moves = asset_moves.groupby(self.account_assets['account_address']).max()
+        account_moves = account_moves.reindex(self.schedule.index)
+        # Accounts with unknown assets are exposed to every move
+        account_moves = account_moves.fillna(max(price_moves.values())).to_numpy(dtype=float)
+
+        remaining_blocks = numpy.maximum(self.schedule['next_scan_block'].to_numpy(dtype=int) - block_number, 0)
+        remaining_blocks = numpy.floor(remaining_blocks / (1 + account_moves / self.price_move_threshold))
+        self.schedule['next_scan_block'] = block_number + remaining_blocks.astype(int)
+
+        self.logger.info(f"Prices moved at block {block_number}: {price_moves}")
+
+    def get_due_accounts(self, block_number: int) -> List[str]:
+        """
+        Get the accounts due for a scan at the given block
+
+        :param block_number:
+        :return: Account addresses, lowest health factor first and never scanned accounts first of all
+        """
+        due = self.schedule[self.schedule['next_scan_block'] <= block_number]
+        due = due.sort_values('health_factor', na_position='first')
+
+        self.logger.info(f"{len(due)} of {len(self.schedule)} accounts due at block {block_number}")
+        return due.index.to_list()
@@ -1,18 +1,32 @@
+import time
+import functools
+import numpy
 import pandas
-from typing import Dict
+from typing import Dict, Iterator, List, Optional
 from dotenv import dotenv_values, find_dotenv
 from queue import Queue
+from concurrent.futures import Future
 
 from app_logger.logger import Logger
-from db.mongo_db_interface import MongoInterface
+from db.mongo_db_interface import MongoInterface, DEFAULT_FIND_BATCH_SIZE
 from db.redis_interface import RedisInterface
 from db.schemas.position_schema import UserAccountDataViewSchema, ReserveDataViewSchema, \
     UserAccountReservesDataViewSchema
 from enums.enums import SearchTypes, QueueType
+from bots.utils.utils import explode_reserves
 from sol.provider.provider import Provider
+from sol.block_clock import BlockClock
 from sol.lending_pool_contract_interface import LendingPoolContractInterface
-from sol.ui_pool_data_contract_interface import UIPoolDataContractInterface
+from sol.ui_pool_data_contract_interface import UIPoolDataContractInterface, DEFAULT_RESERVES_BATCH_SIZE, \
+    DEFAULT_MAX_CONCURRENT_REQUESTS
 from sol.oracle_contract_interface import OracleContractInterface
+from sol.multicall_contract_interface import MulticallContractInterface, DEFAULT_MULTICALL_BATCH_SIZE
+from bots.health_factor_engine import HealthFactorEngine, DEFAULT_HF_MARGIN, PERCENTAGE_FACTOR
+from bots.scan_scheduler import ScanScheduler
+from bots.liquidation_price_index import LiquidationPriceIndex
+from bots.dirty_account_tracker import DirtyAccountTracker
+from bots.data_manager import ACCOUNT_POSITIONS_COLLECTION, ACCOUNT_RECORD_SHARD_FIELD
+from bots.shard_coordinator import ShardCoordinator, DEFAULT_NUM_SHARDS, get_account_shard
 
 config = dotenv_values(dotenv_path=find_dotenv())
 logger = Logger(section_name=__file__)
@@ -23,6 +37,15 @@ DEFAULT_LIQUIDATION_PERCENT = 0.5
 # If account health factor is below this threshold, we will liquidate 100% of the position
 CLOSE_FACTOR_HF_THRESHOLD = 0.95
 
+# Flash loan premium charged on the borrowed debt asset (Aave v3: 5 bps)
+DEFAULT_FLASH_LOAN_PREMIUM = 0.0005
+# Liquidation bonus assumed for collateral assets whose reserve configuration is unknown
+DEFAULT_LIQUIDATION_BONUS = 0.05
+# Gas used by a flash loan liquidation, including the collateral swap
+DEFAULT_LIQUIDATION_GAS = 1_000_000
+# Wrapped ether on Arbitrum, used to price gas in USD
+WETH_ADDRESS = "0x82aF49447D8a07e3bd95BD0d56f35241523fBab1"
+
 
 class Searcher:
     """
@@ -36,7 +59,21 @@ class Searcher:
             ui_pool_data_interfaces: Dict[str, UIPoolDataContractInterface],
             oracle_interface: OracleContractInterface,
             mongo_interface: MongoInterface,
-            redis_interface: RedisInterface
+            redis_interface: RedisInterface,
+            multicall_interface: MulticallContractInterface = None,
+            multicall_batch_size: int = DEFAULT_MULTICALL_BATCH_SIZE,
+            reserves_batch_size: int = DEFAULT_RESERVES_BATCH_SIZE,
+            max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+            health_factor_engines: Dict[str, HealthFactorEngine] = None,
+            hf_margin: float = DEFAULT_HF_MARGIN,
+            block_clock: BlockClock = None,
+            scan_schedulers: Dict[str, ScanScheduler] = None,
+            liquidation_price_indexes: Dict[str, LiquidationPriceIndex] = None,
+            dirty_account_trackers: Dict[str, DirtyAccountTracker] = None,
+            flash_loan_premium: float = DEFAULT_FLASH_LOAN_PREMIUM,
+            liquidation_gas: int = DEFAULT_LIQUIDATION_GAS,
+            records_batch_size: int = DEFAULT_FIND_BATCH_SIZE,
+            shard_coordinators: Dict[str, ShardCoordinator] = None
     ):
         """
         Initialize the Searcher class
@@ -45,18 +82,70 @@ class Searcher:
         :param ui_pool_data_interfaces: A dictionary of UI pool data interfaces
         :param oracle_interface: An oracle interface
         :param mongo_interface: A mongo interface
-        :param data_manager_queue: A queue shared with the DataManager (data_manager.py)
-        :param liquidations_queue: A queue shared with the Liquidator (liquidator.py)
+        :param redis_interface: A redis interface used to push to the DataManager and Liquidator queues
+        :param multicall_interface: Optional Multicall3 interface. If set, account data is fetched in batches
+        :param multicall_batch_size: Number of calls packed into a single multicall
+        :param reserves_batch_size: Number of reserve data calls packed into a single multicall
+        :param max_concurrent_requests: Maximum number of reserve data multicalls in flight at once
+        :param health_factor_engines: Optional off-chain health factor engines keyed by protocol name, used by
+            SearchTypes.OFF_CHAIN_HEALTH_FACTOR
+        :param hf_margin: Accounts with an off-chain HF below 1 + hf_margin are confirmed on-chain
+        :param block_clock: Optional block clock. If set, live_search runs one scan per new block
+        :param scan_schedulers: Optional scan schedulers keyed by protocol name, used by SearchTypes.TIERED
+        :param liquidation_price_indexes: Optional liquidation price indexes keyed by protocol name, used by
+            SearchTypes.PRICE_TRIGGERED together with the health factor engines
+        :param dirty_account_trackers: Optional dirty account trackers keyed by protocol name. If set, only accounts
+            whose position changed are re-fetched, and accounts whose debt reaches zero are dropped
+        :param flash_loan_premium: Flash loan premium deducted from the estimated profit of a liquidation
+        :param liquidation_gas: Gas deducted from the estimated profit of a liquidation
+        :param records_batch_size: Number of stored accounts read and fetched at once by SearchTypes.FROM_RECORDS
+        :param shard_coordinators: Optional shard coordinators keyed by protocol name. If set, only the accounts of the
+            shards this searcher owns are searched, and the other searchers of the group search the rest
         """
         self.lending_pool_interfaces = lending_pool_interfaces
         self.ui_pool_data_interfaces = ui_pool_data_interfaces
         self.oracle_interface = oracle_interface
         self.mongo_interface = mongo_interface
         self.redis_interface = redis_interface
+        self.multicall_interface = multicall_interface
+        self.multicall_batch_size = multicall_batch_size
+        self.reserves_batch_size = reserves_batch_size
+        self.max_concurrent_requests = max_concurrent_requests
+        self.health_factor_engines = health_factor_engines if health_factor_engines is not None else {}
+        self.hf_margin = hf_margin
+        self.block_clock = block_clock
+        self.scan_schedulers = scan_schedulers if scan_schedulers is not None else {}
+        self.liquidation_price_indexes = liquidation_price_indexes if liquidation_price_indexes is not None else {}
+        self.dirty_account_trackers = dirty_account_trackers if dirty_account_trackers is not None else {}
+        self.flash_loan_premium = flash_loan_premium
+        self.liquidation_gas = liquidation_gas
+        self.records_batch_size = records_batch_size
+        self.shard_coordinators = shard_coordinators if shard_coordinators is not None else {}
+
+        # Liquidation bonus of every reserve, keyed by protocol name and asset address
+        self.liquidation_bonuses: Dict[str, Dict[str, float]] = {}
+
+        # Prices that moved since each protocol's last price triggered check
+        self.pending_price_updates: Dict[str, Dict[str, float]] = {
+            protocol_name: {} for protocol_name in self.liquidation_price_indexes
+        }
+        # Number of each protocol's recent borrowers already loaded into the price index
+        self.indexed_borrower_counts: Dict[str, int] = {}
+        # Last block whose Chainlink AnswerUpdated events were read for each protocol
+        self.price_feed_blocks: Dict[str, int] = {}
+        if self.liquidation_price_indexes and self.oracle_interface is not None:
+            self.oracle_interface.add_price_listener(self.on_price_update)
 
         logger_section_name = f"{__class__}"
         self.logger = Logger(section_name=logger_section_name)
 
+        # Borrowers found by each protocol's background discovery after the searcher started, not yet scheduled
+        self.discovered_borrowers: Dict[str, List[str]] = {}
+        for protocol_name, lending_pool_interface in self.lending_pool_interfaces.items():
+            lending_pool_interface.ready.add_done_callback(
+                functools.partial(self.on_borrowers_discovered, protocol_name)
+            )
+
     def get_protocol_events(self, protocol_name: str):
         """
         Get events from a lending protocol
@@ -73,34 +162,378 @@ class Searcher:
         """
         return self.lending_pool_interfaces[protocol_name].recent_borrowers
 
+    def on_borrowers_discovered(self, protocol_name: str, ready: Future):
+        """
+        Record the borrowers found by a protocol's initial discovery. Called from the discovery thread
+
+        :param protocol_name:
+        :param ready: Readiness future of the protocol's lending pool interface
+        """
+        if ready.exception() is not None:
+            return
+
+        self.discovered_borrowers[protocol_name] = ready.result()
+        self.logger.info(f"Borrower discovery for {protocol_name} finished with {len(ready.result())} new borrowers")
+
+    def pop_discovered_borrowers(self, protocol_name: str) -> List[str]:
+        """
+        Get and clear the borrowers found by a protocol's initial discovery
+        :param protocol_name:
+        :return: Account addresses, empty until the discovery has finished
+        """
+        return self.discovered_borrowers.pop(protocol_name, [])
+
+    def get_current_block_number(self, protocol_name: str) -> int:
+        """
+        Get the current block number, from the block clock when one is running
+        :param protocol_name:
+        :return:
+        """
+        if self.block_clock is not None and self.block_clock.block_number is not None:
+            return self.block_clock.block_number
+
+        return self.lending_pool_interfaces[protocol_name].provider.w3.eth.get_block_number()
+
+    def get_accounts_to_search(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            refresh: bool = False,
+            block_number: Optional[int] = None
+    ) -> List[str]:
+        """
+        Get the addresses of the accounts to search for a given search type. With a shard coordinator, only the accounts
+        of the shards this searcher owns are returned
+
+        :param protocol_name:
+        :param search_type:
+        :param refresh: Refresh the borrows data before reading recent borrowers
+        :param block_number: Block the search runs at, used by SearchTypes.TIERED
+        :return: List of account addresses
+        """
+        account_addresses = self.__get_accounts_to_search(protocol_name, search_type, refresh, block_number)
+        return self.filter_owned_accounts(protocol_name, account_addresses)
+
+    def filter_owned_accounts(self, protocol_name: str, account_addresses: List[str]) -> List[str]:
+        """
+        Keep the accounts of the shards this searcher owns
+
+        :param protocol_name:
+        :param account_addresses:
+        :return: Account addresses, all of them if the protocol has no shard coordinator
+        """
+        shard_coordinator = self.shard_coordinators.get(protocol_name)
+        if shard_coordinator is None:
+            return account_addresses
+
+        return shard_coordinator.filter_accounts(account_addresses)
+
+    def pop_acquired_accounts(self, protocol_name: str) -> List[str]:
+        """
+        Get the recent borrowers of the shards this searcher took over since the last call
+
+        :param protocol_name:
+        :return: Account addresses
+        """
+        shard_coordinator = self.shard_coordinators.get(protocol_name)
+        if shard_coordinator is None:
+            return []
+
+        acquired_shards = shard_coordinator.pop_acquired_shards()
+        if not acquired_shards:
+            return []
+
+        return [
+            account['account_address'] for account in self.lending_pool_interfaces[protocol_name].recent_borrowers
+            if get_account_shard(account['account_address'], shard_coordinator.num_shards) in acquired_shards
+        ]
+
+    def __get_accounts_to_search(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            refresh: bool = False,
+            block_number: Optional[int] = None
+    ) -> List[str]:
+        if search_type == SearchTypes.RECENT_BORROWS:
+            if refresh:
+                # Refresh the borrows data
+                self.lending_pool_interfaces[protocol_name].refresh_contract_data(blocking=False)
+            accounts = self.lending_pool_interfaces[protocol_name].recent_borrowers
+        elif search_type == SearchTypes.FROM_RECORDS:
+            return [
+                account_address
+                for account_addresses in self.get_account_address_batches_from_mongo(protocol_name)
+                for account_address in account_addresses
+            ]
+        elif search_type == SearchTypes.OFF_CHAIN_HEALTH_FACTOR:
+            return self.health_factor_engines[protocol_name].get_tracked_accounts()
+        elif search_type == SearchTypes.TIERED:
+            return self.get_scheduled_accounts(protocol_name, refresh=refresh, block_number=block_number)
+        elif search_type == SearchTypes.PRICE_TRIGGERED:
+            return list(self.liquidation_price_indexes[protocol_name].account_triggers.keys())
+        elif search_type == SearchTypes.DIRTY_ACCOUNTS:
+            dirty_account_tracker = self.dirty_account_trackers[protocol_name]
+            if dirty_account_tracker.last_processed_block is None:
+                # Every known borrower is scanned once before only changed accounts are
+                if refresh:
+                    self.lending_pool_interfaces[protocol_name].refresh_contract_data(blocking=False)
+                dirty_account_tracker.poll(block_number)
+                dirty_account_tracker.pop_dirty_accounts()
+                self.pop_discovered_borrowers(protocol_name)
+                self.pop_acquired_accounts(protocol_name)
+                accounts = self.lending_pool_interfaces[protocol_name].recent_borrowers
+            else:
+                return self.get_changed_accounts(protocol_name, block_number)
+        else:
+            raise ValueError(f"Invalid search type: {search_type}")
+
+        return [account['account_address'] for account in accounts]
+
+    def get_scheduled_accounts(
+            self,
+            protocol_name: str,
+            refresh: bool = False,
+            block_number: Optional[int] = None
+    ) -> List[str]:
+        """
+        Get the accounts the protocol's scan scheduler has due at a block. New borrowers are scheduled right away,
+        the assets of scheduled accounts are synced, and the prices of every tracked asset are fed to the scheduler so
+        moves bring exposed accounts forward.
+
+        :param protocol_name:
+        :param refresh: Refresh the borrows data before scheduling recent borrowers
+        :param block_number: Block to get the due accounts for, defaults to the current block
+        :return: List of account addresses
+        """
+        scan_scheduler = self.scan_schedulers[protocol_name]
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        if refresh or scan_scheduler.schedule.empty:
+            if refresh:
+                self.lending_pool_interfaces[protocol_name].refresh_contract_data(blocking=False)
+            recent_borrowers = self.lending_pool_interfaces[protocol_name].recent_borrowers
+            scan_scheduler.add_accounts([account['account_address'] for account in recent_borrowers], block_number)
+        scan_scheduler.add_accounts(self.pop_discovered_borrowers(protocol_name), block_number)
+        self.sync_scan_scheduler_assets(protocol_name, block_number)
+
+        tracked_assets = scan_scheduler.get_tracked_assets()
+        if tracked_assets and self.oracle_interface is not None:
+            self.oracle_interface.refresh_price_cache(tracked_assets, block_number=block_number)
+            scan_scheduler.update_prices(
+                {
+                    asset_address: self.oracle_interface.price_cache[asset_address]
+                    for asset_address in tracked_assets
+                    if asset_address in self.oracle_interface.price_cache
+                },
+                block_number
+            )
+
+        return scan_scheduler.get_due_accounts(block_number)
+
+    def get_changed_accounts(self, protocol_name: str, block_number: Optional[int] = None) -> Optional[List[str]]:
+        """
+        Get the accounts whose position changed since the last call, from the protocol's dirty account tracker
+
+        :param protocol_name:
+        :param block_number: Block to read events up to, defaults to the current block
+        :return: Account addresses, or None if the protocol has no dirty account tracker
+        """
+        dirty_account_tracker = self.dirty_account_trackers.get(protocol_name)
+        if dirty_account_tracker is None:
+            return None
+
+        # Borrowers found by a discovery that finished after the first scan were never fetched
+        dirty_account_tracker.mark_dirty(self.pop_discovered_borrowers(protocol_name), block_number)
+        # Accounts of shards taken over from another searcher were never fetched by this one
+        dirty_account_tracker.mark_dirty(self.pop_acquired_accounts(protocol_name), block_number)
+        dirty_account_tracker.poll(block_number)
+        return self.filter_owned_accounts(protocol_name, dirty_account_tracker.pop_dirty_accounts())
+
+    def drop_closed_accounts(self, protocol_name: str, user_accounts: pandas.DataFrame):
+        """
+        Stop tracking accounts whose debt reached zero. They are found again if they borrow again
+
+        :param protocol_name:
+        :param user_accounts: User account data dataframe
+        """
+        if protocol_name not in self.dirty_account_trackers or user_accounts.empty:
+            return
+
+        closed_addresses = user_accounts[user_accounts['total_debt_eth'] == 0]['account_address'].to_list()
+        if not closed_addresses:
+            return
+
+        self.logger.info(f"Dropping {len(closed_addresses)} accounts without debt")
+        self.lending_pool_interfaces[protocol_name].remove_borrowers(closed_addresses)
+        if protocol_name in self.health_factor_engines:
+            self.health_factor_engines[protocol_name].drop_accounts(closed_addresses)
+        if protocol_name in self.scan_schedulers:
+            self.scan_schedulers[protocol_name].drop_accounts(closed_addresses)
+        if protocol_name in self.liquidation_price_indexes:
+            self.liquidation_price_indexes[protocol_name].drop_accounts(closed_addresses)
+
     def get_user_account_data_from_protocol(
             self,
             protocol_name: str,
-            search_type: SearchTypes
+            search_type: SearchTypes,
+            block_number: Optional[int] = None
     ) -> pandas.DataFrame:
         """
         Get user account data from a lending protocol
 
         :param protocol_name:
         :param search_type:
+        :param block_number: Block to pin the account reads to, defaults to the current block
         :return:
         """
         self.logger.info(f"Getting user account data from protocol: {protocol_name} from {search_type.name}")
-        if search_type == SearchTypes.RECENT_BORROWS:
-            # Refresh the borrows data
-            self.lending_pool_interfaces[protocol_name].refresh_contract_data()
-            accounts = self.lending_pool_interfaces[protocol_name].recent_borrowers
-        elif search_type == SearchTypes.FROM_RECORDS:
-            accounts = self.get_user_account_positions_from_mongo(protocol_name).to_records()
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        if search_type == SearchTypes.FROM_RECORDS:
+            return self.get_user_account_data_from_records(protocol_name, block_number=block_number)
+
+        account_addresses = self.get_accounts_to_search(
+            protocol_name,
+            search_type,
+            refresh=True,
+            block_number=block_number
+        )
+
+        self.logger.info(f"Found {len(account_addresses)} accounts to search")
+
+        df = self.get_user_account_data_for_accounts(
+            protocol_name,
+            search_type,
+            account_addresses,
+            block_number=block_number
+        )
+
+        if search_type == SearchTypes.TIERED:
+            self.scan_schedulers[protocol_name].update_accounts(df, block_number)
+
+        # Push the account data to the data manager
+        self.logger.info(f"Pushing {len(df)} user account data to the data manager")
+        self.redis_interface.push_item(QueueType.DATA_MANAGER_QUEUE, df)
+        self.logger.info(f"Pushed {len(df)} user account data to the data manager")
+
+        return df
+
+    def get_user_account_data_from_records(
+            self,
+            protocol_name: str,
+            block_number: Optional[int] = None,
+            hf_threshold: Optional[float] = None
+    ) -> pandas.DataFrame:
+        """
+        Get user account data for the stored accounts of a lending protocol, lowest stored health factor first. Stored
+        accounts are read, fetched and pushed to the data manager one batch at a time
+
+        :param protocol_name:
+        :param block_number: Block to pin the account reads to, defaults to the current block
+        :param hf_threshold: Keep only the accounts with a health factor below it, so at most the candidates of every
+            batch are held in memory. Defaults to keeping every account
+        :return:
+        """
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        num_accounts = 0
+        dfs = []
+        for account_addresses in self.get_account_address_batches_from_mongo(protocol_name):
+            account_addresses = self.filter_owned_accounts(protocol_name, account_addresses)
+            if not account_addresses:
+                continue
+
+            df = self.get_user_account_data_for_accounts(
+                protocol_name,
+                SearchTypes.FROM_RECORDS,
+                account_addresses,
+                block_number=block_number
+            )
+            self.redis_interface.push_item(QueueType.DATA_MANAGER_QUEUE, df)
+            num_accounts += len(df)
+
+            if hf_threshold is not None:
+                df = df[df['health_factor'] < hf_threshold]
+            if not df.empty:
+                dfs.append(df)
+
+        self.logger.info(f"Pushed {num_accounts} user account data to the data manager")
+
+        if not dfs:
+            return self.to_user_account_data_df(protocol_name, SearchTypes.FROM_RECORDS, [], [], block_number)
+
+        return pandas.concat(dfs, ignore_index=True)
+
+    def get_user_account_data_for_accounts(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            account_addresses: List[str],
+            block_number: Optional[int] = None
+    ) -> pandas.DataFrame:
+        """
+        Get user account data for the given accounts from a lending protocol
+
+        :param protocol_name:
+        :param search_type:
+        :param account_addresses: Accounts to fetch account data for
+        :param block_number: Block to pin the account reads to, defaults to the current block
+        :return:
+        """
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        if self.multicall_interface is not None:
+            account_data_list = self.lending_pool_interfaces[protocol_name].get_user_account_data_batch(
+                account_addresses,
+                multicall_interface=self.multicall_interface,
+                block_identifier=block_number,
+                batch_size=self.multicall_batch_size
+            )
         else:
-            raise ValueError(f"Invalid search type: {search_type}")
+            account_data_list = [
+                self.lending_pool_interfaces[protocol_name].get_user_account_data(
+                    account_address,
+                    block_identifier=block_number
+                )
+                for account_address in account_addresses
+            ]
+
+        df = self.to_user_account_data_df(
+            protocol_name,
+            search_type,
+            account_addresses,
+            account_data_list,
+            block_number=block_number
+        )
+        self.drop_closed_accounts(protocol_name, df)
 
-        self.logger.info(f"Found {len(accounts)} accounts to search")
+        return df
+
+    def to_user_account_data_df(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            account_addresses: List[str],
+            account_data_list: List[Optional[List]],
+            block_number: Optional[int] = None
+    ) -> pandas.DataFrame:
+        """
+        Convert raw getUserAccountData results to a user account data dataframe
 
+        :param protocol_name:
+        :param search_type:
+        :param account_addresses: Account addresses
+        :param account_data_list: Raw account data in the same order as account_addresses, None for failed calls
+        :param block_number: Block the account data was read at
+        :return:
+        """
         user_account_data_list = []
-        for account in accounts:
-            account_address = account['account_address']
-            account_data = self.lending_pool_interfaces[protocol_name].get_user_account_data(account_address)
+        for account_address, account_data in zip(account_addresses, account_data_list):
             if account_data:
                 user_account_data = UserAccountDataViewSchema().load({
                     "account_address": account_address,
@@ -110,49 +543,94 @@ class Searcher:
                     "current_liquidation_threshold": account_data[3],
                     "current_ltv": account_data[4],
                     "health_factor": account_data[5],
-                    "protocol_name": protocol_name
+                    "protocol_name": protocol_name,
+                    "block_number": block_number
                 })
                 self.logger.info(f"User account data - {search_type.name}: {user_account_data}")
 
                 user_account_data_list.append(user_account_data)
 
-        df = pandas.DataFrame.from_records(user_account_data_list)
+        df = pandas.DataFrame.from_records(
+            user_account_data_list,
+            columns=list(UserAccountDataViewSchema().fields.keys())
+        )
         df = df.drop_duplicates(subset=['account_address', 'protocol_name'], keep='last')
 
-        # Push the account data to the data manager
-        self.logger.info(f"Pushing {len(df)} user account data to the data manager")
-        self.redis_interface.push_item(QueueType.DATA_MANAGER_QUEUE, df)
-        self.logger.info(f"Pushed {len(df)} user account data to the data manager")
-
         return df
 
     def get_user_reserve_data_from_protocol(
             self,
             protocol_name: str,
-            search_type: SearchTypes
+            search_type: SearchTypes,
+            account_addresses: Optional[List[str]] = None,
+            block_number: Optional[int] = None
     ) -> pandas.DataFrame:
         """
         Get user reserve data from a lending protocol
 
         :param protocol_name:
         :param search_type:
+        :param account_addresses: Accounts to fetch reserves for. If not set, accounts are taken from the search type
+        :param block_number: Block to pin the reserve reads to, defaults to the current block
         :return:
         """
         self.logger.info(f"Getting user reserve data from protocol: {protocol_name} from {search_type.name}")
-        if search_type == SearchTypes.RECENT_BORROWS:
-            accounts = self.lending_pool_interfaces[protocol_name].recent_borrowers
-        elif search_type == SearchTypes.FROM_RECORDS:
-            accounts = self.get_user_account_positions_from_mongo(protocol_name).to_records()
+        if account_addresses is None:
+            account_addresses = self.get_accounts_to_search(protocol_name, search_type)
+
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        if self.multicall_interface is not None:
+            reserve_data_list = self.ui_pool_data_interfaces[protocol_name].get_user_reserves_data_batch(
+                account_addresses,
+                multicall_interface=self.multicall_interface,
+                block_identifier=block_number,
+                batch_size=self.reserves_batch_size,
+                max_concurrent_requests=self.max_concurrent_requests
+            )
         else:
-            raise ValueError(f"Invalid search type: {search_type}")
+            reserve_data_list = [
+                self.ui_pool_data_interfaces[protocol_name].get_user_reserves_data(
+                    account_address,
+                    block_identifier=block_number
+                )
+                for account_address in account_addresses
+            ]
 
+        return self.to_user_reserve_data_df(
+            protocol_name,
+            search_type,
+            account_addresses,
+            reserve_data_list,
+            block_number=block_number
+        )
+
+    def to_user_reserve_data_df(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes,
+            account_addresses: List[str],
+            reserve_data_list: List[Optional[List]],
+            block_number: Optional[int] = None
+    ) -> pandas.DataFrame:
+        """
+        Convert raw getUserReservesData results to a user reserve data dataframe
+
+        :param protocol_name:
+        :param search_type:
+        :param account_addresses: Account addresses
+        :param reserve_data_list: Raw reserves data in the same order as account_addresses, None for failed calls
+        :param block_number: Block the reserves data was read at
+        :return:
+        """
         user_reserve_data_list = []
-        for account in accounts:
-            account_address = account['account_address']
-            reserve_data = self.ui_pool_data_interfaces[protocol_name].get_user_reserves_data(account_address)[0]
+        for account_address, reserve_data in zip(account_addresses, reserve_data_list):
+            if reserve_data is None:
+                continue
 
             account_reserves = []
-            for reserve in reserve_data:
+            for reserve in reserve_data[0]:
                 user_reserve_data = {
                     "underlying_asset": reserve[0],
                     "scaled_a_token_balance": reserve[1],
@@ -169,11 +647,15 @@ class Searcher:
             account_reserves_record = UserAccountReservesDataViewSchema().load({
                 "account_address": account_address,
                 "reserves": account_reserves,
-                "protocol_name": protocol_name
+                "protocol_name": protocol_name,
+                "block_number": block_number
             })
             user_reserve_data_list.append(account_reserves_record)
 
-        df = pandas.DataFrame.from_records(user_reserve_data_list)
+        df = pandas.DataFrame.from_records(
+            user_reserve_data_list,
+            columns=list(UserAccountReservesDataViewSchema().fields.keys())
+        )
         df = df.drop_duplicates(subset=['account_address', 'protocol_name'], keep='last')
 
         return df
@@ -191,12 +673,40 @@ class Searcher:
         df = pandas.DataFrame.from_records(records_list)
         return df
 
+    def get_account_address_batches_from_mongo(self, protocol_name: str) -> Iterator[List[str]]:
+        """
+        Stream the stored account addresses of a lending protocol in batches, lowest stored health factor first. The
+        scan walks the health factor indexes the DataManager creates and only reads addresses. With a shard
+        coordinator, only the records of the owned shards and the records not sharded yet are read
+
+        :param protocol_name:
+        :return: Iterator of account address lists
+        """
+        query = {'protocol_name': protocol_name}
+        shard_coordinator = self.shard_coordinators.get(protocol_name)
+        # Records are sharded out of DEFAULT_NUM_SHARDS, other shard counts are filtered on this side only
+        if shard_coordinator is not None and shard_coordinator.num_shards == DEFAULT_NUM_SHARDS:
+            query['$or'] = [
+                {ACCOUNT_RECORD_SHARD_FIELD: {'$in': sorted(shard_coordinator.owned_shards)}},
+                {ACCOUNT_RECORD_SHARD_FIELD: {'$exists': False}}
+            ]
+
+        for records in self.mongo_interface.find_batches(
+                collection=ACCOUNT_POSITIONS_COLLECTION,
+                query=query,
+                projection={'_id': 0, 'account_address': 1},
+                sort=[('health_factor', 1)],
+                batch_size=self.records_batch_size
+        ):
+            yield [record['account_address'] for record in records]
+
     def check_for_liquidations(
             self,
             protocol_name: str,
             search_type: SearchTypes = SearchTypes.RECENT_BORROWS,
             hf_threshold: float = 1.00,
             collateral_threshold: float = 1.00,
+            block_number: Optional[int] = None
     ) -> pandas.DataFrame:
         """
         Check for liquidations
@@ -205,23 +715,56 @@ class Searcher:
         :param collateral_threshold: Amount of collateral to check for liquidations
         :param hf_threshold: Health factor threshold to check for liquidations
         :param search_type: Type of search to perform
+        :param block_number: Block to run the check at, defaults to the current block
         :return: Dataframe of positions available for liquidation
         """
         self.logger.info(f"Checking for liquidations for protocol: {protocol_name} from {search_type.name}")
-        df_user_accounts: pandas.DataFrame = self.get_user_account_data_from_protocol(protocol_name, search_type)
-        df_user_reserves: pandas.DataFrame = self.get_user_reserve_data_from_protocol(protocol_name, search_type)
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
 
-        df = df_user_accounts.merge(
-            df_user_reserves,
-            on=['account_address', 'protocol_name'],
-            how='inner'
+        if search_type == SearchTypes.OFF_CHAIN_HEALTH_FACTOR:
+            return self.check_for_liquidations_off_chain(protocol_name, hf_threshold, block_number=block_number)
+        if search_type == SearchTypes.PRICE_TRIGGERED:
+            return self.check_for_liquidations_price_triggered(protocol_name, hf_threshold, block_number=block_number)
+
+        if search_type == SearchTypes.FROM_RECORDS:
+            # Filtered batch by batch, the stored accounts are never held in memory all at once
+            df_user_accounts: pandas.DataFrame = self.get_user_account_data_from_records(
+                protocol_name,
+                block_number=block_number,
+                hf_threshold=hf_threshold
+            )
+        else:
+            df_user_accounts: pandas.DataFrame = self.get_user_account_data_from_protocol(
+                protocol_name,
+                search_type,
+                block_number=block_number
+            )
+
+        # Only fetch reserves for accounts that passed the health factor filter
+        df_user_accounts = df_user_accounts[(df_user_accounts['health_factor'] < hf_threshold)]
+        df_user_reserves: pandas.DataFrame = self.get_user_reserve_data_from_protocol(
+            protocol_name,
+            search_type,
+            account_addresses=df_user_accounts['account_address'].to_list(),
+            block_number=block_number
         )
 
         # liquidation_avail_positions = df[
         #     (df['health_factor'] < hf_threshold) & (df['total_collateral_eth'] > collateral_threshold)
         #     ]
 
-        liquidation_avail_positions = df[(df['health_factor'] < hf_threshold)]
+        liquidation_avail_positions = df_user_accounts.merge(
+            df_user_reserves,
+            on=['account_address', 'protocol_name', 'block_number'],
+            how='inner'
+        )
+
+        if protocol_name in self.health_factor_engines:
+            self.health_factor_engines[protocol_name].update_positions(df_user_reserves)
+
+        if search_type == SearchTypes.TIERED:
+            self.scan_schedulers[protocol_name].update_account_assets(df_user_reserves, block_number)
 
         if liquidation_avail_positions.empty:
             logger.info("No positions available for liquidation")
@@ -230,83 +773,340 @@ class Searcher:
 
         return liquidation_avail_positions
 
-    def to_liquidation_params(self, user_account_data: pandas.DataFrame) -> pandas.DataFrame:
+    def sync_scan_scheduler_assets(self, protocol_name: str, block_number: Optional[int] = None):
         """
-        Apply liquidation parameters to user account data
+        Load the assets of the scheduled accounts that were never synced or not recently into the protocol's scan
+        scheduler. The reserves of healthy accounts are otherwise never read, so their exposure to price moves would
+        stay unknown
 
-        :param user_account_data:
-        :return:
+        :param protocol_name:
+        :param block_number: Block to read the reserves at, defaults to the current block
+        """
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        scan_scheduler = self.scan_schedulers[protocol_name]
+        account_addresses = scan_scheduler.get_accounts_to_sync_assets(block_number)
+        if not account_addresses:
+            return
+
+        self.logger.info(f"Syncing the assets of {len(account_addresses)} scheduled accounts for {protocol_name}")
+        df_user_reserves = self.get_user_reserve_data_from_protocol(
+            protocol_name,
+            SearchTypes.TIERED,
+            account_addresses=account_addresses,
+            block_number=block_number
+        )
+        scan_scheduler.update_account_assets(df_user_reserves, block_number)
+
+    def sync_health_factor_engine(
+            self,
+            protocol_name: str,
+            search_type: SearchTypes = SearchTypes.RECENT_BORROWS
+    ):
         """
-        liquidation_params = []
+        Load the reserves of every account of a search type into the protocol's health factor engine
 
-        account_address = user_account_data['account_address']
-        protocol_name = user_account_data['protocol_name']
+        :param protocol_name:
+        :param search_type: Search type the accounts to track are taken from
+        """
+        self.logger.info(f"Syncing health factor engine for protocol: {protocol_name} from {search_type.name}")
+        account_addresses = self.get_accounts_to_search(protocol_name, search_type, refresh=True)
+        df_user_reserves = self.get_user_reserve_data_from_protocol(
+            protocol_name,
+            search_type,
+            account_addresses=account_addresses
+        )
+        self.health_factor_engines[protocol_name].update_positions(df_user_reserves)
+
+    def check_for_liquidations_off_chain(
+            self,
+            protocol_name: str,
+            hf_threshold: float = 1.00,
+            block_number: Optional[int] = None
+    ) -> pandas.DataFrame:
+        """
+        Check for liquidations with the off-chain health factor engine. Health factors of every tracked account are
+        computed locally, and only the accounts near or below 1.0 are confirmed on-chain.
 
-        user_reserve_data = user_account_data['reserves']
-        if user_account_data['health_factor'] < CLOSE_FACTOR_HF_THRESHOLD:
-            collateral_close_factor = MAX_LIQUIDATION_PERCENT
+        :param protocol_name: Protocol name to check for liquidations
+        :param hf_threshold: Health factor threshold to check for liquidations
+        :param block_number: Block to run the check at, defaults to the current block
+        :return: Dataframe of positions available for liquidation
+        """
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        search_type = SearchTypes.OFF_CHAIN_HEALTH_FACTOR
+        health_factor_engine = self.health_factor_engines[protocol_name]
+        if not health_factor_engine.get_tracked_accounts():
+            self.sync_health_factor_engine(protocol_name)
+
+        # Reload the positions that changed since the last check
+        changed_addresses = self.get_changed_accounts(protocol_name, block_number)
+        if changed_addresses:
+            health_factor_engine.update_positions(self.get_user_reserve_data_from_protocol(
+                protocol_name,
+                search_type,
+                account_addresses=changed_addresses,
+                block_number=block_number
+            ))
+
+        health_factor_engine.update_reserves(
+            self.ui_pool_data_interfaces[protocol_name].get_reserves_data(block_identifier=block_number)
+        )
+        health_factor_engine.compute_health_factors()
+        # Accounts of shards moved to another searcher may still be tracked
+        candidate_addresses = self.filter_owned_accounts(
+            protocol_name,
+            health_factor_engine.get_candidates(hf_margin=self.hf_margin)
+        )
+        self.logger.info(f"Off-chain health factor engine found {len(candidate_addresses)} candidates")
+
+        # Confirm the candidates on-chain before anything is pushed to the liquidator
+        df_user_accounts = self.get_user_account_data_for_accounts(
+            protocol_name,
+            search_type,
+            candidate_addresses,
+            block_number=block_number
+        )
+        self.redis_interface.push_item(QueueType.DATA_MANAGER_QUEUE, df_user_accounts)
+
+        df_user_accounts = df_user_accounts[(df_user_accounts['health_factor'] < hf_threshold)]
+        df_user_reserves = self.get_user_reserve_data_from_protocol(
+            protocol_name,
+            search_type,
+            account_addresses=candidate_addresses,
+            block_number=block_number
+        )
+        health_factor_engine.update_positions(df_user_reserves)
+
+        liquidation_avail_positions = df_user_accounts.merge(
+            df_user_reserves,
+            on=['account_address', 'protocol_name', 'block_number'],
+            how='inner'
+        )
+
+        if liquidation_avail_positions.empty:
+            logger.info("No positions available for liquidation")
         else:
-            collateral_close_factor = DEFAULT_LIQUIDATION_PERCENT
-
-        collateral_assets = []
-        deb_assets = []
-        for reserve in user_reserve_data:
-            if reserve['usage_as_collateral_enabled'] is True:
-                collateral_assets.append({
-                    "asset": reserve['underlying_asset'], "supplied": reserve['scaled_a_token_balance']
-                })
-            if reserve['scaled_variable_debt'] > 0 or reserve['principal_stable_debt'] > 0:
-                debt = reserve['scaled_variable_debt'] + reserve['principal_stable_debt']
-                deb_assets.append(
-                    {
-                        "asset": reserve['underlying_asset'],
-                        "debt": debt
-                    }
-                )
+            logger.info(f"Positions available for liquidation: {liquidation_avail_positions}")
+
+        return liquidation_avail_positions
+
+    def on_price_update(self, asset_prices: Dict[str, float], block_number: int):
+        """
+        Oracle price listener. Queues moved prices for the next price triggered check of every protocol
+
+        :param asset_prices: New prices keyed by asset address
+        :param block_number: Block the prices were read at
+        """
+        for pending_price_updates in self.pending_price_updates.values():
+            pending_price_updates.update(asset_prices)
+
+    def index_liquidation_prices(
+            self,
+            protocol_name: str,
+            block_number: int,
+            account_addresses: Optional[List[str]] = None
+    ):
+        """
+        Recompute the liquidation prices of tracked accounts from the health factor engine
+
+        :param protocol_name:
+        :param block_number: Block to read the reserve state and prices at
+        :param account_addresses: Accounts to reindex, defaults to every tracked account
+        """
+        health_factor_engine = self.health_factor_engines[protocol_name]
+        liquidation_price_index = self.liquidation_price_indexes[protocol_name]
+
+        health_factor_engine.update_reserves(
+            self.ui_pool_data_interfaces[protocol_name].get_reserves_data(block_identifier=block_number)
+        )
+        self.oracle_interface.refresh_price_cache(
+            health_factor_engine.positions['underlying_asset'].unique().tolist(),
+            block_number=block_number
+        )
 
-        for collateral_asset in collateral_assets:
-            collateral_price_usd = self.oracle_interface.get_asset_price_usd(collateral_asset['asset'])
-            collateral_value_usd = collateral_asset['supplied'] * collateral_price_usd
-            if collateral_value_usd > 0:
-                for debt_asset in deb_assets:
-                    debt_price_usd = self.oracle_interface.get_asset_price_usd(debt_asset['asset'])
-                    debt_value_usd = debt_asset['debt'] * debt_price_usd
-                    if collateral_asset['asset'] == debt_asset['asset']:
-                        debt_to_cover = debt_asset['debt'] * collateral_close_factor
-                        liquidation_param = {
-                            "collateral_asset": collateral_asset['asset'],
-                            "debt_asset": debt_asset['asset'],
-                            "user": account_address,
-                            "debt_to_cover": debt_to_cover,
-                            "receive_a_token": False,
-                            "protocol_name": protocol_name
-                        }
-                        liquidation_params.append(liquidation_param)
-
-                        # Put new entry into the queue
-                        self.logger.info(f"Adding liquidation param to queue: {liquidation_param}")
-                        self.redis_interface.push_item(queue_type=QueueType.LIQUIDATOR_QUEUE, value=liquidation_param)
-                        self.logger.info(f"Added liquidation param to queue: {liquidation_param}")
-                    elif debt_asset['debt'] > 0 and collateral_value_usd > debt_value_usd:
-                        debt_to_cover = debt_asset['debt'] * collateral_close_factor
-                        liquidation_param = {
-                            "collateral_asset": collateral_asset['asset'],
-                            "debt_asset": debt_asset['asset'],
-                            "user": account_address,
-                            "debt_to_cover": debt_to_cover,
-                            "receive_a_token": False,
-                            "protocol_name": protocol_name
-                        }
-                        liquidation_params.append(liquidation_param)
-
-                        # Put new entry into the queue
-                        self.logger.info(f"Adding liquidation param to queue: {liquidation_param}")
-                        #self.liquidations_queue.put(liquidation_param)
-                        self.redis_interface.push_item(queue_type=QueueType.LIQUIDATOR_QUEUE, value=liquidation_param)
-                        self.logger.info(f"Added liquidation param to queue: {liquidation_param}")
-
-        liquidation_params_pd = pandas.DataFrame.from_records(liquidation_params)
-        return liquidation_params_pd
+        position_values = health_factor_engine.compute_position_values()
+        if account_addresses is not None:
+            liquidation_price_index.drop_accounts(account_addresses)
+            position_values = position_values[position_values['account_address'].isin(account_addresses)]
+
+        liquidation_price_index.update_positions(position_values, self.oracle_interface.price_cache)
+        self.logger.info(f"Indexed liquidation prices of {len(liquidation_price_index)} accounts")
+
+    def check_for_liquidations_price_triggered(
+            self,
+            protocol_name: str,
+            hf_threshold: float = 1.00,
+            block_number: Optional[int] = None
+    ) -> pandas.DataFrame:
+        """
+        Check for liquidations with the liquidation price index. Only the accounts whose liquidation price was crossed
+        by a price move since the last check are confirmed on-chain, so the work per move does not grow with the
+        number of tracked positions.
+
+        :param protocol_name: Protocol name to check for liquidations
+        :param hf_threshold: Health factor threshold to check for liquidations
+        :param block_number: Block to run the check at, defaults to the current block
+        :return: Dataframe of positions available for liquidation
+        """
+        search_type = SearchTypes.PRICE_TRIGGERED
+        if block_number is None:
+            block_number = self.get_current_block_number(protocol_name)
+
+        health_factor_engine = self.health_factor_engines[protocol_name]
+        liquidation_price_index = self.liquidation_price_indexes[protocol_name]
+        recent_borrowers = self.lending_pool_interfaces[protocol_name].recent_borrowers
+        if not health_factor_engine.get_tracked_accounts():
+            self.sync_health_factor_engine(protocol_name)
+            self.indexed_borrower_counts[protocol_name] = len(recent_borrowers)
+        if not len(liquidation_price_index) and not liquidation_price_index.liquidatable_accounts:
+            self.index_liquidation_prices(protocol_name, block_number)
+
+        # Accounts that changed, or borrowers found since the last check without a dirty account tracker, are
+        # reloaded and reindexed before prices are checked
+        changed_addresses = self.get_changed_accounts(protocol_name, block_number)
+        if changed_addresses is None:
+            self.lending_pool_interfaces[protocol_name].refresh_contract_data(blocking=False)
+            changed_addresses = self.filter_owned_accounts(protocol_name, [
+                borrower['account_address']
+                for borrower in recent_borrowers[self.indexed_borrower_counts.get(protocol_name, 0):]
+            ])
+            self.indexed_borrower_counts[protocol_name] = len(recent_borrowers)
+        if changed_addresses:
+            health_factor_engine.update_positions(self.get_user_reserve_data_from_protocol(
+                protocol_name,
+                search_type,
+                account_addresses=changed_addresses,
+                block_number=block_number
+            ))
+            self.index_liquidation_prices(protocol_name, block_number, account_addresses=changed_addresses)
+
+        # Price moves reach on_price_update through the oracle price listener. Chainlink AnswerUpdated events since
+        # the last check are read first, the oracle read covers assets priced from other sources
+        tracked_assets = list(liquidation_price_index.triggers.keys())
+        from_block = self.price_feed_blocks.get(protocol_name, block_number - 1) + 1
+        if from_block <= block_number:
+            try:
+                self.oracle_interface.get_price_feed_updates(tracked_assets, from_block, block_number)
+            except Exception as e:
+                self.logger.error(f"Failed to read price feed updates in blocks {from_block}-{block_number}: {e}")
+            self.price_feed_blocks[protocol_name] = block_number
+        self.oracle_interface.refresh_price_cache(tracked_assets, block_number=block_number)
+        price_updates = self.pending_price_updates[protocol_name]
+        self.pending_price_updates[protocol_name] = {}
+
+        # Triggers of the exposed accounts assumed the old prices, a combined move of several assets could liquidate
+        # them without crossing any. Reindexed at the new prices, the liquidatable ones are returned by on_price_update
+        exposed_addresses = liquidation_price_index.get_exposed_accounts(list(price_updates.keys()))
+        if exposed_addresses:
+            self.index_liquidation_prices(protocol_name, block_number, account_addresses=exposed_addresses)
+
+        crossed_addresses = self.filter_owned_accounts(
+            protocol_name,
+            liquidation_price_index.on_price_update(price_updates)
+        )
+        if not crossed_addresses:
+            return pandas.DataFrame()
+
+        # Confirm the crossed accounts on-chain before anything is pushed to the liquidator
+        df_user_accounts = self.get_user_account_data_for_accounts(
+            protocol_name,
+            search_type,
+            crossed_addresses,
+            block_number=block_number
+        )
+        self.redis_interface.push_item(QueueType.DATA_MANAGER_QUEUE, df_user_accounts)
+
+        df_user_accounts = df_user_accounts[(df_user_accounts['health_factor'] < hf_threshold)]
+        df_user_reserves = self.get_user_reserve_data_from_protocol(
+            protocol_name,
+            search_type,
+            account_addresses=crossed_addresses,
+            block_number=block_number
+        )
+        health_factor_engine.update_positions(df_user_reserves)
+        self.index_liquidation_prices(protocol_name, block_number, account_addresses=crossed_addresses)
+
+        liquidation_avail_positions = df_user_accounts.merge(
+            df_user_reserves,
+            on=['account_address', 'protocol_name', 'block_number'],
+            how='inner'
+        )
+
+        if liquidation_avail_positions.empty:
+            logger.info("No positions available for liquidation")
+        else:
+            logger.info(f"Positions available for liquidation: {liquidation_avail_positions}")
+
+        return liquidation_avail_positions
+
+    def prefill_asset_prices(self, positions: pandas.DataFrame):
+        """
+        Price every reserve asset of the positions once for the current block
+
+        :param positions: Dataframe of user positions with a 'reserves' column
+        """
+        asset_addresses = [
+            reserve['underlying_asset'] for reserves in positions.get('reserves', []) for reserve in reserves
+        ] + [WETH_ADDRESS]
+        block_number = None
+        if 'block_number' in positions and positions['block_number'].notna().any():
+            block_number = int(positions['block_number'].max())
+
+        self.oracle_interface.refresh_price_cache(asset_addresses, block_number=block_number)
+
+    def get_asset_price_usd(self, asset_address: str) -> float:
+        """
+        Get asset price in USD used when building liquidation params
+
+        :param asset_address:
+        :return: Asset price in USD
+        """
+        return self.oracle_interface.get_cached_asset_price_usd(asset_address)
+
+    def get_liquidation_bonuses(self, protocol_name: str) -> Dict[str, float]:
+        """
+        Get the liquidation bonus of every reserve of a protocol, read once from the UI pool data provider
+
+        :param protocol_name:
+        :return: Bonus as a fraction of the covered debt (ex. 0.05), keyed by asset address
+        """
+        if protocol_name not in self.liquidation_bonuses:
+            ui_pool_data_interface = self.ui_pool_data_interfaces.get(protocol_name)
+            if ui_pool_data_interface is None:
+                return {}
+
+            try:
+                reserves_data = ui_pool_data_interface.get_reserves_data()
+            except Exception as e:
+                self.logger.error(f"Failed to get liquidation bonuses for {protocol_name}: {e}")
+                return {}
+
+            self.liquidation_bonuses[protocol_name] = {
+                reserve['underlyingAsset']: max(reserve['reserveLiquidationBonus'] / PERCENTAGE_FACTOR - 1, 0)
+                for reserve in reserves_data
+            }
+
+        return self.liquidation_bonuses[protocol_name]
+
+    def get_liquidation_gas_cost_usd(self) -> float:
+        """
+        Get the gas cost of a liquidation in USD at the current gas price
+        :return: Gas cost, 0 if it cannot be priced
+        """
+        if self.oracle_interface is None:
+            return 0.0
+
+        try:
+            gas_price = self.oracle_interface.provider.w3.eth.gas_price
+        except Exception as e:
+            self.logger.error(f"Failed to get gas price: {e}")
+            return 0.0
+
+        return self.liquidation_gas * gas_price / 10 ** 18 * self.get_asset_price_usd(WETH_ADDRESS)
 
     def create_liquidation_params(
             self,
@@ -320,19 +1120,116 @@ class Searcher:
             - address user, --> user account address
             - uint256 debtToCover, --> debt_to_cover
             - bool receiveAToken --> false
+            - estimated_profit_usd = collateral received with the bonus - debt covered - flash loan premium - gas
+
+        The reserves are exploded into a flat account x asset table and every collateral/debt pair is evaluated in
+        vectorized operations.
 
         :param positions: Dataframe of user positions to create the liquidation params from
         :return: Dataframe of containing liquidation params
         """
         self.logger.info("Creating liquidation params")
-        liquidation_params = positions.apply(
-            self.to_liquidation_params, axis=1
+        liquidation_params_columns = [
+            'collateral_asset', 'debt_asset', 'user', 'debt_to_cover', 'receive_a_token', 'protocol_name',
+            'block_number', 'estimated_profit_usd'
+        ]
+        if positions.empty:
+            self.logger.info("No liquidation params created")
+            return pandas.DataFrame(columns=liquidation_params_columns)
+
+        self.prefill_asset_prices(positions)
+
+        reserves = explode_reserves(
+            positions[['account_address', 'protocol_name', 'health_factor', 'block_number', 'reserves']]
         )
-        if liquidation_params.empty:
+        if reserves.empty:
             self.logger.info("No liquidation params created")
-            return liquidation_params
+            return pandas.DataFrame(columns=liquidation_params_columns)
+
+        asset_prices_usd = {
+            asset_address: self.get_asset_price_usd(asset_address)
+            for asset_address in reserves['underlying_asset'].unique()
+        }
+        reserves['price_usd'] = reserves['underlying_asset'].map(asset_prices_usd).astype(float)
+        reserves['debt'] = reserves['scaled_variable_debt'] + reserves['principal_stable_debt']
 
-        liquidation_params_df = pandas.concat(liquidation_params.to_list())
+        collateral = reserves[reserves['usage_as_collateral_enabled'] == True]  # noqa: E712
+        collateral = pandas.DataFrame({
+            'account_address': collateral['account_address'],
+            'protocol_name': collateral['protocol_name'],
+            'health_factor': collateral['health_factor'],
+            'block_number': collateral['block_number'],
+            'collateral_asset': collateral['underlying_asset'],
+            'collateral_value_usd': collateral['scaled_a_token_balance'] * collateral['price_usd'],
+        })
+        collateral = collateral[collateral['collateral_value_usd'] > 0]
+
+        debt = reserves[(reserves['scaled_variable_debt'] > 0) | (reserves['principal_stable_debt'] > 0)]
+        debt = pandas.DataFrame({
+            'account_address': debt['account_address'],
+            'protocol_name': debt['protocol_name'],
+            'debt_asset': debt['underlying_asset'],
+            'debt': debt['debt'],
+            'debt_value_usd': debt['debt'] * debt['price_usd'],
+        })
+
+        pairs = collateral.merge(debt, on=['account_address', 'protocol_name'], how='inner')
+        pairs = pairs[
+            (pairs['collateral_asset'] == pairs['debt_asset'])
+            | ((pairs['debt'] > 0) & (pairs['collateral_value_usd'] > pairs['debt_value_usd']))
+        ]
+
+        # If account health factor is below the threshold, we will liquidate 100% of the position
+        collateral_close_factor = numpy.where(
+            pairs['health_factor'] < CLOSE_FACTOR_HF_THRESHOLD,
+            MAX_LIQUIDATION_PERCENT,
+            DEFAULT_LIQUIDATION_PERCENT
+        )
+
+        liquidation_bonus = pandas.Series(DEFAULT_LIQUIDATION_BONUS, index=pairs.index)
+        for protocol_name in pairs['protocol_name'].unique():
+            in_protocol = pairs['protocol_name'] == protocol_name
+            liquidation_bonus[in_protocol] = pairs.loc[in_protocol, 'collateral_asset'].map(
+                self.get_liquidation_bonuses(protocol_name)
+            ).fillna(DEFAULT_LIQUIDATION_BONUS)
+
+        gas_cost_usd = self.get_liquidation_gas_cost_usd() if not pairs.empty else 0.0
+
+        # The liquidator receives the covered debt plus the bonus in collateral, at most the whole collateral balance
+        debt_to_cover_usd = pairs['debt_value_usd'] * collateral_close_factor
+        collateral_received_usd = numpy.minimum(
+            debt_to_cover_usd * (1 + liquidation_bonus),
+            pairs['collateral_value_usd']
+        )
+        estimated_profit_usd = (
+            collateral_received_usd
+            - debt_to_cover_usd * (1 + self.flash_loan_premium)
+            - gas_cost_usd
+        )
+
+        liquidation_params_df = pandas.DataFrame({
+            'collateral_asset': pairs['collateral_asset'],
+            'debt_asset': pairs['debt_asset'],
+            'user': pairs['account_address'],
+            'debt_to_cover': pairs['debt'] * collateral_close_factor,
+            'receive_a_token': False,
+            'protocol_name': pairs['protocol_name'],
+            'block_number': pairs['block_number'],
+            'estimated_profit_usd': estimated_profit_usd,
+        }, columns=liquidation_params_columns)
+        liquidation_params_df = liquidation_params_df.sort_values(
+            'estimated_profit_usd', ascending=False
+        ).reset_index(drop=True)
+
+        if liquidation_params_df.empty:
+            self.logger.info("No liquidation params created")
+            return liquidation_params_df
+
+        # Put new entries into the queue, most profitable first
+        for liquidation_param in liquidation_params_df.astype(object).to_dict('records'):
+            self.logger.info(f"Adding liquidation param to queue: {liquidation_param}")
+            self.redis_interface.push_item(queue_type=QueueType.LIQUIDATOR_QUEUE, value=liquidation_param)
+            self.logger.info(f"Added liquidation param to queue: {liquidation_param}")
 
         return liquidation_params_df
 
@@ -343,21 +1240,44 @@ class Searcher:
             run_indefinitely: bool = True
     ):
         """
-        Live search for liquidations return parameters for liquidations
+        Live search for liquidations return parameters for liquidations. With a block clock, one scan runs per new
+        block and every result is tagged with that block.
 
         :param protocol_name: Name of the protocol to search for liquidations on
         :param search_type: Type of search to perform
         :param run_indefinitely: Run the search indefinitely
 
         """
+        last_block_number = None
         run = True
         while run:
             if not run_indefinitely:
                 run = False
-            self.logger.info(f"Searching for liquidations on {protocol_name} from {search_type.name}")
 
-            liquidation_avail_positions_df = self.check_for_liquidations(protocol_name, search_type)
-            liquidation_params_df = self.create_liquidation_params(liquidation_avail_positions_df)
+            block_number = None
+            if self.block_clock is not None:
+                block_number = self.block_clock.wait_for_new_block(last_block_number)
+                if block_number is None:
+                    break
 
+                if last_block_number is not None and block_number > last_block_number + 1:
+                    self.logger.info(f"Skipped {block_number - last_block_number - 1} blocks while scanning")
+                last_block_number = block_number
+                block_timestamp = self.block_clock.block_timestamp
+                block_received_at = self.block_clock.received_at
 
+            self.logger.info(f"Searching for liquidations on {protocol_name} from {search_type.name}")
+
+            liquidation_avail_positions_df = self.check_for_liquidations(
+                protocol_name,
+                search_type,
+                block_number=block_number
+            )
+            liquidation_params_df = self.create_liquidation_params(liquidation_avail_positions_df)
 
+            if self.block_clock is not None:
+                # Block-to-detection latency, measured from the block timestamp
+                self.logger.info(
+                    f"Scanned block {block_number} in {time.time() - block_received_at:.3f}s, "
+                    f"{time.time() - block_timestamp:.3f}s after the block was mined"
+                )
@@ -0,0 +1,247 @@
+import time
+import hashlib
+import threading
+from typing import List, Optional, Set
+
+from app_logger.logger import Logger
+from db.redis_interface import RedisInterface
+
+# Number of shards the account space of a group is split into. More shards than workers keeps the split even
+DEFAULT_NUM_SHARDS = 64
+# Milliseconds a shard lease and a worker heartbeat stay valid without renewal
+DEFAULT_LEASE_TTL_MS = 30000
+
+# Extends a lease only if this worker still holds it
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+# Deletes a lease only if this worker still holds it
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_account_shard(account_address: str, num_shards: int) -> int:
+    """
+    Get the shard an account belongs to. The hash is stable across processes and machines
+
+    :param account_address:
+    :param num_shards:
+    :return: Shard number
+    """
+    digest = hashlib.blake2b(account_address.lower().encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % num_shards
+
+
+def get_shard_owner(shard: int, members: List[str]) -> Optional[str]:
+    """
+    Get the worker a shard is assigned to by rendezvous hashing. Every worker scores every shard and the highest score
+    wins, so a worker joining or leaving only moves the shards it wins or won, about 1/n of them
+
+    :param shard:
+    :param members: Live worker ids
+    :return: Worker id, None if there are no workers
+    """
+    def score(member: str) -> int:
+        digest = hashlib.blake2b(f"{member}:{shard}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    return max(members, key=score, default=None)
+
+
+class ShardCoordinator:
+    """
+    Splits the account space of a group of workers (ex. the searchers of a protocol and search type) into hash shards
+    and coordinates their ownership through Redis leases. Live workers heartbeat into a membership set and shards are
+    assigned to them by rendezvous hashing. A shard is only scanned while its lease is held, so a shard moving to a
+    new worker is picked up once the previous owner released it or its lease expired. Workers joining or leaving
+    rebalance the shards at the next refresh, moving only the shards of the worker that joined or left.
+    """
+    def __init__(
+            self,
+            redis_interface: RedisInterface,
+            group: str,
+            num_shards: int = DEFAULT_NUM_SHARDS,
+            lease_ttl_ms: int = DEFAULT_LEASE_TTL_MS,
+            worker_id: Optional[str] = None
+    ):
+        """
+        Initialize the ShardCoordinator class
+
+        :param redis_interface: Redis interface the leases are held in
+        :param group: Name of the group of workers sharing the account space
+        :param num_shards: Number of shards, must be the same for every worker of the group
+        :param lease_ttl_ms: Milliseconds a lease and a heartbeat stay valid without renewal
+        :param worker_id: Name of this worker, defaults to the Redis consumer name (host and pid)
+        """
+        self.redis_interface = redis_interface
+        self.group = group
+        self.num_shards = num_shards
+        self.lease_ttl_ms = lease_ttl_ms
+        self.worker_id = worker_id if worker_id is not None else redis_interface.consumer_name
+
+        self.owned_shards: Set[int] = set()
+        # Shards taken over since the last pop_acquired_shards call
+        self.acquired_shards: Set[int] = set()
+
+        self.__renew_lease = self.redis_interface.register_script(RENEW_LEASE_SCRIPT)
+        self.__release_lease = self.redis_interface.register_script(RELEASE_LEASE_SCRIPT)
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+        logger_section_name = f"{__class__}.{group}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def get_members_key(self) -> str:
+        """
+        Get the Redis key of the group's membership set, workers scored by their last heartbeat in milliseconds
+
+        :return: Key
+        """
+        return f"SHARDS_{self.group}_MEMBERS"
+
+    def get_lease_key(self, shard: int) -> str:
+        """
+        Get the Redis key of a shard lease
+
+        :param shard:
+        :return: Key
+        """
+        return f"SHARDS_{self.group}_{shard}"
+
+    def get_members(self) -> List[str]:
+        """
+        Get the workers of the group with a live heartbeat
+
+        :return: Worker ids
+        """
+        now_ms = int(time.time() * 1000)
+        self.redis_interface.zremrangebyscore(self.get_members_key(), '-inf', now_ms - self.lease_ttl_ms)
+        return sorted(member.decode() for member in self.redis_interface.zrange(self.get_members_key(), 0, -1))
+
+    def get_target_shards(self, members: List[str]) -> Set[int]:
+        """
+        Get the shards this worker should own given the live workers
+
+        :param members: Live worker ids
+        :return: Shard numbers
+        """
+        if self.worker_id not in members:
+            return set()
+
+        return {shard for shard in range(self.num_shards) if get_shard_owner(shard, members) == self.worker_id}
+
+    def refresh(self) -> Set[int]:
+        """
+        Heartbeat, renew the held leases, release the shards that moved to another worker and claim the free shards
+        this worker should own
+
+        :return: Owned shards
+        """
+        self.redis_interface.zadd(self.get_members_key(), {self.worker_id: int(time.time() * 1000)})
+        target_shards = self.get_target_shards(self.get_members())
+
+        owned_shards = set()
+        for shard in self.owned_shards:
+            lease_key = self.get_lease_key(shard)
+            if shard not in target_shards:
+                self.__release_lease(keys=[lease_key], args=[self.worker_id])
+            elif self.__renew_lease(keys=[lease_key], args=[self.worker_id, self.lease_ttl_ms]):
+                owned_shards.add(shard)
+            else:
+                self.logger.warning(f"Lost the lease of shard {shard}")
+
+        acquired_shards = set()
+        for shard in target_shards - owned_shards:
+            # Held by the previous owner until it releases the shard or its lease expires
+            if self.redis_interface.set(self.get_lease_key(shard), self.worker_id, nx=True, px=self.lease_ttl_ms):
+                acquired_shards.add(shard)
+
+        released_shards = self.owned_shards - owned_shards
+        with self.__lock:
+            self.owned_shards = owned_shards | acquired_shards
+            self.acquired_shards |= acquired_shards
+
+        if acquired_shards or released_shards:
+            self.logger.info(
+                f"Acquired {len(acquired_shards)} and released {len(released_shards)} shards, "
+                f"owning {len(self.owned_shards)}/{self.num_shards}"
+            )
+
+        return self.owned_shards
+
+    def owns_account(self, account_address: str) -> bool:
+        """
+        Check if an account belongs to a shard this worker owns
+
+        :param account_address:
+        :return: True or False
+        """
+        return get_account_shard(account_address, self.num_shards) in self.owned_shards
+
+    def filter_accounts(self, account_addresses: List[str]) -> List[str]:
+        """
+        Keep the accounts belonging to the shards this worker owns
+
+        :param account_addresses:
+        :return: Owned account addresses, in the same order
+        """
+        owned_shards = self.owned_shards
+        return [
+            account_address for account_address in account_addresses
+            if get_account_shard(account_address, self.num_shards) in owned_shards
+        ]
+
+    def pop_acquired_shards(self) -> Set[int]:
+        """
+        Get and clear the shards taken over since the last call. Their accounts were never scanned by this worker
+
+        :return: Shard numbers
+        """
+        with self.__lock:
+            acquired_shards = self.acquired_shards
+            self.acquired_shards = set()
+
+        return acquired_shards
+
+    def start(self):
+        """
+        Refresh the shards in a background thread, a third of the lease TTL apart
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+
+        self.refresh()
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, name=f"shard-coordinator-{self.group}", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop refreshing and release every shard and the membership, so other workers take them over right away
+        """
+        self.__stop_event.set()
+        if self.__thread is not None:
+            self.__thread.join()
+
+        for shard in self.owned_shards:
+            self.__release_lease(keys=[self.get_lease_key(shard)], args=[self.worker_id])
+        self.redis_interface.zrem(self.get_members_key(), self.worker_id)
+
+        with self.__lock:
+            self.owned_shards = set()
+        self.logger.info("Released every shard")
+
+    def __run(self):
+        while not self.__stop_event.wait(self.lease_ttl_ms / 3000):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f"Failed to refresh shards: {e}")
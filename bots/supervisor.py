@@ -0,0 +1,356 @@
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+from typing import Callable, Dict, List, Optional
+
+from app_logger.logger import Logger
+from enums.enums import LendingProtocol, SearchTypes
+from bots.jobs.jobs import data_manager_job, searcher_job, liquidator_job, async_searcher_job
+from bots.shard_coordinator import DEFAULT_NUM_SHARDS
+
+# Seconds between worker liveness checks
+DEFAULT_MONITOR_INTERVAL = 1
+# Seconds before a crashed worker is restarted, doubled on every consecutive crash
+DEFAULT_RESTART_DELAY = 1
+# Longest wait before a restart. A worker that ran this long is considered healthy again
+DEFAULT_MAX_RESTART_DELAY = 60
+# Seconds between liveness reports
+DEFAULT_REPORT_INTERVAL = 30
+# Seconds workers get to exit after SIGTERM before they are killed
+DEFAULT_SHUTDOWN_TIMEOUT = 10
+# Every liquidator sends from the configured wallet and allocates its nonces on its own, so they cannot share it
+MAX_LIQUIDATORS_PER_WALLET = 1
+
+
+def _exit_worker(signum, frame):
+    raise SystemExit(0)
+
+
+def _run_worker(target: Callable, args: tuple, kwargs: dict):
+    # Ctrl-C reaches the whole process group, the supervisor alone decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # SIGTERM unwinds the worker so finally blocks and context managers run
+    signal.signal(signal.SIGTERM, _exit_worker)
+
+    target(*args, **kwargs)
+
+
+class Supervisor:
+    """
+    Runs every pipeline stage in its own process, so searchers, data managers and liquidators run in parallel on
+    separate cores. Workers that crash are restarted with an exponential backoff, workers that exit cleanly are not.
+    SIGINT and SIGTERM stop every worker, and the liveness of every worker is logged periodically.
+    """
+    def __init__(
+            self,
+            monitor_interval: float = DEFAULT_MONITOR_INTERVAL,
+            restart_delay: float = DEFAULT_RESTART_DELAY,
+            max_restart_delay: float = DEFAULT_MAX_RESTART_DELAY,
+            report_interval: float = DEFAULT_REPORT_INTERVAL,
+            shutdown_timeout: float = DEFAULT_SHUTDOWN_TIMEOUT
+    ):
+        """
+        Initialize the Supervisor class
+
+        :param monitor_interval: Seconds between worker liveness checks
+        :param restart_delay: Seconds before a crashed worker is restarted, doubled on every consecutive crash
+        :param max_restart_delay: Longest wait before a restart
+        :param report_interval: Seconds between liveness reports
+        :param shutdown_timeout: Seconds workers get to exit after SIGTERM before they are killed
+        """
+        self.monitor_interval = monitor_interval
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.report_interval = report_interval
+        self.shutdown_timeout = shutdown_timeout
+
+        # Workers start from a fresh interpreter, so no connection or lock is inherited from the supervisor
+        self.context = multiprocessing.get_context('spawn')
+        # Worker name -> worker state
+        self.workers: Dict[str, dict] = {}
+        self.last_report_at = 0.0
+
+        self.__stop_event = threading.Event()
+
+        logger_section_name = f"{__class__}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def add_worker(self, name: str, target: Callable, args: tuple = (), kwargs: dict = None, count: int = 1):
+        """
+        Add worker processes running a job
+
+        :param name: Worker name, numbered when count is more than 1
+        :param target: Job function, must be importable by the worker process
+        :param args: Job arguments
+        :param kwargs: Job keyword arguments
+        :param count: Number of processes running the job
+        """
+        for index in range(count):
+            worker_name = f"{name}-{index}" if count > 1 else name
+            if worker_name in self.workers:
+                raise Exception(f"Worker {worker_name} already exists")
+
+            self.workers[worker_name] = {
+                'target': target,
+                'args': args,
+                'kwargs': kwargs if kwargs is not None else {},
+                'process': None,
+                'started_at': None,
+                'restarts': 0,
+                'consecutive_crashes': 0,
+                'restart_at': None,
+                'finished': False,
+            }
+
+    def start(self):
+        """
+        Start every worker that is not running
+        """
+        for worker_name, worker in self.workers.items():
+            if worker['process'] is None:
+                self.__start_worker(worker_name)
+
+    def run(self):
+        """
+        Start the workers and supervise them until they all finish or a stop is requested
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.__on_signal)
+            signal.signal(signal.SIGTERM, self.__on_signal)
+
+        self.start()
+        try:
+            while not self.__stop_event.is_set():
+                self.__check_workers()
+                if all(worker['finished'] for worker in self.workers.values()):
+                    self.logger.info("Every worker finished")
+                    break
+
+                if time.time() - self.last_report_at >= self.report_interval:
+                    self.report()
+
+                self.__stop_event.wait(self.monitor_interval)
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        """
+        Request the supervisor to stop every worker and return from run
+        """
+        self.__stop_event.set()
+
+    def shutdown(self):
+        """
+        Stop every worker. Workers get SIGTERM and are killed if they have not exited after the shutdown timeout
+        """
+        running = [
+            (worker_name, worker['process']) for worker_name, worker in self.workers.items()
+            if worker['process'] is not None and worker['process'].is_alive()
+        ]
+        for worker_name, process in running:
+            self.logger.info(f"Stopping worker {worker_name} (pid {process.pid})")
+            process.terminate()
+
+        deadline = time.time() + self.shutdown_timeout
+        for worker_name, process in running:
+            process.join(max(deadline - time.time(), 0))
+            if process.is_alive():
+                self.logger.warning(f"Worker {worker_name} did not stop in {self.shutdown_timeout}s, killing it")
+                process.kill()
+                process.join()
+
+    def get_status(self) -> List[dict]:
+        """
+        Get the liveness of every worker
+
+        :return: List of worker statuses (name, pid, alive, uptime, restarts, exit code)
+        """
+        status = []
+        for worker_name, worker in self.workers.items():
+            process = worker['process']
+            alive = process is not None and process.is_alive()
+            status.append({
+                'name': worker_name,
+                'pid': process.pid if process is not None else None,
+                'alive': alive,
+                'uptime': time.time() - worker['started_at'] if alive else 0,
+                'restarts': worker['restarts'],
+                'exit_code': process.exitcode if process is not None else None,
+            })
+
+        return status
+
+    def report(self):
+        """
+        Log the liveness of every worker
+        """
+        self.last_report_at = time.time()
+        status = self.get_status()
+        self.logger.info(
+            f"{sum(worker['alive'] for worker in status)}/{len(status)} workers alive: " + ", ".join(
+                f"{worker['name']} (pid {worker['pid']}, up {worker['uptime']:.0f}s, {worker['restarts']} restarts)"
+                if worker['alive'] else f"{worker['name']} (down, exit code {worker['exit_code']})"
+                for worker in status
+            )
+        )
+
+    def __start_worker(self, worker_name: str):
+        worker = self.workers[worker_name]
+        process = self.context.Process(
+            target=_run_worker,
+            args=(worker['target'], worker['args'], worker['kwargs']),
+            name=worker_name
+        )
+        process.start()
+
+        worker['process'] = process
+        worker['started_at'] = time.time()
+        worker['restart_at'] = None
+        self.logger.info(f"Started worker {worker_name} (pid {process.pid})")
+
+    def __check_workers(self):
+        now = time.time()
+        for worker_name, worker in self.workers.items():
+            process = worker['process']
+            if worker['finished'] or process is None or process.is_alive():
+                continue
+
+            if worker['restart_at'] is not None:
+                if now >= worker['restart_at']:
+                    worker['restarts'] += 1
+                    self.__start_worker(worker_name)
+                continue
+
+            if process.exitcode == 0:
+                self.logger.info(f"Worker {worker_name} finished")
+                worker['finished'] = True
+                continue
+
+            # A worker that ran long enough before crashing starts over from the shortest delay
+            if now - worker['started_at'] >= self.max_restart_delay:
+                worker['consecutive_crashes'] = 0
+            delay = min(self.restart_delay * 2 ** worker['consecutive_crashes'], self.max_restart_delay)
+            worker['consecutive_crashes'] += 1
+            worker['restart_at'] = now + delay
+            self.logger.error(
+                f"Worker {worker_name} (pid {process.pid}) crashed with exit code {process.exitcode}, "
+                f"restarting in {delay:.1f}s"
+            )
+
+    def __on_signal(self, signum, frame):
+        self.logger.info(f"Received {signal.Signals(signum).name}, stopping workers")
+        self.stop()
+
+
+def build_supervisor(
+        protocols: List[str],
+        search_types: List[SearchTypes],
+        searchers: int = 1,
+        async_searchers: int = 0,
+        data_managers: int = 1,
+        liquidators: int = 1,
+        run_indefinitely: bool = True,
+        num_shards: Optional[int] = None,
+        supervisor: Optional[Supervisor] = None
+) -> Supervisor:
+    """
+    Build a supervisor running the whole pipeline
+
+    :param protocols: Names of the protocols to search (ex. [AAVE_ARBITRUM])
+    :param search_types: Search types to run
+    :param searchers: Searcher processes per protocol and search type
+    :param async_searchers: Async searcher processes per search type, each scanning every protocol. Replace the
+        searcher processes when set
+    :param data_managers: Data manager processes, sharing the data manager stream. With more than one, every record is
+        written instead of only the changed ones
+    :param liquidators: Liquidator processes, at most MAX_LIQUIDATORS_PER_WALLET as they all send from the one wallet
+    :param run_indefinitely: Determines if the jobs should run indefinitely
+    :param num_shards: Number of shards the searcher processes of a protocol and search type split the accounts into.
+        Defaults to DEFAULT_NUM_SHARDS when there are several searcher processes, so they do not repeat each other's
+        work
+    :param supervisor: Supervisor to add the workers to, defaults to a new one
+    :return: Supervisor
+    """
+    if liquidators > MAX_LIQUIDATORS_PER_WALLET:
+        raise Exception(
+            f"Got {liquidators} liquidators, at most {MAX_LIQUIDATORS_PER_WALLET} can send from the wallet without "
+            f"reusing each other's nonces"
+        )
+    if supervisor is None:
+        supervisor = Supervisor()
+    if num_shards is None and searchers > 1:
+        num_shards = DEFAULT_NUM_SHARDS
+
+    for search_type in search_types:
+        if async_searchers:
+            supervisor.add_worker(
+                f"async-searcher-{search_type.name}",
+                async_searcher_job,
+                args=(protocols, search_type, run_indefinitely),
+                count=async_searchers
+            )
+            continue
+
+        for protocol in protocols:
+            supervisor.add_worker(
+                f"searcher-{protocol}-{search_type.name}",
+                searcher_job,
+                args=(protocol, search_type, run_indefinitely),
+                kwargs={'num_shards': num_shards},
+                count=searchers
+            )
+
+    if data_managers:
+        # The skip-unchanged cache of a data manager only knows its own writes, so it is off when the queue is shared
+        supervisor.add_worker(
+            "data-manager",
+            data_manager_job,
+            args=(run_indefinitely,),
+            kwargs={'record_cache_size': 0} if data_managers > 1 else None,
+            count=data_managers
+        )
+    if liquidators:
+        supervisor.add_worker("liquidator", liquidator_job, args=(run_indefinitely,), count=liquidators)
+
+    return supervisor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run every pipeline stage in its own process")
+    parser.add_argument(
+        "--protocols",
+        nargs='+',
+        default=[LendingProtocol.AAVE_ARBITRUM.name, LendingProtocol.RADIANT_ARBITRUM.name],
+        choices=[protocol.name for protocol in LendingProtocol],
+        help="Protocols to search"
+    )
+    parser.add_argument("--search-types", nargs='+', default=[SearchTypes.RECENT_BORROWS.name],
+                        choices=[search_type.name for search_type in SearchTypes], help="Search types to run")
+    parser.add_argument("--searchers", type=int, default=1, help="Searcher processes per protocol and search type")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Shards the searcher processes split the accounts into, defaults to sharding when there "
+                             "are several searcher processes")
+    parser.add_argument("--async-searchers", type=int, default=0,
+                        help="Async searcher processes per search type, replacing the searcher processes")
+    parser.add_argument("--data-managers", type=int, default=1, help="Data manager processes")
+    parser.add_argument("--liquidators", type=int, default=1, choices=range(MAX_LIQUIDATORS_PER_WALLET + 1),
+                        help="Liquidator processes, at most one as they share the wallet")
+    parser.add_argument("--once", action='store_true', default=False, help="Run every job once")
+    parser.add_argument("--report-interval", type=float, default=DEFAULT_REPORT_INTERVAL,
+                        help="Seconds between liveness reports")
+
+    args = parser.parse_args()
+
+    build_supervisor(
+        protocols=args.protocols,
+        search_types=[SearchTypes[search_type] for search_type in args.search_types],
+        searchers=args.searchers,
+        async_searchers=args.async_searchers,
+        data_managers=args.data_managers,
+        liquidators=args.liquidators,
+        run_indefinitely=not args.once,
+        num_shards=args.shards,
+        supervisor=Supervisor(report_interval=args.report_interval)
+    ).run()
@@ -1,9 +1,7 @@
 import argparse
-import time
-from threading import Thread
 
 from enums.enums import LendingProtocol, SearchTypes
-from bots.jobs.jobs import data_manager_job, searcher_job, liquidator_job
+from bots.supervisor import build_supervisor
 
 
 def test_orchestrate_bots(
@@ -11,71 +9,33 @@ def test_orchestrate_bots(
         run_indefinitely: bool = False,
         run_searcher: bool = False,
         run_data_manager: bool = False,
-        run_liquidator: bool = False
+        run_liquidator: bool = False,
+        run_async_searcher: bool = False
 ):
     """
-    Orchestrate bots
+    Orchestrate bots. Every bot runs in its own process under a supervisor, so every stage runs at the same time
 
     :param sets_of_bots: Number of sets of bots to run
     :param run_indefinitely: Determines if the job should run indefinitely
     :param run_searcher: Determines if the searcher job should run
     :param run_data_manager: Determines if the data manager job should run
     :param run_liquidator: Determines if the liquidator job should run
+    :param run_async_searcher: Run every protocol and search type on one event loop instead of a process per search
     :return:
     """
+    search_types = [SearchTypes.RECENT_BORROWS, SearchTypes.FROM_RECORDS] if run_searcher else []
 
-    # Searcher
-    live_search_worker = searcher_job
-    # DataManager
-    data_manager_worker = data_manager_job
-    # Liquidator
-    liquidator_worker = liquidator_job
-
-    for sets in range(sets_of_bots):
-        # # Start processes
-        if run_searcher:
-            live_search_process_aave_rb = Thread(
-                target=live_search_worker,
-                args=(LendingProtocol.AAVE_ARBITRUM.name, SearchTypes.RECENT_BORROWS, run_indefinitely)
-            )
-            live_search_process_aave_fr = Thread(
-                target=live_search_worker,
-                args=(LendingProtocol.AAVE_ARBITRUM.name, SearchTypes.FROM_RECORDS, run_indefinitely)
-            )
-            live_search_process_radiant_rb = Thread(
-                target=live_search_worker,
-                args=(LendingProtocol.RADIANT_ARBITRUM.name, SearchTypes.RECENT_BORROWS, run_indefinitely)
-            )
-            live_search_process_radiant_fr = Thread(
-                target=live_search_worker,
-                args=(LendingProtocol.RADIANT_ARBITRUM.name, SearchTypes.FROM_RECORDS, run_indefinitely)
-            )
-
-            # Start threads
-            live_search_process_aave_rb.start()
-            live_search_process_aave_fr.start()
-            live_search_process_radiant_rb.start()
-            live_search_process_radiant_fr.start()
-
-            # Wait for threads to finish
-            live_search_process_aave_rb.join()
-            live_search_process_aave_fr.join()
-            live_search_process_radiant_rb.join()
-            live_search_process_radiant_fr.join()
-        
-        if run_data_manager:
-            data_manager_process = Thread(target=data_manager_worker, args=(run_indefinitely,))
-            data_manager_process.start()
-            
-            # Wait for threads to finish
-            data_manager_process.join()
-        
-        if run_liquidator:
-            liquidator_process = Thread(target=liquidator_worker, args=(run_indefinitely,))
-            liquidator_process.start()
-            
-            # Wait for threads to finish
-            liquidator_process.join()
+    supervisor = build_supervisor(
+        protocols=[LendingProtocol.AAVE_ARBITRUM.name, LendingProtocol.RADIANT_ARBITRUM.name],
+        search_types=search_types,
+        searchers=sets_of_bots,
+        async_searchers=sets_of_bots if run_async_searcher else 0,
+        data_managers=sets_of_bots if run_data_manager else 0,
+        # Liquidators share the wallet, so one runs whatever the number of sets
+        liquidators=1 if run_liquidator else 0,
+        run_indefinitely=run_indefinitely
+    )
+    supervisor.run()
     return
 
 
@@ -87,6 +47,8 @@ if __name__ == '__main__':
     parser.add_argument("--runl", action='store_true', default=False, help="Run Liquidator")
     parser.add_argument("--sets", type=int, default=1, help="Number of sets of bots to run")
     parser.add_argument("--indef", action='store_true', default=False, help="Run bots indefinitely")
+    parser.add_argument("--async", dest='run_async', action='store_true', default=False,
+                        help="Run Searcher on a single event loop")
 
     args = parser.parse_args()
     runs = args.runs
@@ -94,11 +56,13 @@ if __name__ == '__main__':
     runl = args.runl
     sets = args.sets
     indef = args.indef
+    run_async = args.run_async
 
     test_orchestrate_bots(
-        sets_of_bots=1,
+        sets_of_bots=sets,
         run_indefinitely=indef,
         run_searcher=runs,
         run_data_manager=rund,
-        run_liquidator=runl
+        run_liquidator=runl,
+        run_async_searcher=run_async
     )
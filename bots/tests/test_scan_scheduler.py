@@ -0,0 +1,56 @@
+import pandas
+from unittest import mock
+
+from enums.enums import LendingProtocol
+from bots.searcher import Searcher
+from bots.scan_scheduler import ScanScheduler
+
+PROTOCOL_NAME = LendingProtocol.AAVE_ARBITRUM.name
+WETH = "0x82aF49447D8a07e3bd95BD0d56f35241523fBab1"
+USDC = "0xaf88d065e77c8cC2239327C5EDb3A432268e5831"
+WETH_HOLDER = "0x" + "1" * 40
+USDC_HOLDER = "0x" + "2" * 40
+
+
+def get_user_reserves_data(account_address: str, block_identifier=None):
+    asset_address = WETH if account_address == WETH_HOLDER else USDC
+    return [[(asset_address, 10 ** 18, True, 0, 0, 0, 0)]]
+
+
+def test_price_move_brings_healthy_exposed_account_forward():
+    """
+    Test that a price move brings forward the next scan of a healthy account holding the asset, and only of it
+    :return:
+    """
+    lending_pool_interface = mock.Mock(recent_borrowers=[])
+    ui_pool_data_interface = mock.Mock()
+    ui_pool_data_interface.get_user_reserves_data.side_effect = get_user_reserves_data
+    oracle_interface = mock.Mock(price_cache={WETH: 2000.0, USDC: 1.0})
+    scan_scheduler = ScanScheduler(PROTOCOL_NAME)
+
+    searcher = Searcher(
+        lending_pool_interfaces={PROTOCOL_NAME: lending_pool_interface},
+        ui_pool_data_interfaces={PROTOCOL_NAME: ui_pool_data_interface},
+        oracle_interface=oracle_interface,
+        mongo_interface=mock.Mock(),
+        redis_interface=mock.Mock(),
+        scan_schedulers={PROTOCOL_NAME: scan_scheduler}
+    )
+
+    # Both accounts are healthy, so check_for_liquidations never reads their reserves
+    scan_scheduler.update_accounts(
+        pandas.DataFrame({'account_address': [WETH_HOLDER, USDC_HOLDER], 'health_factor': [1.4, 1.4]}),
+        block_number=100
+    )
+    assert searcher.get_scheduled_accounts(PROTOCOL_NAME, block_number=101) == []
+    assert sorted(scan_scheduler.get_tracked_assets()) == sorted([WETH, USDC])
+    assert scan_scheduler.get_accounts_to_sync_assets(102) == []
+
+    oracle_interface.price_cache[WETH] = 1900.0
+    assert searcher.get_scheduled_accounts(PROTOCOL_NAME, block_number=102) == []
+    assert searcher.get_scheduled_accounts(PROTOCOL_NAME, block_number=103) == [WETH_HOLDER]
+    assert scan_scheduler.schedule.loc[USDC_HOLDER, 'next_scan_block'] == 120
+
+
+if __name__ == "__main__":
+    test_price_move_brings_healthy_exposed_account_forward()
@@ -1,4 +1,5 @@
 import hexbytes
+import pandas
 from eth_abi import encode
 
 
@@ -22,3 +23,17 @@ def encode_path(path, path_types=None) -> str:
     encoded_path_str = hexbytes.HexBytes(encoded_path).hex()
 
     return encoded_path_str
+
+
+def explode_reserves(positions: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Explode the nested reserves of user positions into a flat account x asset table
+    :param positions: Dataframe of user positions with a 'reserves' column of reserve dicts
+    :return: One row per account reserve, with the remaining position columns repeated on every row
+    """
+    exploded = positions.explode('reserves', ignore_index=True)
+    exploded = exploded[exploded['reserves'].notna()].reset_index(drop=True)
+
+    reserves = pandas.DataFrame.from_records(exploded['reserves'].to_list(), index=exploded.index)
+
+    return pandas.concat([exploded.drop(columns=['reserves']), reserves], axis=1)
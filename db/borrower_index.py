@@ -0,0 +1,120 @@
+from typing import List, Optional
+
+from app_logger.logger import Logger
+from db.mongo_db_interface import MongoInterface, DEFAULT_BULK_WRITE_CHUNK_SIZE
+
+BORROWER_INDEX_COLLECTION = 'borrower_index'
+BORROWER_INDEX_CURSOR_COLLECTION = 'borrower_index_cursor'
+
+
+class BorrowerIndex:
+    """
+    Persisted borrower index of a lending protocol. Stores one document per borrower discovered from pool events,
+    unique on the protocol and account, so the index grows without bound on the size of a single document. The last
+    block that was scanned is kept in a separate cursor document, so event scans can resume from it.
+    """
+    def __init__(
+            self,
+            mongo_interface: MongoInterface,
+            protocol_name: str,
+            collection: str = BORROWER_INDEX_COLLECTION,
+            cursor_collection: str = BORROWER_INDEX_CURSOR_COLLECTION,
+            bulk_write_chunk_size: int = DEFAULT_BULK_WRITE_CHUNK_SIZE
+    ):
+        """
+        Initialize BorrowerIndex class
+
+        :param mongo_interface: Mongo interface the index is persisted with
+        :param protocol_name: Name of the protocol the borrowers belong to
+        :param collection: Collection the borrowers are stored in
+        :param cursor_collection: Collection the last scanned block is stored in
+        :param bulk_write_chunk_size: Number of borrowers per bulk write
+        """
+        self.mongo_interface = mongo_interface
+        self.protocol_name = protocol_name
+        self.collection = collection
+        self.cursor_collection = cursor_collection
+        self.bulk_write_chunk_size = bulk_write_chunk_size
+
+        logger_section_name = f"{__class__}.{protocol_name}"
+        self.logger = Logger(section_name=logger_section_name)
+
+        self.mongo_interface.create_index(
+            collection=self.collection,
+            keys=[('protocol_name', 1), ('account_address', 1)],
+            unique=True
+        )
+
+    def get_last_scanned_block(self) -> Optional[int]:
+        """
+        Get the last block scanned for borrower events
+        :return: Block number, None if the protocol was never scanned
+        """
+        record = self.mongo_interface.find_one(
+            collection=self.cursor_collection,
+            query={'protocol_name': self.protocol_name}
+        )
+        return record.get('last_scanned_block') if record is not None else None
+
+    def get_borrowers(self) -> List[str]:
+        """
+        Get every indexed borrower address
+        :return:
+        """
+        account_addresses = []
+        for records in self.mongo_interface.find_batches(
+                collection=self.collection,
+                query={'protocol_name': self.protocol_name},
+                projection={'_id': 0, 'account_address': 1}
+        ):
+            account_addresses += [record['account_address'] for record in records]
+
+        return account_addresses
+
+    def add_borrowers(self, account_addresses: List[str], last_scanned_block: int):
+        """
+        Add borrowers to the index and move the cursor forward. The cursor moves only once every borrower is stored,
+        so a failed write is rescanned
+
+        :param account_addresses: Borrower addresses found in the scanned range
+        :param last_scanned_block: Last block of the scanned range
+        """
+        updates = [
+            (
+                {'protocol_name': self.protocol_name, 'account_address': account_address},
+                {'$setOnInsert': {'protocol_name': self.protocol_name, 'account_address': account_address}}
+            )
+            for account_address in dict.fromkeys(account_addresses)
+        ]
+        if updates:
+            # Concurrent scans inserting the same borrower collide on the unique index, the borrower is stored either way
+            self.mongo_interface.bulk_update(
+                collection=self.collection,
+                updates=updates,
+                upsert=True,
+                chunk_size=self.bulk_write_chunk_size,
+                ignore_duplicate_keys=True
+            )
+
+        self.mongo_interface.update(
+            collection=self.cursor_collection,
+            query={'protocol_name': self.protocol_name},
+            document={'$max': {'last_scanned_block': last_scanned_block}},
+            upsert=True
+        )
+        self.logger.info(f"Indexed {len(updates)} borrowers up to block {last_scanned_block}")
+
+    def remove_borrowers(self, account_addresses: List[str]):
+        """
+        Remove borrowers from the index
+
+        :param account_addresses:
+        """
+        for start in range(0, len(account_addresses), self.bulk_write_chunk_size):
+            self.mongo_interface.delete_many(
+                collection=self.collection,
+                query={
+                    'protocol_name': self.protocol_name,
+                    'account_address': {'$in': account_addresses[start:start + self.bulk_write_chunk_size]}
+                }
+            )
@@ -0,0 +1,147 @@
+import io
+import json
+import zlib
+import struct
+import numpy
+import pandas as pd
+
+from enums.enums import PayloadCodec, PayloadCompression
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+# Binary DataFrame payloads for the queues. A payload starts with a header naming its codec and compression:
+#   MAGIC (4 bytes) | codec (1 byte) | compression (1 byte) | body
+# Payloads without the header are legacy DataFrame.to_json output and are decoded as such.
+
+MAGIC = b'LQD1'
+HEADER = struct.Struct('>4sBB')
+# zlib level trading ratio for encode speed
+DEFAULT_COMPRESSION_LEVEL = 1
+
+# Column kinds stored as raw typed arrays. Every other column is stored as a JSON list
+TYPED_COLUMN_KINDS = 'biuf'
+
+
+def _to_json_value(value):
+    if isinstance(value, numpy.generic):
+        return value.item()
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_columnar(df: pd.DataFrame) -> bytes:
+    columns = []
+    buffers = []
+    for name in df.columns:
+        column = df[name]
+        if column.dtype.kind in TYPED_COLUMN_KINDS:
+            buffer = numpy.ascontiguousarray(column.to_numpy()).tobytes()
+            columns.append({'name': name, 'dtype': column.dtype.str, 'size': len(buffer)})
+        else:
+            buffer = json.dumps(column.tolist(), default=_to_json_value).encode()
+            # Non-object dtypes (ex. str, category) are restored from their name
+            columns.append({'name': name, 'dtype': 'json', 'pandas_dtype': str(column.dtype), 'size': len(buffer)})
+        buffers.append(buffer)
+
+    meta = json.dumps({'rows': len(df), 'columns': columns}).encode()
+    return struct.pack('>I', len(meta)) + meta + b''.join(buffers)
+
+
+def _decode_columnar(body: bytes) -> pd.DataFrame:
+    (meta_size,) = struct.unpack_from('>I', body)
+    meta = json.loads(body[4:4 + meta_size])
+
+    data = {}
+    offset = 4 + meta_size
+    for column in meta['columns']:
+        buffer = body[offset:offset + column['size']]
+        offset += column['size']
+        if column['dtype'] == 'json':
+            series = pd.Series(json.loads(buffer), dtype=object)
+            if column.get('pandas_dtype', 'object') != 'object':
+                series = series.astype(column['pandas_dtype'])
+            data[column['name']] = series
+        else:
+            data[column['name']] = numpy.frombuffer(buffer, dtype=numpy.dtype(column['dtype'])).copy()
+
+    return pd.DataFrame(data, index=pd.RangeIndex(meta['rows']), columns=[column['name'] for column in meta['columns']])
+
+
+def _encode_arrow(df: pd.DataFrame) -> bytes:
+    if pyarrow is None:
+        raise Exception("pyarrow is not installed, use PayloadCodec.COLUMNAR")
+
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue()
+
+
+def _decode_arrow(body: bytes) -> pd.DataFrame:
+    if pyarrow is None:
+        raise Exception("pyarrow is not installed, cannot decode an Arrow payload")
+
+    return pyarrow.ipc.open_stream(body).read_all().to_pandas()
+
+
+def encode_dataframe(
+        df: pd.DataFrame,
+        codec: PayloadCodec = PayloadCodec.COLUMNAR,
+        compression: PayloadCompression = PayloadCompression.ZLIB
+) -> bytes:
+    """
+    Serialize a DataFrame for a queue. The index is not kept
+
+    :param df:
+    :param codec: Body format
+    :param compression: Body compression
+    :return: Payload with its codec header
+    """
+    if codec == PayloadCodec.COLUMNAR:
+        body = _encode_columnar(df)
+    elif codec == PayloadCodec.ARROW:
+        body = _encode_arrow(df)
+    elif codec == PayloadCodec.JSON:
+        body = df.reset_index(drop=True).to_json().encode()
+    else:
+        raise Exception(f"Unknown codec: {codec}")
+
+    if compression == PayloadCompression.ZLIB:
+        body = zlib.compress(body, DEFAULT_COMPRESSION_LEVEL)
+
+    return HEADER.pack(MAGIC, codec.value, compression.value) + body
+
+
+def decode_dataframe(payload: bytes | str) -> pd.DataFrame:
+    """
+    Deserialize a DataFrame payload, or a legacy DataFrame.to_json payload without a header
+
+    :param payload:
+    :return: DataFrame
+    """
+    if isinstance(payload, str):
+        payload = payload.encode()
+
+    if not payload.startswith(MAGIC):
+        return pd.read_json(io.StringIO(payload.decode()))
+
+    _, codec, compression = HEADER.unpack_from(payload)
+    body = payload[HEADER.size:]
+
+    if PayloadCompression(compression) == PayloadCompression.ZLIB:
+        body = zlib.decompress(body)
+
+    codec = PayloadCodec(codec)
+    if codec == PayloadCodec.COLUMNAR:
+        return _decode_columnar(body)
+    if codec == PayloadCodec.ARROW:
+        return _decode_arrow(body)
+
+    return pd.read_json(io.StringIO(body.decode()))
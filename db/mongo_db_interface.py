@@ -1,4 +1,14 @@
-from pymongo import MongoClient
+from typing import Dict, Iterator, List, Tuple
+
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Number of operations sent per bulk_write call
+DEFAULT_BULK_WRITE_CHUNK_SIZE = 1000
+# Error code of a write that would duplicate a unique index key
+DUPLICATE_KEY_ERROR_CODE = 11000
+# Number of documents fetched per cursor round trip
+DEFAULT_FIND_BATCH_SIZE = 1000
 
 
 class MongoInterface:
@@ -19,6 +29,36 @@ class MongoInterface:
     def find(self, collection, query):
         return self.db[collection].find(query)
 
+    def find_batches(
+            self,
+            collection: str,
+            query: Dict,
+            projection: Dict = None,
+            sort: List = None,
+            batch_size: int = DEFAULT_FIND_BATCH_SIZE
+    ) -> Iterator[List[Dict]]:
+        """
+        Stream the documents matching a query in lists of batch_size documents, one cursor round trip per list
+
+        :param collection:
+        :param query:
+        :param projection: Fields to return
+        :param sort: List of (key, direction) pairs
+        :param batch_size: Number of documents per list
+        :return: Iterator of document lists
+        """
+        cursor = self.db[collection].find(query, projection=projection, sort=sort, batch_size=batch_size)
+
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
     def find_one(self, collection, query):
         return self.db[collection].find_one(query)
 
@@ -28,6 +68,75 @@ class MongoInterface:
     def update(self, collection, query, document, upsert=False):
         return self.db[collection].update_one(query, document, upsert=upsert)
 
+    def bulk_update(
+            self,
+            collection: str,
+            updates: List[Tuple[Dict, Dict]],
+            upsert: bool = True,
+            chunk_size: int = DEFAULT_BULK_WRITE_CHUNK_SIZE,
+            ignore_duplicate_keys: bool = False
+    ) -> Dict:
+        """
+        Apply updates in unordered bulk_write batches
+
+        :param collection:
+        :param updates: List of (query, update document) pairs, each applied to the first matching document
+        :param upsert: Insert a document for queries that match none
+        :param chunk_size: Number of updates per bulk_write call
+        :param ignore_duplicate_keys: Report the updates whose upsert hit a unique index key instead of raising. With a
+            condition in the query, those are the updates whose condition failed on an existing document
+        :return: Aggregate matched, modified and upserted counts, and the positions in updates of the duplicate keys
+        """
+        counts = {'matched': 0, 'modified': 0, 'upserted': 0, 'duplicate_keys': []}
+        for start in range(0, len(updates), chunk_size):
+            operations = [
+                UpdateOne(query, document, upsert=upsert) for query, document in updates[start:start + chunk_size]
+            ]
+            try:
+                result = self.db[collection].bulk_write(operations, ordered=False)
+                counts['matched'] += result.matched_count
+                counts['modified'] += result.modified_count
+                counts['upserted'] += result.upserted_count
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors', [])
+                if not ignore_duplicate_keys or any(
+                        error['code'] != DUPLICATE_KEY_ERROR_CODE for error in write_errors
+                ):
+                    raise
+
+                # Unordered, every other update of the batch was applied
+                counts['matched'] += e.details.get('nMatched', 0)
+                counts['modified'] += e.details.get('nModified', 0)
+                counts['upserted'] += e.details.get('nUpserted', 0)
+                counts['duplicate_keys'] += [start + error['index'] for error in write_errors]
+
+        return counts
+
+    def bulk_upsert(
+            self,
+            collection: str,
+            documents: List[Dict],
+            key_fields: List[str],
+            chunk_size: int = DEFAULT_BULK_WRITE_CHUNK_SIZE
+    ) -> Dict:
+        """
+        Upsert documents in unordered bulk_write batches. Each document replaces the fields of the document with the
+        same key fields, or is inserted if there is none
+
+        :param collection:
+        :param documents:
+        :param key_fields: Fields identifying a document, should be covered by a unique index
+        :param chunk_size: Number of upserts per bulk_write call
+        :return: Aggregate matched, modified and upserted counts
+        """
+        updates = [({field: document[field] for field in key_fields}, {'$set': document}) for document in documents]
+        return self.bulk_update(collection, updates, upsert=True, chunk_size=chunk_size)
+
+    def create_index(self, collection, keys, unique=False, expire_after_seconds=None):
+        if expire_after_seconds is not None:
+            return self.db[collection].create_index(keys, unique=unique, expireAfterSeconds=expire_after_seconds)
+        return self.db[collection].create_index(keys, unique=unique)
+
     def update_many(self, collection, query, document):
         return self.db[collection].update_many(query, document)
 
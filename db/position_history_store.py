@@ -0,0 +1,192 @@
+import math
+import pandas as pd
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from app_logger.logger import Logger
+from db.mongo_db_interface import MongoInterface, DEFAULT_BULK_WRITE_CHUNK_SIZE
+
+POSITION_HISTORY_COLLECTION = 'user_account_position_history'
+# Blocks covered by one bucket document of an account
+DEFAULT_BLOCKS_PER_BUCKET = 10000
+# Seconds a bucket is kept after its last sample
+DEFAULT_RETENTION_SECONDS = 30 * 24 * 60 * 60
+
+# Account record field -> short sample field, samples are stored many times over
+SAMPLE_FIELDS = {
+    'block_number': 'b',
+    'health_factor': 'hf',
+    'total_collateral_eth': 'c',
+    'total_debt_eth': 'd',
+}
+HISTORY_COLUMNS = ['protocol_name', 'account_address'] + list(SAMPLE_FIELDS.keys())
+
+
+class PositionHistoryStore:
+    """
+    Health factor, collateral and debt history of the accounts of lending protocols, for replays and backtests.
+    Samples of an account are bucketed into one document per DEFAULT_BLOCKS_PER_BUCKET blocks, so a write appends to
+    an existing document instead of inserting one per sample. Buckets expire once no sample was added for the
+    retention period.
+    """
+    def __init__(
+            self,
+            mongo_interface: MongoInterface,
+            collection: str = POSITION_HISTORY_COLLECTION,
+            blocks_per_bucket: int = DEFAULT_BLOCKS_PER_BUCKET,
+            retention_seconds: int = DEFAULT_RETENTION_SECONDS,
+            bulk_write_chunk_size: int = DEFAULT_BULK_WRITE_CHUNK_SIZE
+    ):
+        """
+        Initialize PositionHistoryStore class
+
+        :param mongo_interface: Mongo interface the history is persisted with
+        :param collection: Collection the history is stored in
+        :param blocks_per_bucket: Blocks covered by one bucket document
+        :param retention_seconds: Seconds a bucket is kept after its last sample
+        :param bulk_write_chunk_size: Number of bucket updates per bulk write
+        """
+        self.mongo_interface = mongo_interface
+        self.collection = collection
+        self.blocks_per_bucket = blocks_per_bucket
+        self.retention_seconds = retention_seconds
+        self.bulk_write_chunk_size = bulk_write_chunk_size
+
+        logger_section_name = f"{__class__}"
+        self.logger = Logger(section_name=logger_section_name)
+
+        self.mongo_interface.create_index(
+            collection=self.collection,
+            keys=[('protocol_name', 1), ('account_address', 1), ('bucket_start_block', 1)],
+            unique=True
+        )
+        self.mongo_interface.create_index(
+            collection=self.collection,
+            keys=[('protocol_name', 1), ('bucket_start_block', 1)]
+        )
+        self.mongo_interface.create_index(
+            collection=self.collection,
+            keys=[('updated_at', 1)],
+            expire_after_seconds=self.retention_seconds
+        )
+
+    def get_bucket_start_block(self, block_number: int) -> int:
+        """
+        Get the first block of the bucket a block belongs to
+
+        :param block_number:
+        :return: Block number
+        """
+        return block_number - block_number % self.blocks_per_bucket
+
+    def add_samples(self, account_records: List[Dict]) -> int:
+        """
+        Append a sample of each account record to its bucket. Records without a block number are skipped
+
+        :param account_records: Account records with protocol_name, account_address, block_number and the sampled fields
+        :return: Number of samples added
+        """
+        updated_at = datetime.now(timezone.utc)
+
+        updates = []
+        for account_record in account_records:
+            block_number = account_record.get('block_number')
+            if block_number is None or (isinstance(block_number, float) and math.isnan(block_number)):
+                continue
+
+            block_number = int(block_number)
+            sample = {
+                sample_field: account_record.get(field) for field, sample_field in SAMPLE_FIELDS.items()
+            }
+            sample['b'] = block_number
+            updates.append((
+                {
+                    'protocol_name': account_record['protocol_name'],
+                    'account_address': account_record['account_address'],
+                    'bucket_start_block': self.get_bucket_start_block(block_number),
+                },
+                {
+                    # A retried batch adds no duplicate samples
+                    '$addToSet': {'samples': sample},
+                    '$min': {'first_block': block_number},
+                    '$max': {'last_block': block_number},
+                    '$set': {'updated_at': updated_at},
+                }
+            ))
+
+        if not updates:
+            return 0
+
+        self.mongo_interface.bulk_update(
+            collection=self.collection,
+            updates=updates,
+            upsert=True,
+            chunk_size=self.bulk_write_chunk_size
+        )
+        self.logger.info(f"Added {len(updates)} position history samples")
+
+        return len(updates)
+
+    def get_account_history(
+            self,
+            protocol_name: str,
+            account_address: str,
+            from_block: Optional[int] = None,
+            to_block: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Get the samples of an account in a block range
+
+        :param protocol_name:
+        :param account_address:
+        :param from_block: First block of the range, defaults to the oldest sample
+        :param to_block: Last block of the range, defaults to the newest sample
+        :return: Dataframe of samples ordered by block number
+        """
+        return self.get_history(protocol_name, from_block, to_block, account_addresses=[account_address])
+
+    def get_history(
+            self,
+            protocol_name: str,
+            from_block: Optional[int] = None,
+            to_block: Optional[int] = None,
+            account_addresses: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Get the samples of a protocol's accounts in a block range
+
+        :param protocol_name:
+        :param from_block: First block of the range, defaults to the oldest sample
+        :param to_block: Last block of the range, defaults to the newest sample
+        :param account_addresses: Accounts to get the samples of, defaults to every account
+        :return: Dataframe of samples ordered by block number and account address
+        """
+        query = {'protocol_name': protocol_name}
+        if account_addresses is not None:
+            query['account_address'] = {'$in': account_addresses}
+        if from_block is not None:
+            query['last_block'] = {'$gte': from_block}
+        if to_block is not None:
+            query['bucket_start_block'] = {'$lte': to_block}
+
+        rows = []
+        for buckets in self.mongo_interface.find_batches(
+                collection=self.collection,
+                query=query,
+                projection={'_id': 0, 'account_address': 1, 'samples': 1}
+        ):
+            for bucket in buckets:
+                for sample in bucket['samples']:
+                    if from_block is not None and sample['b'] < from_block:
+                        continue
+                    if to_block is not None and sample['b'] > to_block:
+                        continue
+
+                    rows.append(
+                        [protocol_name, bucket['account_address']]
+                        + [sample.get(sample_field) for sample_field in SAMPLE_FIELDS.values()]
+                    )
+
+        df = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+        return df.sort_values(['block_number', 'account_address'], ignore_index=True)
@@ -1,45 +1,253 @@
+import os
 import json
+import math
+import socket
 import pandas as pd
 
 from abc import ABC
+from typing import Dict, Optional, Tuple
 from redis import Redis
+from redis.exceptions import ResponseError
 from dotenv import dotenv_values, find_dotenv
 
 from app_logger.logger import Logger
-from enums.enums import QueueType
+from enums.enums import QueueType, QueueMode, PayloadCodec, PayloadCompression
+from db.codecs import encode_dataframe, decode_dataframe
 
 config = dotenv_values(dotenv_path=find_dotenv())
 
+# Seconds a blocking pop waits for an item before returning None
+DEFAULT_POP_TIMEOUT = 1
+
+# Queues that are kept in a sorted set in QueueMode.PRIORITY
+PRIORITY_QUEUE_TYPES = [QueueType.LIQUIDATOR_QUEUE]
+# Item field used as the score when none is given
+PRIORITY_SCORE_FIELD = 'estimated_profit_usd'
+# Item fields identifying the position a priority queue item targets. A newer item for the position replaces the old one
+PRIORITY_KEY_FIELDS = ['protocol_name', 'user', 'collateral_asset', 'debt_asset']
+# Item field holding the block an item was created at
+PRIORITY_BLOCK_FIELD = 'block_number'
+# Items created more than this many blocks before the newest pushed item are dropped
+DEFAULT_MAX_ITEM_AGE_BLOCKS = 20
+
+# Queues a priority item: score and payload under the position key, and drops the items too old for the new block
+PUSH_PRIORITY_ITEM_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+if ARGV[4] == '' then
+    return 0
+end
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', '(' .. (tonumber(ARGV[4]) - tonumber(ARGV[5])))
+for _, member in ipairs(stale) do
+    redis.call('ZREM', KEYS[1], member)
+    redis.call('HDEL', KEYS[2], member)
+    redis.call('ZREM', KEYS[3], member)
+end
+return #stale
+"""
+# Takes the payload of a popped priority item, nil if it was already taken
+TAKE_PRIORITY_ITEM_SCRIPT = """
+local payload = redis.call('HGET', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return payload
+"""
+# Pops the highest scored priority item and takes its payload
+POP_PRIORITY_ITEM_SCRIPT = """
+local popped = redis.call('ZPOPMAX', KEYS[1])
+if #popped == 0 then
+    return nil
+end
+local payload = redis.call('HGET', KEYS[2], popped[1])
+redis.call('HDEL', KEYS[2], popped[1])
+redis.call('ZREM', KEYS[3], popped[1])
+return payload
+"""
+
+# Consumer group every stream consumer joins, so entries are spread across processes
+DEFAULT_CONSUMER_GROUP = 'consumers'
+# Pending stream entries idle for this many milliseconds are reclaimed from dead consumers
+DEFAULT_CLAIM_IDLE_MS = 60000
+# Deliveries of a stream entry after which it is moved to the dead-letter stream instead of being reclaimed again
+DEFAULT_MAX_DELIVERIES = 5
+# Approximate number of entries a stream is trimmed to
+DEFAULT_STREAM_MAXLEN = 100000
+
 
 class RedisInterface(Redis, ABC):
     """
-    Redis interface. Used to push and pop items from queue
+    Redis interface. Used to push and pop items from queue. Each queue is a FIFO list, a sorted set or a stream:
+        - In QueueMode.PRIORITY the liquidator queue is a sorted set of positions scored by estimated profit, and
+          every pop atomically takes the highest score. A position pushed again replaces its queued item, and items
+          more than max_item_age_blocks blocks older than the newest push are dropped.
+        - In QueueMode.STREAM the queue is a stream read through a consumer group. Items read with read_item stay
+          pending until ack_item, and items left pending by a dead consumer are reclaimed by the others. Items that
+          cannot be decoded, or were delivered too many times without being acknowledged, are moved to a dead-letter
+          stream.
     """
-    def __init__(self, host, port):
+    def __init__(
+            self,
+            host,
+            port,
+            queue_mode: QueueMode = QueueMode.FIFO,
+            queue_modes: Dict[QueueType, QueueMode] = None,
+            payload_codec: PayloadCodec = PayloadCodec.COLUMNAR,
+            payload_compression: PayloadCompression = PayloadCompression.ZLIB,
+            max_item_age_blocks: int = DEFAULT_MAX_ITEM_AGE_BLOCKS
+    ):
         """
         Initialize RedisInterface class
         :param host:
         :param port:
+        :param queue_mode: Mode of every queue not in queue_modes
+        :param queue_modes: Optional mode of individual queues
+        :param payload_codec: Format DataFrame payloads are pushed in. Every format, and legacy JSON, is read back
+        :param payload_compression: Compression of DataFrame payloads
+        :param max_item_age_blocks: Blocks a priority queue item is kept behind the newest pushed item
         """
-        super().__init__(host=host, port=port, decode_responses=True)
+        # Responses stay bytes so binary payloads are not decoded as text
+        super().__init__(host=host, port=port, decode_responses=False)
+        self.queue_mode = queue_mode
+        self.queue_modes = queue_modes if queue_modes is not None else {}
+        self.payload_codec = payload_codec
+        self.payload_compression = payload_compression
+        self.max_item_age_blocks = max_item_age_blocks
+        # Name this process reads streams as
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+        # Streams whose consumer group is known to exist
+        self.consumer_groups = set()
+
+        self.__push_priority_item = self.register_script(PUSH_PRIORITY_ITEM_SCRIPT)
+        self.__take_priority_item = self.register_script(TAKE_PRIORITY_ITEM_SCRIPT)
+        self.__pop_priority_item = self.register_script(POP_PRIORITY_ITEM_SCRIPT)
 
         logger_section_name = f"{__class__}"
         self.logger = Logger(section_name=logger_section_name)
 
-    def push_item(self, queue_type: QueueType, value: dict | pd.DataFrame) -> bool:
+    def get_queue_mode(self, queue_type: QueueType) -> QueueMode:
+        """
+        Get the mode of a queue
+        :param queue_type: Queue type
+        :return: Queue mode
+        """
+        return self.queue_modes.get(queue_type, self.queue_mode)
+
+    def is_priority_queue(self, queue_type: QueueType) -> bool:
+        """
+        Check if a queue is kept in a sorted set
+        :param queue_type: Queue type
+        :return: True or False
+        """
+        return self.get_queue_mode(queue_type) == QueueMode.PRIORITY and queue_type in PRIORITY_QUEUE_TYPES
+
+    def is_stream_queue(self, queue_type: QueueType) -> bool:
+        """
+        Check if a queue is kept in a stream
+        :param queue_type: Queue type
+        :return: True or False
+        """
+        return self.get_queue_mode(queue_type) == QueueMode.STREAM
+
+    def get_queue_key(self, queue_type: QueueType) -> str:
+        """
+        Get the Redis key of a queue. Sorted sets and streams use their own key so they never collide with a FIFO list
+        :param queue_type: Queue type
+        :return: Key
+        """
+        if self.is_priority_queue(queue_type):
+            return f"{queue_type.name}_PRIORITY"
+        if self.is_stream_queue(queue_type):
+            return f"{queue_type.name}_STREAM"
+
+        return queue_type.name
+
+    def get_priority_item_keys(self, queue_type: QueueType) -> Tuple[str, str, str]:
+        """
+        Get the Redis keys of a priority queue: the sorted set of positions, the hash of their latest items and the
+        sorted set of the blocks their items were created at
+        :param queue_type: Queue type
+        :return: Keys
+        """
+        key = self.get_queue_key(queue_type)
+        return key, f"{key}_ITEMS", f"{key}_BLOCKS"
+
+    @staticmethod
+    def get_priority_member(item: dict, payload: str) -> str:
+        """
+        Get the member a priority queue item is queued under, the position it targets
+        :param item: Item
+        :param payload: Serialized item, the member of items that do not identify a position
+        :return: Member
+        """
+        if any(item.get(field) is None for field in PRIORITY_KEY_FIELDS):
+            return payload
+
+        return ':'.join(str(item[field]).lower() for field in PRIORITY_KEY_FIELDS)
+
+    def get_dead_letter_key(self, queue_type: QueueType) -> str:
+        """
+        Get the Redis key of the dead-letter stream of a stream queue
+        :param queue_type: Queue type
+        :return: Key
+        """
+        return f"{self.get_queue_key(queue_type)}_DEAD"
+
+    def push_item(self, queue_type: QueueType, value: dict | pd.DataFrame, score: float = None) -> bool:
         """
         Push item to queue
         :param value: Value to push to queue
         :param queue_type: Queue type
+        :param score: Priority of the item in QueueMode.PRIORITY, defaults to its estimated_profit_usd field
         :return: True or False
         """
+        item = value
+        if score is None and isinstance(value, dict):
+            score = value.get(PRIORITY_SCORE_FIELD)
+
         if isinstance(value, dict):
             value = json.dumps(value)
         elif isinstance(value, pd.DataFrame):
-            value = value.to_json()
+            value = encode_dataframe(value, codec=self.payload_codec, compression=self.payload_compression)
         else:
             raise Exception("Unknown type")
 
+        if self.is_priority_queue(queue_type):
+            if score is None or math.isnan(score):
+                score = 0
+            block_number = item.get(PRIORITY_BLOCK_FIELD) if isinstance(item, dict) else None
+            if block_number is None or (isinstance(block_number, float) and math.isnan(block_number)):
+                block_number = ''
+            else:
+                block_number = int(block_number)
+
+            # The item of a position already queued is replaced, so a position is queued once whatever the blocks
+            dropped_count = self.__push_priority_item(
+                keys=list(self.get_priority_item_keys(queue_type)),
+                args=[
+                    self.get_priority_member(item if isinstance(item, dict) else {}, value),
+                    float(score),
+                    value,
+                    block_number,
+                    self.max_item_age_blocks
+                ]
+            )
+            self.logger.info(
+                f"Pushed item to priority queue: {queue_type.name} with score {score}, "
+                f"dropped {dropped_count} stale items"
+            )
+            return True
+
+        if self.is_stream_queue(queue_type):
+            entry_id = self.xadd(
+                self.get_queue_key(queue_type),
+                {'data': value},
+                maxlen=DEFAULT_STREAM_MAXLEN,
+                approximate=True
+            )
+            self.logger.info(f"Pushed item to stream: {queue_type.name} as {entry_id.decode()}")
+            return True
+
         result = self.rpush(queue_type.name, value)
 
         if result > 0:
@@ -49,22 +257,175 @@ class RedisInterface(Redis, ABC):
         self.logger.error(f"Failed to push item to queue: {queue_type.name}")
         return False
 
-    def pop_item(self, queue_type: QueueType) -> dict | pd.DataFrame:
+    def pop_item(self, queue_type: QueueType, timeout: int = None) -> dict | pd.DataFrame | None:
         """
-        Pop item from queue
+        Pop item from queue. Stream items are acknowledged as soon as they are read, use read_item and ack_item to
+        acknowledge them after processing instead
 
         :param queue_type: Queue type
-        :return: Returns dict or pd.DataFrame depending on queue type
+        :param timeout: If set, block up to timeout seconds for an item instead of returning immediately
+        :return: Returns dict or pd.DataFrame depending on queue type, None if the queue is empty
         """
-        if queue_type == QueueType.LIQUIDATOR_QUEUE:
+        if queue_type not in [QueueType.LIQUIDATOR_QUEUE, QueueType.DATA_MANAGER_QUEUE]:
+            raise Exception("Unknown queue type")
+
+        if self.is_stream_queue(queue_type):
+            item = self.read_item(queue_type, timeout=timeout)
+            if item is None:
+                return None
+
+            entry_id, data = item
+            self.ack_item(queue_type, entry_id)
+            return data
+
+        if self.is_priority_queue(queue_type):
+            # Pops take the highest score atomically, so several liquidators can share the queue
+            key, items_key, blocks_key = self.get_priority_item_keys(queue_type)
+            if timeout is None:
+                data = self.__pop_priority_item(keys=[key, items_key, blocks_key])
+            else:
+                item = self.bzpopmax([key], timeout=timeout)
+                # None when the position was queued again after the pop and its item taken along with this one
+                data = self.__take_priority_item(keys=[items_key, blocks_key], args=[item[1]]) if item else None
+        elif timeout is None:
             data = self.lpop(queue_type.name)
+        else:
+            item = self.blpop([queue_type.name], timeout=timeout)
+            data = item[1] if item else None
+
+        if data is None:
+            return None
+
+        return self.__decode_item(queue_type, data)
+
+    def ensure_consumer_group(self, queue_type: QueueType, group: str = DEFAULT_CONSUMER_GROUP):
+        """
+        Create the consumer group of a stream, and the stream itself, if they do not exist
+
+        :param queue_type: Queue type
+        :param group: Consumer group name
+        """
+        key = self.get_queue_key(queue_type)
+        if (key, group) in self.consumer_groups:
+            return
+
+        try:
+            self.xgroup_create(key, group, id='0', mkstream=True)
+            self.logger.info(f"Created consumer group {group} on stream {key}")
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+        self.consumer_groups.add((key, group))
+
+    def read_item(
+            self,
+            queue_type: QueueType,
+            timeout: int = None,
+            group: str = DEFAULT_CONSUMER_GROUP,
+            claim_idle_ms: int = DEFAULT_CLAIM_IDLE_MS,
+            max_deliveries: int = DEFAULT_MAX_DELIVERIES
+    ) -> Optional[Tuple[str, dict | pd.DataFrame]]:
+        """
+        Read an item from a stream through the consumer group. Entries left pending by a dead consumer for longer
+        than claim_idle_ms are reclaimed before new entries are read. The item stays pending until ack_item. Entries
+        that fail to decode, or were delivered more than max_deliveries times, are moved to the dead-letter stream
+
+        :param queue_type: Queue type
+        :param timeout: If set, block up to timeout seconds for an item instead of returning immediately
+        :param group: Consumer group name
+        :param claim_idle_ms: Idle time after which another consumer's pending entry is reclaimed
+        :param max_deliveries: Deliveries after which a pending entry is dead-lettered instead of reclaimed
+        :return: (entry id, dict or pd.DataFrame depending on queue type), None if the stream is empty
+        """
+        key = self.get_queue_key(queue_type)
+        self.ensure_consumer_group(queue_type, group)
+
+        while True:
+            _, claimed_entries, *_ = self.xautoclaim(
+                key, group, self.consumer_name, min_idle_time=claim_idle_ms, start_id='0-0', count=1
+            )
+            if claimed_entries:
+                entry_id, fields = claimed_entries[0]
+                entry_id = entry_id.decode()
+                if fields is None:
+                    # Trimmed from the stream while pending
+                    self.ack_item(queue_type, entry_id, group)
+                    continue
+
+                pending = self.xpending_range(key, group, min=entry_id, max=entry_id, count=1)
+                times_delivered = pending[0]['times_delivered'] if pending else 1
+                if times_delivered > max_deliveries:
+                    self.dead_letter_item(
+                        queue_type, entry_id, fields, group, f"not acknowledged after {max_deliveries} deliveries"
+                    )
+                    continue
+
+                self.logger.info(f"Reclaimed pending entry {entry_id} from stream: {key} (delivery {times_delivered})")
+            else:
+                response = self.xreadgroup(
+                    group,
+                    self.consumer_name,
+                    {key: '>'},
+                    count=1,
+                    block=int(timeout * 1000) if timeout is not None else None
+                )
+                if not response:
+                    return None
+
+                entry_id, fields = response[0][1][0]
+                entry_id = entry_id.decode()
+
+            try:
+                return entry_id, self.__decode_item(queue_type, fields[b'data'])
+            except Exception as e:
+                # A payload that does not decode never will, retrying it only blocks the consumers
+                self.dead_letter_item(queue_type, entry_id, fields, group, f"failed to decode: {e}")
+
+    def dead_letter_item(
+            self,
+            queue_type: QueueType,
+            entry_id: str,
+            fields: Dict[bytes, bytes],
+            group: str = DEFAULT_CONSUMER_GROUP,
+            reason: str = ''
+    ):
+        """
+        Move a stream entry to the dead-letter stream and acknowledge it, so it is not delivered again
+
+        :param queue_type: Queue type
+        :param entry_id: Entry id
+        :param fields: Entry fields
+        :param group: Consumer group name
+        :param reason: Why the entry was dead-lettered
+        """
+        dead_letter_key = self.get_dead_letter_key(queue_type)
+        self.xadd(
+            dead_letter_key,
+            {**fields, 'entry_id': entry_id, 'group': group, 'reason': reason},
+            maxlen=DEFAULT_STREAM_MAXLEN,
+            approximate=True
+        )
+        self.ack_item(queue_type, entry_id, group)
+        self.logger.error(f"Moved entry {entry_id} to dead-letter stream {dead_letter_key}: {reason}")
+
+    def ack_item(self, queue_type: QueueType, entry_id: str, group: str = DEFAULT_CONSUMER_GROUP) -> bool:
+        """
+        Acknowledge a stream item once it has been processed
+
+        :param queue_type: Queue type
+        :param entry_id: Entry id returned by read_item
+        :param group: Consumer group name
+        :return: True or False
+        """
+        return self.xack(self.get_queue_key(queue_type), group, entry_id) == 1
+
+    def __decode_item(self, queue_type: QueueType, data: bytes) -> dict | pd.DataFrame:
+        if queue_type == QueueType.LIQUIDATOR_QUEUE:
             data = json.loads(data)
             self.logger.info(f"Received liquidation data from queue: {queue_type.name}")
-        elif queue_type == QueueType.DATA_MANAGER_QUEUE:
-            data = self.lpop(queue_type.name)
-            data = pd.read_json(data)
-            self.logger.info(f"Received data from queue: {queue_type.name}")
         else:
-            raise Exception("Unknown queue type")
+            data = decode_dataframe(data)
+            self.logger.info(f"Received data from queue: {queue_type.name}")
 
         return data
@@ -15,6 +15,7 @@ class UserAccountDataViewSchema(Schema):
     current_ltv = fields.Float(required=True)  # uint256
     health_factor = fields.Float(required=True)  # uint256
     protocol_name = fields.Str(required=True)  # str
+    block_number = fields.Int(allow_none=True, missing=None)  # block the data was read at
 
     @pre_load
     def process_input(self, data, **kwargs):
@@ -52,6 +53,7 @@ class UserAccountReservesDataViewSchema(Schema):
     account_address = fields.Str(required=True, validate=validate.Length(min=42, max=42)) # address
     reserves = fields.Nested(ReserveDataViewSchema, many=True)
     protocol_name = fields.Str(required=True)  # str
+    block_number = fields.Int(allow_none=True, missing=None)  # block the data was read at
 
 
 class PositionRecordSchema(UserAccountDataViewSchema, UserAccountReservesDataViewSchema):
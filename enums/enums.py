@@ -50,6 +50,10 @@ class LendingPoolUIDataContract(Enum):
 class SearchTypes(Enum):
     RECENT_BORROWS = 1
     FROM_RECORDS = 2
+    OFF_CHAIN_HEALTH_FACTOR = 3
+    TIERED = 4
+    PRICE_TRIGGERED = 5
+    DIRTY_ACCOUNTS = 6
 
 
 class QueueType(Enum):
@@ -57,6 +61,30 @@ class QueueType(Enum):
     LIQUIDATOR_QUEUE = 2
 
 
+class QueueMode(Enum):
+    FIFO = 1
+    PRIORITY = 2
+    STREAM = 3
+
+
+class PayloadCodec(Enum):
+    JSON = 0
+    COLUMNAR = 1
+    ARROW = 2
+
+
+class PayloadCompression(Enum):
+    NONE = 0
+    ZLIB = 1
+
+
 class Events(Enum):
     BORROW = "Borrow"
     NEW_SILO = "NewSilo"
+    SUPPLY = "Supply"
+    DEPOSIT = "Deposit"
+    WITHDRAW = "Withdraw"
+    REPAY = "Repay"
+    LIQUIDATION_CALL = "LiquidationCall"
+    RESERVE_USED_AS_COLLATERAL_ENABLED = "ReserveUsedAsCollateralEnabled"
+    RESERVE_USED_AS_COLLATERAL_DISABLED = "ReserveUsedAsCollateralDisabled"
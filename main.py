@@ -50,41 +50,46 @@ if __name__ == "__main__":
         logger.critical("Failed to initialize provider")
         raise
 
-    user_position_data = []
+    # Interfaces construct at once and discover borrowers in the background, so every protocol scans concurrently
+    contract_interfaces = {}
     for lending_protocol in LendingProtocol:
         if lending_protocol in CONFIGURED_PROTOCOLS:
             for lending_pool_contract_address in LendingPoolAddresses:
                 if lending_pool_contract_address.name == lending_protocol.name:
-                    try:
-                        # TODO - Add contract interface to bot
-                        contract_interface = LendingPoolContractInterface(
-                            address=lending_pool_contract_address.value,
-                            provider=provider,
-                            protocol_name=lending_protocol.name
-                        )
-                        logger.info(
-                            f"{lending_protocol.name}_RECENT_BORROW_EVENTS: {contract_interface.events}"
-                        )
-                        logger.info(
-                            f"{lending_protocol.name}_RECENT_BORROWERS: {contract_interface.recent_borrowers}"
-                        )
-                    except Exception as e:
-                        logger.error(f"Error: {e}")
-
-                    for recent_borrower in contract_interface.recent_borrowers:
-                        return_data = contract_interface.get_user_account_data(recent_borrower['account_address'])
-
-                        position_data = UserAccountDataViewSchema().load({
-                            "account_address": recent_borrower['account_address'],
-                            "total_collateral_eth": return_data[0],
-                            "total_debt_eth": return_data[1],
-                            "available_borrow_eth": return_data[2],
-                            "current_liquidation_threshold": return_data[3],
-                            "current_ltv": return_data[4],
-                            "health_factor": return_data[5],
-                            "protocol_name": lending_protocol.name
-                        })
-                        user_position_data.append(position_data)
+                    # TODO - Add contract interface to bot
+                    contract_interfaces[lending_protocol.name] = LendingPoolContractInterface(
+                        address=lending_pool_contract_address.value,
+                        provider=provider,
+                        protocol_name=lending_protocol.name
+                    )
+
+    user_position_data = []
+    for protocol_name, contract_interface in contract_interfaces.items():
+        try:
+            contract_interface.wait_until_ready()
+            logger.info(
+                f"{protocol_name}_RECENT_BORROW_EVENTS: {contract_interface.events}"
+            )
+            logger.info(
+                f"{protocol_name}_RECENT_BORROWERS: {contract_interface.recent_borrowers}"
+            )
+        except Exception as e:
+            logger.error(f"Error: {e}")
+
+        for recent_borrower in contract_interface.recent_borrowers:
+            return_data = contract_interface.get_user_account_data(recent_borrower['account_address'])
+
+            position_data = UserAccountDataViewSchema().load({
+                "account_address": recent_borrower['account_address'],
+                "total_collateral_eth": return_data[0],
+                "total_debt_eth": return_data[1],
+                "available_borrow_eth": return_data[2],
+                "current_liquidation_threshold": return_data[3],
+                "current_ltv": return_data[4],
+                "health_factor": return_data[5],
+                "protocol_name": protocol_name
+            })
+            user_position_data.append(position_data)
 
     df = pandas.DataFrame.from_records(user_position_data)
     df = df.drop_duplicates(subset=['account_address', 'protocol_name'], keep='last')
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+
+from eth_utils import event_abi_to_log_topic, function_abi_to_4byte_selector
+from eth_utils.abi import collapse_if_tuple
+
+# Process-wide registry of parsed ABIs, contract handles, function selectors and event topics. Every interface in the
+# process shares it, so each ABI file is parsed once and each (web3, address, ABI) handle is built once.
+
+ABI_DIR = os.path.join(os.path.dirname(__file__), 'contracts/abi')
+
+_lock = threading.RLock()
+# ABI file path -> parsed ABI
+_abis: Dict[str, List[Dict]] = {}
+# id of a registered ABI -> (ABI key, ABI). The ABI is kept so its id is never reused
+_abi_keys: Dict[int, Tuple[str, List[Dict]]] = {}
+# (web3, checksum address, ABI key) -> contract handle
+_contract_handles: Dict[Tuple[object, str, str], object] = {}
+# ABI key -> {function signature: function ABI}
+_function_abis: Dict[str, Dict[str, Dict]] = {}
+# ABI key -> {function signature: 4 byte selector}
+_function_selectors: Dict[str, Dict[str, bytes]] = {}
+# ABI key -> {event name: topic}
+_event_topics: Dict[str, Dict[str, bytes]] = {}
+
+
+def load_abi(abi_path: str) -> List[Dict]:
+    """
+    Load an ABI JSON file once per process
+
+    :param abi_path: Path of the ABI file, relative to sol/contracts/abi unless absolute
+    :return: Parsed ABI, shared by every caller. Do not modify it
+    """
+    if not os.path.isabs(abi_path):
+        abi_path = os.path.join(ABI_DIR, abi_path)
+
+    with _lock:
+        if abi_path not in _abis:
+            with open(abi_path) as abi_json:
+                _abis[abi_path] = json.load(abi_json)
+
+        return _abis[abi_path]
+
+
+def register_abi(abi: List[Dict]) -> str:
+    """
+    Get the key an ABI is cached under
+
+    :param abi:
+    :return: ABI key, the same for equal ABIs
+    """
+    with _lock:
+        if id(abi) not in _abi_keys:
+            abi_key = hashlib.sha1(json.dumps(abi, sort_keys=True).encode()).hexdigest()
+            _abi_keys[id(abi)] = (abi_key, abi)
+
+        return _abi_keys[id(abi)][0]
+
+
+def get_contract_handle(w3, address: str, abi: List[Dict]):
+    """
+    Get a cached web3 contract handle
+
+    :param w3: Web3 or AsyncWeb3 instance the handle is bound to
+    :param address: Contract address
+    :param abi: Contract ABI
+    :return: Contract handle
+    """
+    abi_key = register_abi(abi)
+    handle_key = (w3, address, abi_key)
+
+    with _lock:
+        if handle_key not in _contract_handles:
+            _contract_handles[handle_key] = w3.eth.contract(address=address, abi=abi)
+
+        return _contract_handles[handle_key]
+
+
+def get_function_abis(abi: List[Dict]) -> Dict[str, Dict]:
+    """
+    Get the ABI of every function of an ABI
+
+    :param abi:
+    :return: Function ABIs keyed by function signature (ex. transfer(address,uint256))
+    """
+    abi_key = register_abi(abi)
+
+    with _lock:
+        if abi_key not in _function_abis:
+            _function_abis[abi_key] = {
+                f"{item['name']}({','.join(collapse_if_tuple(abi_input) for abi_input in item['inputs'])})": item
+                for item in abi if item.get('type') == 'function'
+            }
+
+        return _function_abis[abi_key]
+
+
+def get_function_selectors(abi: List[Dict]) -> Dict[str, bytes]:
+    """
+    Get the 4 byte selector of every function of an ABI
+
+    :param abi:
+    :return: Selectors keyed by function signature (ex. transfer(address,uint256))
+    """
+    abi_key = register_abi(abi)
+
+    with _lock:
+        if abi_key not in _function_selectors:
+            _function_selectors[abi_key] = {
+                function_signature: function_abi_to_4byte_selector(function_abi)
+                for function_signature, function_abi in get_function_abis(abi).items()
+            }
+
+        return _function_selectors[abi_key]
+
+
+def get_event_topics(abi: List[Dict]) -> Dict[str, bytes]:
+    """
+    Get the topic of every event of an ABI
+
+    :param abi:
+    :return: Topics keyed by event name
+    """
+    abi_key = register_abi(abi)
+
+    with _lock:
+        if abi_key not in _event_topics:
+            _event_topics[abi_key] = {
+                item['name']: event_abi_to_log_topic(item)
+                for item in abi if item.get('type') == 'event'
+            }
+
+        return _event_topics[abi_key]
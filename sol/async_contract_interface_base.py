@@ -0,0 +1,36 @@
+from typing import List, Dict
+
+from app_logger.logger import Logger
+from .provider.async_provider import AsyncProvider
+from .abi_registry import get_contract_handle
+
+
+# Async interface for the contract
+class AsyncContractInterfaceBase:
+    def __init__(self, address: str, abi: List[Dict], provider: AsyncProvider):
+        self.address = address
+        self.abi = abi
+        self.provider = provider
+        self.contract_handle = get_contract_handle(self.provider.w3, self.address, self.abi)
+
+        self.logger = Logger(section_name=__name__)
+
+    async def call(self, contract_function_handle, block_identifier="latest"):
+        """
+        Call a contract view function, bounded by the provider's concurrency semaphore
+
+        :param contract_function_handle: Bound async contract function
+        :param block_identifier: Block to call the function at
+        :return: Function return values
+        """
+        async with self.provider.semaphore:
+            return await contract_function_handle.call(block_identifier=block_identifier)
+
+    def contract_functions(self):
+        return self.contract_handle.functions
+
+    def get_address(self):
+        return self.address
+
+    def get_abi(self):
+        return self.abi
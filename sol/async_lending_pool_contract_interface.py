@@ -0,0 +1,43 @@
+from typing import Optional, List
+
+from enums.enums import LendingProtocol
+
+from app_logger.logger import Logger
+from .async_contract_interface_base import AsyncContractInterfaceBase
+from .abi_registry import load_abi
+from .provider.async_provider import AsyncProvider
+
+
+class AsyncLendingPoolContractInterface(AsyncContractInterfaceBase):
+    """
+    Async lending pool contract interface. Borrower discovery stays on LendingPoolContractInterface, this interface
+    only serves account reads.
+    """
+    def __init__(self, address: str, provider: AsyncProvider, protocol_name: str):
+        abi = load_abi(f'lending_protocols/{protocol_name}_LENDING_POOL.json')
+
+        self.protocol_name = protocol_name
+
+        super().__init__(address, abi, provider)
+
+        logger_section_name = f"{__name__}.{protocol_name}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    async def get_user_account_data(self, user_address: str, block_identifier="latest") -> Optional[List]:
+        self.logger.info(f"Getting user account data for {user_address} from {self.protocol_name} contract")
+
+        if self.protocol_name in [LendingProtocol.AAVE_ARBITRUM.name, LendingProtocol.RADIANT_ARBITRUM.name]:
+            contract_function_handle = self.contract_handle.functions.getUserAccountData(user_address)
+        elif self.protocol_name == LendingProtocol.SILO_ARBITRUM.name:
+            contract_function_handle = self.contract_handle.functions.silos(user_address)
+        else:
+            raise Exception("Unknown protocol name")
+
+        try:
+            account_data = await self.call(contract_function_handle, block_identifier=block_identifier)
+            self.logger.info(f"User account data for {user_address}: {account_data}")
+        except Exception as e:
+            self.logger.error(f"Failed to get user account data for {user_address}: {e}")
+            account_data = None
+
+        return account_data
@@ -0,0 +1,63 @@
+from typing import Dict, List
+from app_logger.logger import Logger
+from .async_contract_interface_base import AsyncContractInterfaceBase
+from .abi_registry import load_abi
+from .provider.async_provider import AsyncProvider
+
+
+class AsyncOracleContractInterface(AsyncContractInterfaceBase):
+    """
+    Async oracle contract interface
+    """
+    def __init__(self, address: str, provider: AsyncProvider, protocol_name: str):
+        """
+        Initialize async oracle contract interface
+        :param address:
+        :param provider:
+        :param protocol_name:
+        """
+        abi = load_abi(f'lending_protocols/{protocol_name}_ORACLE.json')
+
+        super().__init__(address, abi, provider)
+
+        self.logger = Logger(section_name=__name__)
+
+    async def get_asset_price_usd(self, asset_address: str, block_identifier="latest"):
+        """
+        Get asset price in USD given asset address
+        :param asset_address:
+        :param block_identifier:
+        :return: Asset price in USD
+        """
+        contract_function_handle = self.contract_handle.functions.getAssetPrice(asset_address)
+
+        self.logger.info(f"Calling contract function: {contract_function_handle}")
+        try:
+            asset_price = await self.call(contract_function_handle, block_identifier=block_identifier)
+            asset_price_usd = asset_price / 10 ** 8
+            self.logger.info(f"Asset {asset_address} price: ${asset_price_usd}")
+        except Exception as e:
+            self.logger.error(f"Failed to get asset price for {asset_address}: {e}")
+            asset_price_usd = 0
+
+        return asset_price_usd
+
+    async def get_assets_prices_usd(self, asset_addresses: List[str], block_identifier="latest") -> Dict[str, float]:
+        """
+        Get asset prices in USD for many assets with a single getAssetsPrices call
+        :param asset_addresses:
+        :param block_identifier:
+        :return: Asset prices in USD keyed by asset address
+        """
+        contract_function_handle = self.contract_handle.functions.getAssetsPrices(asset_addresses)
+
+        self.logger.info(f"Calling contract function: {contract_function_handle}")
+        try:
+            asset_prices = await self.call(contract_function_handle, block_identifier=block_identifier)
+        except Exception as e:
+            self.logger.error(f"Failed to get asset prices for {asset_addresses}: {e}")
+            return {}
+
+        return {
+            asset_address: asset_price / 10 ** 8 for asset_address, asset_price in zip(asset_addresses, asset_prices)
+        }
@@ -0,0 +1,62 @@
+from typing import Dict, Optional, List
+from dotenv import dotenv_values, find_dotenv
+
+from enums.enums import LendingProtocol
+
+from app_logger.logger import Logger
+from .async_contract_interface_base import AsyncContractInterfaceBase
+from .abi_registry import load_abi
+from .provider.async_provider import AsyncProvider
+
+config = dotenv_values(dotenv_path=find_dotenv())
+
+
+class AsyncUIPoolDataContractInterface(AsyncContractInterfaceBase):
+    def __init__(self, address: str, provider: AsyncProvider, protocol_name: str):
+        abi = load_abi(f'lending_protocols/{protocol_name}_UI_POOL_DATA_PROVIDER.json')
+
+        self.protocol_name = protocol_name
+
+        if protocol_name == LendingProtocol.AAVE_ARBITRUM.name:
+            self.address_provider_address = config["AAVE_ARBITRUM_POOL_CONTRACT_ADDRESS_PROVIDER"]
+        elif protocol_name == LendingProtocol.RADIANT_ARBITRUM.name:
+            self.address_provider_address = config["RADIANT_ARBITRUM_POOL_CONTRACT_ADDRESS_PROVIDER"]
+        elif protocol_name == LendingProtocol.SILO_ARBITRUM.name:
+            self.address_provider_address = config["SILO_ARBITRUM_POOL_CONTRACT_ADDRESS_PROVIDER"]
+        else:
+            raise Exception("Unknown protocol name")
+
+        super().__init__(address, abi, provider)
+
+        logger_section_name = f"{__name__}.{protocol_name}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    async def get_user_reserves_data(self, user_address: str, block_identifier="latest") -> Optional[List]:
+        contract_function_handle = self.contract_handle.functions.getUserReservesData(
+            self.address_provider_address,
+            user_address
+        )
+
+        self.logger.info(f"Calling contract function: {contract_function_handle}")
+        try:
+            return await self.call(contract_function_handle, block_identifier=block_identifier)
+        except Exception as e:
+            self.logger.error(f"Failed to get user reserves data for {user_address}: {e}")
+            return None
+
+    async def get_reserves_data(self, block_identifier="latest") -> List[Dict]:
+        """
+        Get the configuration and state of every reserve in the pool
+
+        :param block_identifier: Block to read the reserves at
+        :return: List of reserve dicts keyed by the AggregatedReserveData field names
+        """
+        contract_function_handle = self.contract_handle.functions.getReservesData(self.address_provider_address)
+
+        self.logger.info(f"Calling contract function: {contract_function_handle}")
+        reserves, base_currency_info = await self.call(contract_function_handle, block_identifier=block_identifier)
+
+        reserve_field_names = [
+            component['name'] for component in contract_function_handle.abi['outputs'][0]['components']
+        ]
+        return [dict(zip(reserve_field_names, reserve)) for reserve in reserves]
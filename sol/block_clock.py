@@ -0,0 +1,152 @@
+import json
+import time
+import asyncio
+import threading
+from typing import Optional
+
+import websockets
+
+from app_logger.logger import Logger
+from .provider.provider import Provider
+
+# Seconds between eth_blockNumber polls when no websocket subscription is available
+DEFAULT_POLL_INTERVAL = 0.25
+# Seconds to wait before resubscribing after the websocket connection drops
+DEFAULT_RECONNECT_DELAY = 1.0
+
+
+class BlockClock:
+    """
+    Block clock. Tracks the chain head in a background thread, from a newHeads subscription when the provider has a
+    websocket url and from eth_blockNumber polling otherwise. Consumers block on wait_for_new_block to run once per
+    block.
+    """
+    def __init__(
+            self,
+            provider: Provider,
+            poll_interval: float = DEFAULT_POLL_INTERVAL,
+            reconnect_delay: float = DEFAULT_RECONNECT_DELAY
+    ):
+        """
+        Initialize the BlockClock class
+
+        :param provider: Provider used for polling, its ws_url is used for the newHeads subscription
+        :param poll_interval: Seconds between polls when falling back to eth_blockNumber
+        :param reconnect_delay: Seconds to wait before resubscribing after a dropped connection
+        """
+        self.provider = provider
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+
+        self.block_number: Optional[int] = None
+        self.block_timestamp: Optional[int] = None
+        # Local time the current head was detected at
+        self.received_at: Optional[float] = None
+
+        self.__condition = threading.Condition()
+        self.__stop_event = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+        logger_section_name = f"{__class__}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def start(self):
+        """
+        Start following the chain head in a background thread
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, name="block-clock", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop following the chain head
+        """
+        self.__stop_event.set()
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def wait_for_new_block(self, last_block_number: Optional[int] = None, timeout: float = None) -> Optional[int]:
+        """
+        Block until a head newer than last_block_number is seen
+
+        :param last_block_number: Last block the caller processed. If None, returns as soon as any head is known
+        :param timeout: Maximum number of seconds to wait
+        :return: Newest block number, or None on timeout or stop
+        """
+        self.start()
+
+        def has_new_block():
+            if self.__stop_event.is_set():
+                return True
+            if self.block_number is None:
+                return False
+            return last_block_number is None or self.block_number > last_block_number
+
+        with self.__condition:
+            self.__condition.wait_for(has_new_block, timeout=timeout)
+            if self.__stop_event.is_set() or not has_new_block():
+                return None
+
+            return self.block_number
+
+    def __set_head(self, block_number: int, block_timestamp: int):
+        with self.__condition:
+            if self.block_number is not None and block_number <= self.block_number:
+                return
+
+            self.block_number = block_number
+            self.block_timestamp = block_timestamp
+            self.received_at = time.time()
+            self.__condition.notify_all()
+
+        self.logger.info(f"New block {block_number}, detected {self.received_at - block_timestamp:.3f}s after mining")
+
+    def __run(self):
+        while not self.__stop_event.is_set():
+            if self.provider.ws_url:
+                try:
+                    asyncio.run(self.__subscribe())
+                except Exception as e:
+                    self.logger.error(f"newHeads subscription failed, polling until reconnect: {e}")
+                    self.__poll(until=time.time() + self.reconnect_delay)
+            else:
+                self.__poll()
+
+    async def __subscribe(self):
+        async with websockets.connect(self.provider.ws_url) as ws:
+            await ws.send(json.dumps({
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": "eth_subscribe",
+                "params": ["newHeads"]
+            }))
+            subscription = json.loads(await ws.recv())
+            if 'error' in subscription:
+                raise Exception(subscription['error'])
+
+            self.logger.info(f"Subscribed to newHeads: {subscription['result']}")
+            while not self.__stop_event.is_set():
+                try:
+                    message = json.loads(await asyncio.wait_for(ws.recv(), timeout=self.reconnect_delay))
+                except asyncio.TimeoutError:
+                    continue
+
+                head = message.get('params', {}).get('result')
+                if head:
+                    self.__set_head(int(head['number'], 16), int(head['timestamp'], 16))
+
+    def __poll(self, until: float = None):
+        while not self.__stop_event.is_set() and (until is None or time.time() < until):
+            try:
+                block_number = self.provider.w3.eth.get_block_number()
+                if self.block_number is None or block_number > self.block_number:
+                    block = self.provider.w3.eth.get_block(block_number)
+                    self.__set_head(block['number'], block['timestamp'])
+            except Exception as e:
+                self.logger.error(f"Failed to poll block number: {e}")
+
+            self.__stop_event.wait(self.poll_interval)
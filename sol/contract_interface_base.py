@@ -1,11 +1,80 @@
-import json
-import os
-from typing import List, Dict
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Optional
 from web3 import Web3
 from web3.logs import DISCARD
+from eth_utils.abi import collapse_if_tuple
 
 from app_logger.logger import Logger
 from .provider.provider import Provider
+from .provider.nonce_manager import is_nonce_error
+from .abi_registry import load_abi, get_contract_handle, get_function_abis, get_function_selectors, get_event_topics
+
+# eth_getLogs backfill windows, in blocks
+DEFAULT_LOG_WINDOW_SIZE = 10000
+MIN_LOG_WINDOW_SIZE = 1
+MAX_LOG_WINDOW_SIZE = 500000
+DEFAULT_LOG_WORKERS = 4
+# Windows returning fewer logs than this are considered sparse and the window grows
+SPARSE_LOG_WINDOW_RESULTS = 1000
+
+# Error fragments providers return when a log query spans too many blocks or results. Generic codes and "limit
+# exceeded" are left out, providers return them for rate limits too and splitting only sends more requests
+LOG_RANGE_TOO_LARGE_ERRORS = [
+    "query returned more than",
+    "response size exceeded",
+    "response size should not greater than",
+    "block range is too large",
+    "block range too large",
+    "exceed maximum block range",
+    "eth_getlogs is limited to",
+]
+# Error fragments providers return when requests are rate limited
+RATE_LIMIT_ERRORS = [
+    "429",
+    "too many requests",
+    "rate limit",
+    "request rate exceeded",
+    "exceeded its compute units",
+    "capacity exceeded",
+]
+# Retries of a rate limited log window, waiting twice as long every time
+LOG_RATE_LIMIT_RETRIES = 5
+LOG_RATE_LIMIT_BACKOFF = 1
+MAX_LOG_RATE_LIMIT_BACKOFF = 30
+
+
+# Block timestamps shared by every interface, keyed by (rpc url, block number)
+BLOCK_TIMESTAMP_CACHE_SIZE = 65536
+_block_timestamp_cache: OrderedDict = OrderedDict()
+_block_timestamp_cache_lock = threading.Lock()
+
+
+def is_log_range_too_large_error(err: Exception) -> bool:
+    """
+    Check if an eth_getLogs error means the requested range has to be split
+    :param err: Error raised by get_logs
+    :return: True or False
+    """
+    message = str(err).lower()
+    return any(fragment in message for fragment in LOG_RANGE_TOO_LARGE_ERRORS)
+
+
+def is_rate_limit_error(err: Exception) -> bool:
+    """
+    Check if an RPC error means the request was rate limited
+    :param err: Error raised by the request
+    :return: True or False
+    """
+    message = str(err).lower()
+    return any(fragment in message for fragment in RATE_LIMIT_ERRORS)
+
+
+def _get_logs_after(delay: float, get_logs, from_block: int, to_block: int):
+    time.sleep(delay)
+    return get_logs(from_block, to_block)
 
 
 # Interface for the contract
@@ -14,21 +83,23 @@ class ContractInterfaceBase:
         self.address = address
         self.abi = abi
         self.provider = provider
-        self.contract_handle = self.__create_contract_handler()
+        self.contract_handle = get_contract_handle(self.provider.w3, self.address, self.abi)
 
         self.logger = Logger(section_name=__name__)
 
-        cur_dir = os.path.dirname(__file__)
-        abi_file_path = os.path.join(cur_dir, 'contracts/abi/erc20_abi.json')
-        with open(abi_file_path, "r") as f:
-            self.erc_20_abi = json.load(f)
+        self.erc_20_abi = load_abi('erc20_abi.json')
+        # Precomputed from the ABI once per process, keyed by function signature and by event name
+        self.function_abis = get_function_abis(self.abi)
+        self.function_selectors = get_function_selectors(self.abi)
+        self.event_topics = get_event_topics(self.abi)
 
         self.erc20_max_approved = []
 
-    def __create_contract_handler(self, is_erc20=False, contract_address=None):
-        if is_erc20:
-            return self.provider.w3.eth.contract(address=contract_address, abi=self.erc_20_abi)
-        return self.provider.w3.eth.contract(address=self.address, abi=self.abi)
+        # Adapted by get_event_logs and kept between calls
+        self.log_window_size = DEFAULT_LOG_WINDOW_SIZE
+
+    def __get_erc20_handle(self, token_address):
+        return get_contract_handle(self.provider.w3, token_address, self.erc_20_abi)
 
     def token_approve(self, token_address, amount=None):
         if amount is None:
@@ -40,7 +111,7 @@ class ContractInterfaceBase:
             else:
                 self.erc20_max_approved.append(token_address)
 
-        contract_handle = self.__create_contract_handler(is_erc20=True, contract_address=token_address)
+        contract_handle = self.__get_erc20_handle(token_address)
         contract_function_handle = contract_handle.functions.approve(self.address, amount)
         txn_receipt = self.send_txn(contract_function_handle, signing_needed=True)
         if txn_receipt["status"] == 0:
@@ -58,7 +129,7 @@ class ContractInterfaceBase:
         if token_address not in self.erc20_max_approved:
             return False
 
-        contract_handle = self.__create_contract_handler(is_erc20=True, contract_address=token_address)
+        contract_handle = self.__get_erc20_handle(token_address)
         contract_function_handle = contract_handle.functions.transferFrom(
             self.provider.get_wallet_address(),
             self.address,
@@ -70,7 +141,7 @@ class ContractInterfaceBase:
         return True
 
     def get_token_balance(self, token_address, wallet=None, contract=None):
-        contract_handle = self.__create_contract_handler(is_erc20=True, contract_address=token_address)
+        contract_handle = self.__get_erc20_handle(token_address)
         if wallet:
             balance = contract_handle.functions.balanceOf(self.provider.get_wallet_address()).call()
             return Web3.from_wei(balance, "ether")
@@ -78,15 +149,44 @@ class ContractInterfaceBase:
             balance = contract_handle.functions.balanceOf(self.address).call()
             return Web3.from_wei(balance, "ether")
 
-    def get_event_logs(self, event_name, from_block=None, to_block="latest", blocks_back=1000):
+    def get_event_logs(
+            self,
+            event_name,
+            from_block=None,
+            to_block="latest",
+            blocks_back=1000,
+            max_workers=DEFAULT_LOG_WORKERS
+    ):
+        """
+        Get event logs over a block range. The range is split into windows fetched in parallel. A window is halved
+        when the provider rejects it as too large, and the window size grows again while responses are sparse.
+
+        :param event_name: Name of the event
+        :param from_block: First block of the range, defaults to blocks_back blocks before to_block
+        :param to_block: Last block of the range
+        :param blocks_back: Number of blocks to scan when from_block is not set
+        :param max_workers: Maximum number of get_logs requests in flight
+        :return: List of {event name: event args} in block order
+        """
         events = []
 
         event_handle = getattr(self.event_handle(), event_name)()
 
-        if from_block is None:
-            from_block = self.provider.w3.eth.get_block_number() - blocks_back
+        if to_block == "latest":
+            to_block = self.provider.w3.eth.get_block_number()
 
-        logs = event_handle.get_logs(fromBlock=from_block, toBlock=to_block)
+        if from_block is None:
+            from_block = to_block - blocks_back
+
+        logs = self.get_logs_in_windows(
+            lambda window_from_block, window_to_block: event_handle.get_logs(
+                fromBlock=window_from_block, toBlock=window_to_block
+            ),
+            from_block,
+            to_block,
+            label=event_name,
+            max_workers=max_workers
+        )
         for log in logs:
             event_dict = {log.event: log.args}
             events.append(event_dict)
@@ -94,13 +194,150 @@ class ContractInterfaceBase:
 
         return events
 
+    def get_multi_event_logs(
+            self,
+            event_names: List[str],
+            from_block: int,
+            to_block: int,
+            max_workers=DEFAULT_LOG_WORKERS
+    ):
+        """
+        Get the logs of several events of the contract with one multi-topic filter per block window
+
+        :param event_names: Names of the events, events missing from the ABI are ignored
+        :param from_block: First block of the range
+        :param to_block: Last block of the range
+        :param max_workers: Maximum number of get_logs requests in flight
+        :return: List of {event name: event args} in block and log order
+        """
+        contract_events = {
+            self.event_topics[event_name]: getattr(self.event_handle(), event_name)()
+            for event_name in event_names
+            if event_name in self.event_topics
+        }
+        if not contract_events:
+            return []
+
+        log_filter = {'address': self.address, 'topics': [[Web3.to_hex(topic) for topic in contract_events]]}
+        logs = self.get_logs_in_windows(
+            lambda window_from_block, window_to_block: self.provider.w3.eth.get_logs(
+                {**log_filter, 'fromBlock': window_from_block, 'toBlock': window_to_block}
+            ),
+            from_block,
+            to_block,
+            label=",".join(event_names),
+            max_workers=max_workers
+        )
+
+        events = []
+        for log in logs:
+            decoded_log = contract_events[bytes(log['topics'][0])].process_log(log)
+            events.append({decoded_log['event']: decoded_log['args']})
+
+        return events
+
+    def get_logs_in_windows(
+            self,
+            get_logs,
+            from_block: int,
+            to_block: int,
+            label: str = "",
+            max_workers=DEFAULT_LOG_WORKERS
+    ):
+        """
+        Run a get_logs function over a block range split into windows fetched in parallel. A window is halved when
+        the provider rejects it as too large, and the window size grows again while responses are sparse. Rate
+        limited windows are retried as they are, after an exponential backoff.
+
+        :param get_logs: Function of (from_block, to_block) returning the logs of that window
+        :param from_block: First block of the range
+        :param to_block: Last block of the range
+        :param label: Name of the logs, used for logging
+        :param max_workers: Maximum number of get_logs requests in flight
+        :return: Logs of the whole range in block order
+        """
+        logs_by_window = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            next_from_block = from_block
+            while next_from_block <= to_block or pending:
+                while next_from_block <= to_block and len(pending) < max_workers:
+                    window_to_block = min(next_from_block + self.log_window_size - 1, to_block)
+                    future = executor.submit(get_logs, next_from_block, window_to_block)
+                    pending[future] = (next_from_block, window_to_block, 0)
+                    next_from_block = window_to_block + 1
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    window_from_block, window_to_block, retries = pending.pop(future)
+                    try:
+                        logs = future.result()
+                    except Exception as err:
+                        if is_rate_limit_error(err) and retries < LOG_RATE_LIMIT_RETRIES:
+                            # Splitting would only send more requests, the same window is retried later instead
+                            delay = min(LOG_RATE_LIMIT_BACKOFF * 2 ** retries, MAX_LOG_RATE_LIMIT_BACKOFF)
+                            self.logger.warning(
+                                f"{label} logs {window_from_block}-{window_to_block} rate limited, retrying in {delay}s"
+                            )
+                            retry_future = executor.submit(
+                                _get_logs_after, delay, get_logs, window_from_block, window_to_block
+                            )
+                            pending[retry_future] = (window_from_block, window_to_block, retries + 1)
+                            continue
+                        if not is_log_range_too_large_error(err) or window_from_block == window_to_block:
+                            raise
+
+                        # Split the window in two and shrink the following windows
+                        middle_block = (window_from_block + window_to_block) // 2
+                        self.log_window_size = max(
+                            MIN_LOG_WINDOW_SIZE, (window_to_block - window_from_block + 1) // 2
+                        )
+                        self.logger.info(
+                            f"{label} logs {window_from_block}-{window_to_block} too large, "
+                            f"window size is now {self.log_window_size}"
+                        )
+                        for split_from_block, split_to_block in [
+                            (window_from_block, middle_block), (middle_block + 1, window_to_block)
+                        ]:
+                            split_future = executor.submit(get_logs, split_from_block, split_to_block)
+                            pending[split_future] = (split_from_block, split_to_block, 0)
+                        continue
+
+                    logs_by_window[window_from_block] = logs
+                    if len(logs) < SPARSE_LOG_WINDOW_RESULTS:
+                        self.log_window_size = min(MAX_LOG_WINDOW_SIZE, self.log_window_size * 2)
+
+        return [log for window_from_block in sorted(logs_by_window) for log in logs_by_window[window_from_block]]
+
+    def encode_function_call(self, function_signature: str, args: tuple) -> bytes:
+        """
+        Encode the call data of a function from its precomputed selector, without building a contract function
+
+        :param function_signature: Function signature (ex. getUserAccountData(address))
+        :param args: Function arguments
+        :return: Call data
+        """
+        input_types = [collapse_if_tuple(abi_input) for abi_input in self.function_abis[function_signature]['inputs']]
+        return self.function_selectors[function_signature] + self.provider.w3.codec.encode(input_types, args)
+
     def contract_functions(self):
         return self.contract_handle.functions
 
-    def send_txn(self, contract_function_handle, signing_needed=False):
+    def send_txn(self, contract_function_handle, signing_needed=False, wait_for_receipt=True):
+        """
+        Build and send a transaction with a nonce from the provider's nonce manager
+
+        :param contract_function_handle: Bound contract function
+        :param signing_needed: Sign with the wallet key instead of having the node sign
+        :param wait_for_receipt: Block until the transaction is mined. If False, the transaction hash is returned as
+            soon as it is sent, for a ReceiptTracker to settle
+        :return: Transaction receipt, or transaction hash if wait_for_receipt is False
+        """
+        nonce_manager = self.provider.nonce_manager
+        nonce = nonce_manager.allocate()
         txn = {
             "from": self.provider.get_wallet_address(),
-            "nonce": self.provider.get_nonce()
+            "nonce": nonce
         }
 
         try:
@@ -108,14 +345,24 @@ class ContractInterfaceBase:
             if signing_needed:
                 signed_txn = self.provider.w3.eth.account.sign_transaction(function_call,
                                                                            private_key=self.provider.get_wallet_private_key())
-                send_txn = self.provider.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-                txn_receipt = self.provider.w3.eth.wait_for_transaction_receipt(send_txn)
+                txn_hash = self.provider.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
             else:
-                txn_receipt = self.provider.w3.eth.send_transaction(function_call)
+                txn_hash = self.provider.w3.eth.send_transaction(function_call)
         except Exception as err:
-            print(f"Error sending txn: {err}", flush=True)
+            if is_nonce_error(err):
+                nonce_manager.resync()
+            else:
+                nonce_manager.release(nonce)
+            self.logger.error(f"Error sending txn: {err}")
             raise err
 
+        nonce_manager.mark_sent(nonce, txn_hash)
+        if not wait_for_receipt:
+            return txn_hash
+
+        txn_receipt = self.provider.w3.eth.wait_for_transaction_receipt(txn_hash)
+        nonce_manager.confirm(txn_hash)
+
         return txn_receipt
 
     def get_address(self):
@@ -127,62 +374,80 @@ class ContractInterfaceBase:
     def event_handle(self):
         return self.contract_handle.events
 
+    def get_block_timestamp(self, block_number: int) -> int:
+        """
+        Get the timestamp of a block, from the block timestamp cache shared by every interface
+
+        :param block_number:
+        :return: Block timestamp
+        """
+        cache_key = (self.provider.https_url or self.provider.ws_url, block_number)
+        with _block_timestamp_cache_lock:
+            if cache_key in _block_timestamp_cache:
+                _block_timestamp_cache.move_to_end(cache_key)
+                return _block_timestamp_cache[cache_key]
+
+        block_timestamp = self.provider.w3.eth.get_block(block_number)["timestamp"]
+
+        with _block_timestamp_cache_lock:
+            _block_timestamp_cache[cache_key] = block_timestamp
+            if len(_block_timestamp_cache) > BLOCK_TIMESTAMP_CACHE_SIZE:
+                _block_timestamp_cache.popitem(last=False)
+
+        return block_timestamp
+
     def get_block_number_from_timestamp(
             self,
             target_ts: int,
-            lower_bound_ts: int,
-            upper_bound_ts: int
-    ):
+            lower_bound_ts: Optional[int] = None,
+            upper_bound_ts: Optional[int] = None
+    ) -> Optional[Dict]:
         """
-        Get the block number from the timestamp within given bounds
+        Get the last block mined at or before target_ts, and before upper_bound_ts if it is set. The block is found
+        with an interpolation search that falls back to bisection, so only O(log n) headers are fetched.
 
         :param target_ts: Target timestamp to get the block number for
-        :param lower_bound_ts: Lower bound timestamp
-        :param upper_bound_ts: Upper bound timestamp
-        :return:
+        :param lower_bound_ts: Lower bound timestamp, a warning is logged if the block found is older
+        :param upper_bound_ts: Upper bound timestamp, exclusive
+        :return: Block number and timestamp, None if no block was mined before the bound
         """
-        avg_block_time = 13.5
-        block_number = self.provider.w3.eth.get_block_number()
-        block = self.provider.w3.eth.get_block(block_number)
-        block_timestamp = block["timestamp"]
-        current_block_timestamp = block_timestamp
-
-        block_number = block_number
-        while block_timestamp > upper_bound_ts:
-            decrease_blocks = int((block_timestamp - target_ts) / avg_block_time)
-            if decrease_blocks < 1:
-                break
-            block_number -= decrease_blocks
-            block = self.provider.w3.eth.get_block(block_number)
-            block_timestamp = block["timestamp"]
-
-        if lower_bound_ts and block_timestamp < lower_bound_ts:
-            while block_timestamp < lower_bound_ts:
-                block_number += 1
-                block = self.provider.w3.eth.get_block(block_number)
-                block_timestamp = block["timestamp"]
-
-        if upper_bound_ts:
-            if block_timestamp >= upper_bound_ts:
-                while block_timestamp >= upper_bound_ts:
-                    block_number -= 1
-                    block = self.provider.w3.eth.get_block(block_number)
-                    block_timestamp = block["timestamp"]
-
-        if block_timestamp < upper_bound_ts:
-            while block_timestamp < upper_bound_ts:
-                block_number += 1
-                if block_number > current_block_timestamp:
-                    break
-
-                temp_block = self.provider.w3.eth.get_block(block_number)
-                temp_block_timestamp = temp_block["timestamp"]
-                if temp_block_timestamp >= upper_bound_ts:
-                    break
-                block = self.provider.w3.eth.get_block(block_number)
-                block_timestamp = block["timestamp"]
+        bound_ts = target_ts + 1
+        if upper_bound_ts is not None:
+            bound_ts = min(bound_ts, upper_bound_ts)
+
+        # Invariant: timestamp(low) < bound_ts <= timestamp(high)
+        high = self.provider.w3.eth.get_block_number()
+        high_ts = self.get_block_timestamp(high)
+        if high_ts < bound_ts:
+            low, low_ts = high, high_ts
+        else:
+            low, low_ts = 0, self.get_block_timestamp(0)
+            if low_ts >= bound_ts:
+                self.logger.warning(f"No block was mined before {bound_ts}")
+                return None
+
+        interpolate = True
+        while high - low > 1:
+            if interpolate and high_ts > low_ts:
+                block_number = low + int((bound_ts - low_ts) * (high - low) / (high_ts - low_ts))
+            else:
+                block_number = (low + high) // 2
+            block_number = min(max(block_number, low + 1), high - 1)
+
+            previous_range = high - low
+            block_ts = self.get_block_timestamp(block_number)
+            if block_ts < bound_ts:
+                low, low_ts = block_number, block_ts
+            else:
+                high, high_ts = block_number, block_ts
+
+            # Bisect next if interpolation did not at least halve the range
+            interpolate = (high - low) * 2 <= previous_range
+
+        if lower_bound_ts and low_ts < lower_bound_ts:
+            self.logger.warning(f"No block between {lower_bound_ts} and {bound_ts}, closest is {low}")
 
         return {
-            'block_number': block_number,
-            'block_timestamp': block_timestamp,
+            'block_number': low,
+            'block_timestamp': low_ts,
         }
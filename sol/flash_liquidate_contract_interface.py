@@ -17,7 +17,8 @@ class FlashLiquidateContractInterface(ContractInterfaceBase):
             self,
             token0,
             loan_amount,
-            liquidate_params
+            liquidate_params,
+            wait_for_receipt=True
     ):
         """
         Description:
@@ -26,7 +27,8 @@ class FlashLiquidateContractInterface(ContractInterfaceBase):
         :param token0: Address of token0
         :param loan_amount: Amount of token0 to borrow
         :param liquidate_params: List of params for liquidate
-        :return: Receipt of transaction
+        :param wait_for_receipt: Block until the transaction is mined. If False, return the transaction hash once sent
+        :return: Receipt of transaction, or transaction hash if wait_for_receipt is False
         """
 
         token0 = Web3.to_checksum_address(token0)
@@ -39,6 +41,9 @@ class FlashLiquidateContractInterface(ContractInterfaceBase):
             loan_amount,
             liquidate_params,
         )
+        if not wait_for_receipt:
+            return self.send_txn(contract_function_handle, signing_needed=True, wait_for_receipt=False)
+
         try:
             txn_receipt = self.send_txn(contract_function_handle, signing_needed=True)
             if txn_receipt["status"] == 0:
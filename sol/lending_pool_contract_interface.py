@@ -1,26 +1,66 @@
-import os
-import json
-from typing import Dict, Optional, List
+import time
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional, List, Tuple
 from retrying import retry
 from web3 import Web3
 from web3.logs import DISCARD
 
-from enums.enums import LendingProtocol
+from enums.enums import LendingProtocol, Events
+from db.borrower_index import BorrowerIndex
 from db.schemas.position_schema import BorrowEvent
 
 from app_logger.logger import Logger
 from .contract_interface_base import ContractInterfaceBase
+from .abi_registry import load_abi
+from .multicall_contract_interface import MulticallContractInterface, DEFAULT_MULTICALL_BATCH_SIZE
 from .provider.provider import Provider
 
 
+# Number of blocks scanned for borrower events when no cursor is known
+DEFAULT_BORROWER_BLOCKS_BACK = 499999
+
+# Pool events that change a position, and the event argument holding the affected account
+POSITION_EVENT_ACCOUNT_ARGS = {
+    Events.SUPPLY.value: 'onBehalfOf',
+    Events.DEPOSIT.value: 'onBehalfOf',
+    Events.WITHDRAW.value: 'user',
+    Events.BORROW.value: 'onBehalfOf',
+    Events.REPAY.value: 'user',
+    Events.LIQUIDATION_CALL.value: 'user',
+    Events.RESERVE_USED_AS_COLLATERAL_ENABLED.value: 'user',
+    Events.RESERVE_USED_AS_COLLATERAL_DISABLED.value: 'user',
+}
+
+
 class LendingPoolContractInterface(ContractInterfaceBase):
-    def __init__(self, address: str, provider: Provider, protocol_name: str):
-        cur_dir = os.path.dirname(__file__)
-        abi_file_path = os.path.join(cur_dir, f'contracts/abi/lending_protocols/{protocol_name}_LENDING_POOL.json')
-        with open(abi_file_path) as abi_json:
-            abi = json.load(abi_json)
+    def __init__(
+            self,
+            address: str,
+            provider: Provider,
+            protocol_name: str,
+            borrower_index: Optional[BorrowerIndex] = None,
+            blocks_back: int = DEFAULT_BORROWER_BLOCKS_BACK,
+            seconds_back: Optional[int] = None,
+            discover_in_background: bool = True
+    ):
+        """
+        :param address: Lending pool address
+        :param provider: Provider
+        :param protocol_name: Name of the protocol
+        :param borrower_index: Optional persisted borrower index. If set, borrower discovery resumes from its cursor
+        :param blocks_back: Number of blocks to scan for borrower events when no cursor is known
+        :param seconds_back: Optional number of seconds to scan for borrower events when no cursor is known. If set,
+            it is resolved to a block and replaces blocks_back, so the history covered does not depend on block times
+        :param discover_in_background: Run the initial borrower discovery in a background thread, so the interface
+            is usable at once with the persisted borrowers. Wait on ready for the discovery to finish
+        """
+        abi = load_abi(f'lending_protocols/{protocol_name}_LENDING_POOL.json')
 
         self.protocol_name = protocol_name
+        self.borrower_index = borrower_index
+        self.blocks_back = blocks_back
+        self.seconds_back = seconds_back
 
         logger_section_name = f"{__name__}.{protocol_name}"
         self.logger = Logger(section_name=logger_section_name)
@@ -28,11 +68,60 @@ class LendingPoolContractInterface(ContractInterfaceBase):
         super().__init__(address, abi, provider)
 
         if protocol_name in [LendingProtocol.AAVE_ARBITRUM.name, LendingProtocol.RADIANT_ARBITRUM.name]:
-            self.events = self.get_event_logs("Borrow", blocks_back=499999)
-            self.recent_borrowers = self.__extract_account_addresses(self.events, "Borrow")
+            self.borrower_event_name = "Borrow"
         elif protocol_name == LendingProtocol.SILO_ARBITRUM.name:
-            self.events = self.get_event_logs("NewSilo", blocks_back=499999)
-            self.recent_borrowers = self.__extract_account_addresses(self.events, "NewSilo")
+            self.borrower_event_name = "NewSilo"
+        else:
+            raise Exception("Unknown protocol name")
+
+        self.events = []
+        self.recent_borrowers = []
+        self.last_scanned_block = None
+        # Resolves to the borrowers found by the initial discovery, once it has finished
+        self.ready: Future = Future()
+        # Guards recent_borrowers against concurrent discovery and removal
+        self.borrowers_lock = threading.Lock()
+        self.__refresh_lock = threading.Lock()
+        if self.borrower_index is not None:
+            self.last_scanned_block = self.borrower_index.get_last_scanned_block()
+            self.recent_borrowers = [
+                {'account_address': account_address} for account_address in self.borrower_index.get_borrowers()
+            ]
+            self.logger.info(
+                f"Loaded {len(self.recent_borrowers)} borrowers indexed up to block {self.last_scanned_block}"
+            )
+
+        if discover_in_background:
+            threading.Thread(
+                target=self.__discover_borrowers,
+                name=f"borrower-discovery-{protocol_name}",
+                daemon=True
+            ).start()
+        else:
+            self.__discover_borrowers()
+
+    def __discover_borrowers(self):
+        try:
+            self.ready.set_result(self.refresh_contract_data())
+        except Exception as e:
+            self.logger.error(f"Borrower discovery failed: {e}")
+            self.ready.set_exception(e)
+
+    def is_ready(self) -> bool:
+        """
+        Check if the initial borrower discovery has finished
+        :return: True or False
+        """
+        return self.ready.done()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        Block until the initial borrower discovery has finished
+
+        :param timeout: Maximum number of seconds to wait
+        :return: Borrowers found by the initial discovery. Raises if the discovery failed or timed out
+        """
+        return self.ready.result(timeout=timeout)
 
     def __extract_account_addresses(self, event_logs: List[Dict], event_name: str):
         account_addresses = []
@@ -45,17 +134,17 @@ class LendingPoolContractInterface(ContractInterfaceBase):
             self.logger.info(f"Found {len(event_logs)} {event_name} event logs")
             self.logger.info(f"Extracting account addresses from {event_name} event logs")
             for event_log in event_logs:
-                account_addresses.append(event_log[event_name]["user"])
+                account_addresses.append({'account_address': event_log[event_name]["user"]})
         return account_addresses
 
     @retry(stop_max_attempt_number=3, wait_fixed=2000, retry_on_exception=lambda e: isinstance(e, Exception))
-    def get_user_account_data(self, user_address: str):
+    def get_user_account_data(self, user_address: str, block_identifier="latest"):
         self.logger.info(f"Getting user account data for {user_address} from {self.protocol_name} contract")
 
         if self.protocol_name in [LendingProtocol.AAVE_ARBITRUM.name, LendingProtocol.RADIANT_ARBITRUM.name]:
             contract_function_handle = self.contract_handle.functions.getUserAccountData(user_address)
             try:
-                account_data = contract_function_handle.call()
+                account_data = contract_function_handle.call(block_identifier=block_identifier)
                 self.logger.info(f"User account data for {user_address}: {account_data}")
             except Exception as e:
                 self.logger.error(f"Failed to get user account data for {user_address}: {e}")
@@ -63,7 +152,7 @@ class LendingPoolContractInterface(ContractInterfaceBase):
         elif self.protocol_name == LendingProtocol.SILO_ARBITRUM.name:
             contract_function_handle = self.contract_handle.functions.silos(user_address)
             try:
-                account_data = contract_function_handle.call()
+                account_data = contract_function_handle.call(block_identifier=block_identifier)
                 self.logger.info(f"User account data for {user_address}: {account_data}")
             except Exception as e:
                 self.logger.error(f"Failed to get user account data for {user_address}: {e}")
@@ -71,12 +160,143 @@ class LendingPoolContractInterface(ContractInterfaceBase):
 
         return account_data
 
-    def refresh_contract_data(self):
-        self.logger.info("Refreshing contract data")
-        if self.protocol_name == LendingProtocol.AAVE_ARBITRUM.name or LendingProtocol.RADIANT_ARBITRUM.name:
-            self.events = self.get_event_logs("Borrow", blocks_back=100000)
-            self.recent_borrowers = self.__extract_account_addresses(self.events, "Borrow")
+    def get_user_account_data_batch(
+            self,
+            user_addresses: List[str],
+            multicall_interface: MulticallContractInterface,
+            block_identifier=None,
+            batch_size: int = DEFAULT_MULTICALL_BATCH_SIZE
+    ) -> List[Optional[List]]:
+        """
+        Get user account data for many users through Multicall3, every batch pinned to the same block
+
+        :param user_addresses: Addresses of the users to get account data for
+        :param multicall_interface: Multicall3 contract interface
+        :param block_identifier: Block to pin the calls to, defaults to the current block
+        :param batch_size: Number of getUserAccountData calls per aggregate3 eth_call
+        :return: Account data in the same order as user_addresses, None for failed calls
+        """
+        if block_identifier is None:
+            block_identifier = self.provider.w3.eth.get_block_number()
+
+        self.logger.info(
+            f"Getting user account data for {len(user_addresses)} users from {self.protocol_name} contract "
+            f"at block {block_identifier}"
+        )
+
+        if self.protocol_name in [LendingProtocol.AAVE_ARBITRUM.name, LendingProtocol.RADIANT_ARBITRUM.name]:
+            function_signature = "getUserAccountData(address)"
         elif self.protocol_name == LendingProtocol.SILO_ARBITRUM.name:
-            self.events = self.get_event_logs("NewSilo", blocks_back=100000)
-            self.recent_borrowers = self.__extract_account_addresses(self.events, "NewSilo")
+            function_signature = "silos(address)"
+        else:
+            raise Exception("Unknown protocol name")
+
+        return multicall_interface.batch_call_function(
+            self,
+            function_signature,
+            [(user_address,) for user_address in user_addresses],
+            block_identifier=block_identifier,
+            batch_size=batch_size
+        )
+
+    def refresh_contract_data(self, blocking: bool = True) -> List[str]:
+        """
+        Scan borrower events from the last scanned block to the chain head and add new borrowers
+
+        :param blocking: Wait for a refresh already running in another thread, instead of skipping this one
+        :return: Addresses of the new borrowers
+        """
+        if not self.__refresh_lock.acquire(blocking=blocking):
+            self.logger.info("Borrower discovery already running, skipping refresh")
+            return []
+
+        try:
+            self.logger.info("Refreshing contract data")
+            to_block = self.provider.w3.eth.get_block_number()
+            if self.last_scanned_block is None:
+                from_block = self.get_first_block_to_scan(to_block)
+            else:
+                from_block = self.last_scanned_block + 1
+
+            if from_block > to_block:
+                self.logger.info(f"No new blocks since block {self.last_scanned_block}")
+                return []
+
+            self.events = self.get_event_logs(self.borrower_event_name, from_block=from_block, to_block=to_block)
+            new_borrowers = self.__extract_account_addresses(self.events, self.borrower_event_name)
+
+            new_account_addresses = []
+            with self.borrowers_lock:
+                known_account_addresses = {borrower['account_address'] for borrower in self.recent_borrowers}
+                for borrower in new_borrowers:
+                    if borrower['account_address'] not in known_account_addresses:
+                        known_account_addresses.add(borrower['account_address'])
+                        new_account_addresses.append(borrower['account_address'])
+                        self.recent_borrowers.append(borrower)
+
+            if self.borrower_index is not None:
+                self.borrower_index.add_borrowers(new_account_addresses, last_scanned_block=to_block)
+            self.last_scanned_block = to_block
+
+            self.logger.info(
+                f"Found {len(new_account_addresses)} new borrowers between blocks {from_block} and {to_block}, "
+                f"{len(self.recent_borrowers)} borrowers indexed"
+            )
+
+            return new_account_addresses
+        finally:
+            self.__refresh_lock.release()
+
+    def get_first_block_to_scan(self, to_block: int) -> int:
+        """
+        Get the first block of the initial borrower scan, seconds_back before now if set, else blocks_back blocks
+        before to_block
+
+        :param to_block: Last block of the scan
+        :return: Block number
+        """
+        if self.seconds_back is None:
+            return max(to_block - self.blocks_back, 0)
+
+        # The last block mined before the start of the range, the scan starts right after it
+        block = self.get_block_number_from_timestamp(int(time.time()) - self.seconds_back - 1)
+        return block['block_number'] + 1 if block is not None else 0
+
+    def get_position_changes(self, from_block: int, to_block: int) -> List[Tuple[str, str]]:
+        """
+        Get the accounts whose position changed in a block range, from every position changing pool event read with
+        a single multi-topic filter
+
+        :param from_block: First block of the range
+        :param to_block: Last block of the range
+        :return: List of (event name, account address) in block order
+        """
+        if self.protocol_name == LendingProtocol.SILO_ARBITRUM.name:
+            return []
+
+        events = self.get_multi_event_logs(list(POSITION_EVENT_ACCOUNT_ARGS.keys()), from_block, to_block)
+
+        return [
+            (event_name, event_args[POSITION_EVENT_ACCOUNT_ARGS[event_name]])
+            for event in events
+            for event_name, event_args in event.items()
+        ]
+
+    def remove_borrowers(self, account_addresses: List[str]):
+        """
+        Stop tracking borrowers, in memory and in the borrower index. A borrower that borrows again is found again by
+        refresh_contract_data
+
+        :param account_addresses:
+        """
+        removed_account_addresses = set(account_addresses)
+        with self.borrowers_lock:
+            self.recent_borrowers[:] = [
+                borrower for borrower in self.recent_borrowers
+                if borrower['account_address'] not in removed_account_addresses
+            ]
+
+        if self.borrower_index is not None:
+            self.borrower_index.remove_borrowers(list(removed_account_addresses))
 
+        self.logger.info(f"Removed {len(removed_account_addresses)} borrowers, {len(self.recent_borrowers)} indexed")
@@ -0,0 +1,131 @@
+from typing import Any, List, Optional, Tuple
+from dotenv import dotenv_values, find_dotenv
+from eth_utils.abi import collapse_if_tuple
+from web3 import Web3
+
+from app_logger.logger import Logger
+from .contract_interface_base import ContractInterfaceBase
+from .abi_registry import load_abi
+from .provider.provider import Provider
+
+config = dotenv_values(dotenv_path=find_dotenv())
+
+# Multicall3 is deployed at the same address on every supported chain
+MULTICALL3_CONTRACT_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+DEFAULT_MULTICALL_BATCH_SIZE = 500
+
+
+class MulticallContractInterface(ContractInterfaceBase):
+    """
+    Multicall3 contract interface. Used to pack many view calls into a single eth_call
+    """
+    def __init__(self, provider: Provider, address: str = None):
+        """
+        Initialize multicall contract interface
+
+        :param provider: Provider to send the eth_call through
+        :param address: Multicall3 address, defaults to the canonical deployment
+        """
+        if address is None:
+            address = config.get("MULTICALL3_CONTRACT_ADDRESS", MULTICALL3_CONTRACT_ADDRESS)
+
+        abi = load_abi('multicall3_abi.json')
+
+        self.logger = Logger(section_name=__name__)
+
+        super().__init__(Web3.to_checksum_address(address), abi, provider)
+
+    def aggregate3(
+            self,
+            calls: List[Tuple[str, str]],
+            block_identifier: Any = "latest",
+            allow_failure: bool = True
+    ) -> List[Tuple[bool, bytes]]:
+        """
+        Execute calls through Multicall3.aggregate3 in a single eth_call
+
+        :param calls: List of (target address, encoded call data)
+        :param block_identifier: Block to pin every call to
+        :param allow_failure: If True, a reverting sub-call does not revert the whole batch
+        :return: List of (success, return data) in the same order as calls
+        """
+        call_structs = [(target, allow_failure, call_data) for target, call_data in calls]
+        contract_function_handle = self.contract_handle.functions.aggregate3(call_structs)
+
+        return contract_function_handle.call(block_identifier=block_identifier)
+
+    def batch_call_function(
+            self,
+            contract_interface: ContractInterfaceBase,
+            function_signature: str,
+            args_list: List[tuple],
+            block_identifier: Any = "latest",
+            batch_size: int = DEFAULT_MULTICALL_BATCH_SIZE
+    ) -> List[Optional[Any]]:
+        """
+        Call one view function of a contract with many arguments, in batches of aggregate3 calls. The call data is
+        encoded from the interface's precomputed function selector, so no contract function is built per call.
+        Failed sub-calls are isolated and returned as None.
+
+        :param contract_interface: Interface of the contract to call
+        :param function_signature: Function signature (ex. getUserAccountData(address))
+        :param args_list: Arguments of every call
+        :param block_identifier: Block to pin every batch to
+        :param batch_size: Number of calls per aggregate3 eth_call
+        :return: Decoded results in the same order as args_list
+        """
+        if function_signature not in contract_interface.function_abis:
+            raise Exception(f"Unknown function {function_signature}")
+
+        function_abi = contract_interface.function_abis[function_signature]
+        output_types = [collapse_if_tuple(output) for output in function_abi['outputs']]
+
+        results = []
+        for start in range(0, len(args_list), batch_size):
+            calls = [
+                (contract_interface.address, contract_interface.encode_function_call(function_signature, args))
+                for args in args_list[start:start + batch_size]
+            ]
+
+            try:
+                batch_results = self.aggregate3(calls, block_identifier=block_identifier)
+            except Exception as e:
+                self.logger.error(f"Multicall batch of {len(calls)} {function_abi['name']} calls failed: {e}")
+                results.extend([None] * len(calls))
+                continue
+
+            for success, return_data in batch_results:
+                results.append(self.decode_return_data(function_abi['name'], output_types, success, return_data))
+
+        return results
+
+    def decode_return_data(
+            self,
+            function_name: str,
+            output_types: List[str],
+            success: bool,
+            return_data: bytes
+    ) -> Optional[Any]:
+        """
+        Decode the return data of a single aggregate3 sub-call
+
+        :param function_name: Name of the called function, used for logging
+        :param output_types: ABI types of the function outputs
+        :param success: Sub-call success flag
+        :param return_data: Raw return data
+        :return: Decoded return values, or None if the sub-call failed
+        """
+        if not success or not return_data:
+            self.logger.error(f"Multicall sub-call {function_name} failed")
+            return None
+
+        try:
+            decoded = self.provider.w3.codec.decode(output_types, return_data)
+        except Exception as e:
+            self.logger.error(f"Failed to decode {function_name} result: {e}")
+            return None
+
+        if len(decoded) == 1:
+            return decoded[0]
+        return list(decoded)
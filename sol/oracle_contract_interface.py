@@ -1,9 +1,14 @@
-import os
-import json
+from typing import Callable, Dict, List, Optional
+from web3 import Web3
+
 from app_logger.logger import Logger
 from .contract_interface_base import ContractInterfaceBase
+from .abi_registry import load_abi, get_contract_handle
 from .provider.provider import Provider
 
+# Chainlink USD feeds answer with 8 decimals, like the Aave oracle
+PRICE_FEED_DECIMALS = 8
+
 
 class OracleContractInterface(ContractInterfaceBase):
     """
@@ -16,17 +21,25 @@ class OracleContractInterface(ContractInterfaceBase):
         :param provider:
         :param protocol_name:
         """
-        cur_dir = os.path.dirname(__file__)
-        abi_file_path = os.path.join(
-            cur_dir, f'contracts/abi/lending_protocols/{protocol_name}_ORACLE.json'
-        )
-        with open(abi_file_path) as abi_json:
-            abi = json.load(abi_json)
+        abi = load_abi(f'lending_protocols/{protocol_name}_ORACLE.json')
 
         self.logger = Logger(section_name=__name__)
 
         super().__init__(address, abi, provider)
 
+        # Asset prices in USD, valid for price_cache_block only
+        self.price_cache: Dict[str, float] = {}
+        self.price_cache_block: Optional[int] = None
+
+        # Last price seen for each asset, across blocks
+        self.last_prices: Dict[str, float] = {}
+        # Called with ({asset: new price in USD}, block number) whenever prices move
+        self.price_listeners: List[Callable[[Dict[str, float], int], None]] = []
+        # Chainlink aggregator address of each asset, resolved lazily
+        self.price_feed_aggregators: Dict[str, Optional[str]] = {}
+
+        self.price_feed_abi = load_abi('chainlink_aggregator_abi.json')
+
     def get_asset_price(self, asset_address: str):
         """
         Get asset price in GWEI given asset address
@@ -63,3 +76,139 @@ class OracleContractInterface(ContractInterfaceBase):
             asset_price_usd = 0
 
         return asset_price_usd
+
+    def get_assets_prices_usd(self, asset_addresses: List[str], block_identifier="latest") -> Dict[str, float]:
+        """
+        Get asset prices in USD for many assets with a single getAssetsPrices call
+        :param asset_addresses:
+        :param block_identifier: Block to read the prices at
+        :return: Asset prices in USD keyed by asset address
+        """
+        contract_function_handle = self.contract_handle.functions.getAssetsPrices(asset_addresses)
+
+        self.logger.info(f"Calling contract function: {contract_function_handle}")
+        try:
+            asset_prices = contract_function_handle.call(block_identifier=block_identifier)
+        except Exception as e:
+            self.logger.error(f"Failed to get asset prices for {asset_addresses}: {e}")
+            return {}
+
+        return {
+            asset_address: asset_price / 10 ** 8 for asset_address, asset_price in zip(asset_addresses, asset_prices)
+        }
+
+    def refresh_price_cache(self, asset_addresses: List[str], block_number: int = None):
+        """
+        Prefill the price cache for a block. Prices already cached for the same block are not fetched again.
+        :param asset_addresses: Assets to price
+        :param block_number: Block to price the assets at, defaults to the current block
+        """
+        if not asset_addresses:
+            return
+
+        if block_number is None:
+            block_number = self.provider.w3.eth.get_block_number()
+
+        if block_number != self.price_cache_block:
+            self.price_cache = {}
+            self.price_cache_block = block_number
+
+        missing_asset_addresses = [
+            asset_address for asset_address in set(asset_addresses) if asset_address not in self.price_cache
+        ]
+        if missing_asset_addresses:
+            asset_prices_usd = self.get_assets_prices_usd(missing_asset_addresses, block_identifier=block_number)
+            self.price_cache.update(asset_prices_usd)
+            self.logger.info(f"Cached {len(missing_asset_addresses)} asset prices for block {block_number}")
+            self.notify_price_listeners(asset_prices_usd, block_number)
+
+    def add_price_listener(self, listener: Callable[[Dict[str, float], int], None]):
+        """
+        Register a callback for price moves
+        :param listener: Called with ({asset: new price in USD}, block number) whenever prices move
+        """
+        self.price_listeners.append(listener)
+
+    def notify_price_listeners(self, asset_prices_usd: Dict[str, float], block_number: int):
+        """
+        Pass the prices that changed since they were last seen to every price listener
+        :param asset_prices_usd: Newly read prices
+        :param block_number: Block the prices were read at
+        """
+        moved_prices = {
+            asset_address: price for asset_address, price in asset_prices_usd.items()
+            if self.last_prices.get(asset_address) != price
+        }
+        self.last_prices.update(asset_prices_usd)
+        if not moved_prices:
+            return
+
+        for listener in self.price_listeners:
+            listener(moved_prices, block_number)
+
+    def get_price_feed_aggregator(self, asset_address: str) -> Optional[str]:
+        """
+        Resolve the Chainlink aggregator behind the oracle source of an asset
+        :param asset_address:
+        :return: Aggregator address, or None if the source is not a Chainlink proxy
+        """
+        if asset_address not in self.price_feed_aggregators:
+            try:
+                source_address = self.contract_handle.functions.getSourceOfAsset(asset_address).call()
+                proxy_handle = get_contract_handle(self.provider.w3, source_address, self.price_feed_abi)
+                self.price_feed_aggregators[asset_address] = proxy_handle.functions.aggregator().call()
+            except Exception as e:
+                self.logger.error(f"No Chainlink aggregator found for {asset_address}: {e}")
+                self.price_feed_aggregators[asset_address] = None
+
+        return self.price_feed_aggregators[asset_address]
+
+    def get_price_feed_updates(self, asset_addresses: List[str], from_block: int, to_block: int) -> Dict[str, float]:
+        """
+        Read Chainlink AnswerUpdated events of the given assets with a single eth_getLogs call, and pass the new
+        prices to the price listeners
+        :param asset_addresses:
+        :param from_block:
+        :param to_block:
+        :return: Latest answer in USD of every asset whose feed was updated in the range
+        """
+        aggregator_assets = {}
+        for asset_address in asset_addresses:
+            aggregator_address = self.get_price_feed_aggregator(asset_address)
+            if aggregator_address is not None:
+                aggregator_assets.setdefault(aggregator_address, []).append(asset_address)
+
+        if not aggregator_assets:
+            return {}
+
+        event_topic = Web3.keccak(text="AnswerUpdated(int256,uint256,uint256)")
+        logs = self.provider.w3.eth.get_logs({
+            'address': list(aggregator_assets.keys()),
+            'topics': [event_topic],
+            'fromBlock': from_block,
+            'toBlock': to_block
+        })
+
+        # Logs are in block order, the last answer of each feed wins
+        asset_prices_usd = {}
+        for log in logs:
+            answer = int.from_bytes(log['topics'][1], byteorder='big', signed=True)
+            for asset_address in aggregator_assets.get(log['address'], []):
+                asset_prices_usd[asset_address] = answer / 10 ** PRICE_FEED_DECIMALS
+
+        if asset_prices_usd:
+            self.logger.info(f"AnswerUpdated for {len(asset_prices_usd)} assets in blocks {from_block}-{to_block}")
+            self.notify_price_listeners(asset_prices_usd, to_block)
+
+        return asset_prices_usd
+
+    def get_cached_asset_price_usd(self, asset_address: str) -> float:
+        """
+        Get asset price in USD from the price cache. Assets missing from the cache are fetched at the cached block.
+        :param asset_address:
+        :return: Asset price in USD
+        """
+        if asset_address not in self.price_cache:
+            self.refresh_price_cache([asset_address], block_number=self.price_cache_block)
+
+        return self.price_cache.get(asset_address, 0)
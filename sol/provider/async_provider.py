@@ -0,0 +1,65 @@
+# Async provider for Web socket/JSON rpc
+import asyncio
+from web3 import AsyncWeb3
+from web3.providers import WebsocketProviderV2
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 32
+
+
+class AsyncProvider:
+    def __init__(
+            self,
+            wallet_address: str,
+            wallet_private_key: str,
+            https_url: str = None,
+            ws_url: str = None,
+            max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS
+    ):
+        """
+        :param wallet_address: type: str - Address of the wallet
+        :param wallet_private_key: type: str - Private key of the wallet
+        :param https_url: type: str - RPC url for https
+        :param ws_url: type: str - RPC url for web socket
+        :param max_concurrent_requests: type: int - Maximum number of requests in flight on the shared connection
+
+        Description:
+            AsyncProvider is the asyncio counterpart of Provider. Every async contract interface created with the
+            same AsyncProvider shares its connection and its concurrency semaphore.
+        """
+        self.__wallet_address = wallet_address
+        self.__wallet_private_key = wallet_private_key
+
+        self.https_url = https_url
+        self.ws_url = ws_url
+
+        if https_url:
+            self.w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(self.https_url))
+        elif ws_url:
+            self.w3 = AsyncWeb3.persistent_websocket(WebsocketProviderV2(self.ws_url))
+        else:
+            raise Exception("Please provide a valid RPC url.")
+
+        self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+    async def connect(self):
+        if self.ws_url and not self.https_url:
+            await self.w3.provider.connect()
+
+    async def disconnect(self):
+        if self.ws_url and not self.https_url:
+            await self.w3.provider.disconnect()
+
+    async def get_chain_id(self):
+        return await self.w3.eth.chain_id
+
+    async def get_nonce(self):
+        return await self.w3.eth.get_transaction_count(self.__wallet_address)
+
+    async def get_is_connected(self):
+        return await self.w3.is_connected()
+
+    def get_wallet_address(self):
+        return self.__wallet_address
+
+    def get_wallet_private_key(self):
+        return self.__wallet_private_key
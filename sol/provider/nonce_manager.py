@@ -0,0 +1,113 @@
+import heapq
+import threading
+from typing import Dict, List, Optional
+
+from hexbytes import HexBytes
+from web3 import Web3
+
+# Error fragments nodes return when a transaction nonce does not match the account's nonce
+NONCE_ERRORS = [
+    "nonce too low",
+    "nonce too high",
+    "invalid nonce",
+    "nonce has already been used",
+    "replacement transaction underpriced",
+]
+
+
+def is_nonce_error(err: Exception) -> bool:
+    """
+    Check if a send error means the local nonce is out of sync with the chain
+    :param err: Error raised by send_raw_transaction or send_transaction
+    :return: True or False
+    """
+    message = str(err).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+
+class NonceManager:
+    """
+    Local nonce allocator for one wallet. Nonces are handed out without an RPC round trip once the first one is read
+    from the chain. Nonces of transactions that were never broadcast are reused first so no gap is left, and a resync
+    with the chain's pending nonce recovers from dropped transactions.
+    """
+    def __init__(self, w3: Web3, wallet_address: str):
+        """
+        Initialize the NonceManager class
+
+        :param w3: Web3 instance used to read the chain's pending nonce
+        :param wallet_address: Address of the wallet the nonces belong to
+        """
+        self.w3 = w3
+        self.wallet_address = wallet_address
+
+        self.next_nonce: Optional[int] = None
+        # Nonces handed out and released before being broadcast, reused lowest first
+        self.released_nonces: List[int] = []
+        # Hash of every transaction sent and not yet mined -> its nonce
+        self.in_flight_txns: Dict[str, int] = {}
+
+        self.__lock = threading.Lock()
+
+    def allocate(self) -> int:
+        """
+        Get the next nonce to send a transaction with
+        :return: Nonce
+        """
+        with self.__lock:
+            if self.next_nonce is None:
+                self.__sync()
+
+            if self.released_nonces:
+                nonce = heapq.heappop(self.released_nonces)
+            else:
+                nonce = self.next_nonce
+                self.next_nonce += 1
+
+            return nonce
+
+    def mark_sent(self, nonce: int, txn_hash):
+        """
+        Record the transaction a nonce was broadcast with
+
+        :param nonce:
+        :param txn_hash:
+        """
+        with self.__lock:
+            self.in_flight_txns[Web3.to_hex(HexBytes(txn_hash))] = nonce
+
+    def confirm(self, txn_hash):
+        """
+        Mark a transaction as mined
+
+        :param txn_hash:
+        """
+        with self.__lock:
+            self.in_flight_txns.pop(Web3.to_hex(HexBytes(txn_hash)), None)
+
+    def release(self, nonce: int):
+        """
+        Give back a nonce whose transaction was never broadcast
+
+        :param nonce:
+        """
+        with self.__lock:
+            if self.next_nonce is not None and nonce == self.next_nonce - 1:
+                self.next_nonce = nonce
+            elif self.next_nonce is not None and nonce < self.next_nonce:
+                heapq.heappush(self.released_nonces, nonce)
+
+    def resync(self):
+        """
+        Reset the allocator to the chain's pending nonce, after a nonce error or a dropped transaction
+        """
+        with self.__lock:
+            self.__sync()
+
+    def __sync(self):
+        self.next_nonce = self.w3.eth.get_transaction_count(self.wallet_address, 'pending')
+        self.released_nonces = []
+        # Transactions above the pending nonce were dropped by the node
+        self.in_flight_txns = {
+            txn_hash: nonce for txn_hash, nonce in self.in_flight_txns.items() if nonce < self.next_nonce
+        }
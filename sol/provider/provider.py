@@ -1,6 +1,8 @@
 # Provider for Web socket/JSON rpc
 from web3 import Web3
 
+from .nonce_manager import NonceManager
+
 
 class Provider:
     def __init__(self, wallet_address: str, wallet_private_key: str, https_url: str = None, ws_url: str = None):
@@ -26,6 +28,9 @@ class Provider:
         else:
             raise Exception("Please provide a valid RPC url.")
 
+        # Shared by every interface sending from this wallet
+        self.nonce_manager = NonceManager(self.w3, self.__wallet_address)
+
     def get_chain_id(self):
         return self.w3.eth.chain_id
 
@@ -0,0 +1,136 @@
+import time
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from app_logger.logger import Logger
+from .provider.provider import Provider
+
+# Seconds between receipt polls
+DEFAULT_RECEIPT_POLL_INTERVAL = 0.25
+# Seconds after which a transaction without a receipt is considered dropped
+DEFAULT_RECEIPT_TIMEOUT = 120
+
+
+class ReceiptTracker:
+    """
+    Receipt tracker. Settles sent transactions in a background thread, so callers can keep several transactions in
+    flight and react to each receipt when it arrives. Receipts are only polled when a new block is seen. Transactions
+    without a receipt after the timeout are failed and the provider's nonce manager is resynced to fill the gap.
+    """
+    def __init__(
+            self,
+            provider: Provider,
+            poll_interval: float = DEFAULT_RECEIPT_POLL_INTERVAL,
+            timeout: float = DEFAULT_RECEIPT_TIMEOUT
+    ):
+        """
+        Initialize the ReceiptTracker class
+
+        :param provider: Provider the transactions were sent with
+        :param poll_interval: Seconds between polls
+        :param timeout: Seconds after which a transaction without a receipt is considered dropped
+        """
+        self.provider = provider
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+        # Transaction hash -> (time it was tracked at, future resolving to its receipt)
+        self.pending: Dict[str, Tuple[float, Future]] = {}
+        self.last_polled_block: Optional[int] = None
+        self.last_polled_at = 0.0
+
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+
+        logger_section_name = f"{__class__}"
+        self.logger = Logger(section_name=logger_section_name)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def track(self, txn_hash) -> Future:
+        """
+        Start tracking a sent transaction
+
+        :param txn_hash: Hash returned by send_txn with wait_for_receipt=False
+        :return: Future resolving to the receipt, or failing if the transaction is dropped
+        """
+        self.start()
+
+        future = Future()
+        with self.__lock:
+            self.pending[Web3.to_hex(HexBytes(txn_hash))] = (time.time(), future)
+
+        return future
+
+    def start(self):
+        """
+        Start settling receipts in a background thread
+        """
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, name="receipt-tracker", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stop settling receipts. Pending futures are left unresolved
+        """
+        self.__stop_event.set()
+
+    def __run(self):
+        while not self.__stop_event.is_set():
+            try:
+                if self.pending:
+                    self.__poll()
+            except Exception as e:
+                self.logger.error(f"Failed to poll receipts: {e}")
+
+            self.__stop_event.wait(self.poll_interval)
+
+    def __poll(self):
+        polled_at = time.time()
+        block_number = self.provider.w3.eth.get_block_number()
+        new_block = block_number != self.last_polled_block
+        last_polled_at = self.last_polled_at
+        self.last_polled_block = block_number
+        self.last_polled_at = polled_at
+
+        with self.__lock:
+            pending = list(self.pending.items())
+
+        dropped = False
+        for txn_hash, (tracked_at, future) in pending:
+            receipt = None
+            # Transactions tracked since the last poll may already be in the current block
+            if new_block or tracked_at >= last_polled_at:
+                try:
+                    receipt = self.provider.w3.eth.get_transaction_receipt(txn_hash)
+                except TransactionNotFound:
+                    pass
+
+            if receipt is not None:
+                self.provider.nonce_manager.confirm(txn_hash)
+                self.logger.info(f"Transaction {txn_hash} mined in block {receipt['blockNumber']}")
+                self.__settle(txn_hash)
+                future.set_result(receipt)
+            elif time.time() - tracked_at > self.timeout:
+                self.logger.error(f"Transaction {txn_hash} not mined after {self.timeout}s, considered dropped")
+                dropped = True
+                self.__settle(txn_hash)
+                future.set_exception(Exception(f"Transaction {txn_hash} dropped"))
+
+        if dropped:
+            self.provider.nonce_manager.resync()
+
+    def __settle(self, txn_hash: str):
+        with self.__lock:
+            self.pending.pop(txn_hash, None)
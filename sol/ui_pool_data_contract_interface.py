@@ -1,5 +1,4 @@
-import os
-import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, List
 from web3 import Web3
 from web3.logs import DISCARD
@@ -10,18 +9,19 @@ from db.schemas.position_schema import BorrowEvent
 
 from app_logger.logger import Logger
 from .contract_interface_base import ContractInterfaceBase
+from .abi_registry import load_abi
+from .multicall_contract_interface import MulticallContractInterface
 
 config = dotenv_values(dotenv_path=find_dotenv())
 
+# getUserReservesData returns every reserve of the pool, so keep batches smaller than for account data
+DEFAULT_RESERVES_BATCH_SIZE = 50
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+
 
 class UIPoolDataContractInterface(ContractInterfaceBase):
     def __init__(self, address: str, provider, protocol_name: str):
-        cur_dir = os.path.dirname(__file__)
-        abi_file_path = os.path.join(
-            cur_dir, f'contracts/abi/lending_protocols/{protocol_name}_UI_POOL_DATA_PROVIDER.json'
-        )
-        with open(abi_file_path) as abi_json:
-            abi = json.load(abi_json)
+        abi = load_abi(f'lending_protocols/{protocol_name}_UI_POOL_DATA_PROVIDER.json')
 
         self.protocol_name = protocol_name
 
@@ -39,12 +39,81 @@ class UIPoolDataContractInterface(ContractInterfaceBase):
 
         super().__init__(address, abi, provider)
 
-    def get_user_reserves_data(self, user_address: str):
+    def get_user_reserves_data(self, user_address: str, block_identifier="latest"):
         contract_function_handle = self.contract_handle.functions.getUserReservesData(
             self.address_provider_address,
             user_address
         )
 
         self.logger.info(f"Calling contract function: {contract_function_handle}")
-        return contract_function_handle.call()
+        return contract_function_handle.call(block_identifier=block_identifier)
+
+    def get_reserves_data(self, block_identifier="latest") -> List[Dict]:
+        """
+        Get the configuration and state of every reserve in the pool
+
+        :param block_identifier: Block to read the reserves at
+        :return: List of reserve dicts keyed by the AggregatedReserveData field names
+        """
+        contract_function_handle = self.contract_handle.functions.getReservesData(self.address_provider_address)
+
+        self.logger.info(f"Calling contract function: {contract_function_handle}")
+        reserves, base_currency_info = contract_function_handle.call(block_identifier=block_identifier)
+
+        reserve_field_names = [
+            component['name'] for component in contract_function_handle.abi['outputs'][0]['components']
+        ]
+        return [dict(zip(reserve_field_names, reserve)) for reserve in reserves]
+
+    def get_user_reserves_data_batch(
+            self,
+            user_addresses: List[str],
+            multicall_interface: MulticallContractInterface,
+            block_identifier=None,
+            batch_size: int = DEFAULT_RESERVES_BATCH_SIZE,
+            max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS
+    ) -> List[Optional[List]]:
+        """
+        Get user reserves data for many users. Calls are packed into Multicall3 batches and at most
+        max_concurrent_requests batches are in flight at once.
+
+        :param user_addresses: Addresses of the users to get reserves data for
+        :param multicall_interface: Multicall3 contract interface
+        :param block_identifier: Block to pin the calls to, defaults to the current block
+        :param batch_size: Number of getUserReservesData calls per aggregate3 eth_call
+        :param max_concurrent_requests: Maximum number of multicall requests in flight
+        :return: Reserves data in the same order as user_addresses, None for failed calls
+        """
+        if block_identifier is None:
+            block_identifier = self.provider.w3.eth.get_block_number()
+
+        self.logger.info(
+            f"Getting user reserves data for {len(user_addresses)} users from {self.protocol_name} contract "
+            f"at block {block_identifier}"
+        )
+
+        batches = [
+            [
+                (self.address_provider_address, user_address)
+                for user_address in user_addresses[start:start + batch_size]
+            ]
+            for start in range(0, len(user_addresses), batch_size)
+        ]
+
+        with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
+            batch_results = executor.map(
+                lambda batch: multicall_interface.batch_call_function(
+                    self,
+                    "getUserReservesData(address,address)",
+                    batch,
+                    block_identifier=block_identifier,
+                    batch_size=batch_size
+                ),
+                batches
+            )
+
+            results = []
+            for batch_result in batch_results:
+                results.extend(batch_result)
 
+        return results